@@ -79,13 +79,16 @@ class CClean(object):
                               table_name,
                               rm_field_name,
                               cp_field_name,
-                              csv_path):
+                              csv_path,
+                              encoding='utf-8'):
 
         self.model.remove_special_tokens(sqlite_db,
                                          table_name,
                                          rm_field_name,
                                          cp_field_name,
-                                         csv_path)
+                                         csv_path,
+                                         10000,
+                                         encoding)
 
     # <remove_street_duplicates> method - calls the <remove_street_duplicates> method 
     # of <m_load> model and presents appropriate message using the 
@@ -109,12 +112,57 @@ class CClean(object):
                         sqlite_db,
                         table_name,
                         field_name,
-                        accept_substring):
+                        accept_substring,
+                        tokens_table=None):
 
         self.model.replace_aliases(sqlite_db, 
                                    table_name,
                                    field_name,
-                                   accept_substring)
+                                   accept_substring,
+                                   tokens_table=tokens_table)
+
+    # <clean_table> method - calls the <CleanPipeline> class of <m_clean> model with
+    # the cleaning steps of the <table_name> table and presents the time of each 
+    # step using the <clean_table_stats> method of <v_clean> view.
+    # --------------------------------------------------------------------------------
+    def clean_table(self,
+                    sqlite_db,
+                    table_name,
+                    app_config,
+                    cleaned_on_load):
+
+        _pipeline = m_clean.CleanPipeline()
+        _pipeline.add_clean_steps(app_config, 
+                                  table_name, 
+                                  cleaned_on_load)
+        _pipeline.workers = app_config.cfg_clean_workers
+        if app_config.cfg_norm_cache_size > 0:
+            _pipeline.cache = m_clean.NormalisationCache(app_config.cfg_norm_cache_size,
+                                                         app_config.cfg_norm_cache_persist)
+        if _pipeline.steps:
+            self.view.cmd_clean_table(table_name, 
+                                      [_step[0] for _step in _pipeline.steps])
+            _pipeline.run(sqlite_db, table_name)
+            self.view.clean_table_stats(table_name,
+                                        [(_step[0], _pipeline.step_times[_step[0]]) 
+                                         for _step in _pipeline.steps],
+                                        _pipeline.rows_read,
+                                        _pipeline.rows_updated,
+                                        _pipeline.run_time)
+
+    # <set_norm_cache> method - sets the normalisation cache of the <m_clean> model 
+    # (<cache_size> values, 0 disables the cache) used by the <replace_aliases> 
+    # method.
+    # --------------------------------------------------------------------------------
+    def set_norm_cache(self,
+                       cache_size,
+                       cache_persist):
+
+        if cache_size > 0:
+            self.model.norm_cache = m_clean.NormalisationCache(cache_size,
+                                                               cache_persist)
+        else:
+            self.model.norm_cache = None
 
     # <clone_table> method - clones an existing table in database
     # --------------------------------------------------------------------------------
@@ -127,6 +175,18 @@ class CClean(object):
                                db_table,
                                new_table)
 
+    # <snapshot_table> method - takes a snapshot of an existing table in database
+    #                           without copying its rows
+    # --------------------------------------------------------------------------------
+    def snapshot_table(self,
+                       sqlite_db,
+                       db_table,
+                       snapshot_name):
+
+        self.model.snapshot_table(sqlite_db,
+                                  db_table,
+                                  snapshot_name)
+
     # --------------------------------------------------------------------------------
     # --------------------------------------------------------------------------------
 
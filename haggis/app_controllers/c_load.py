@@ -61,10 +61,38 @@ class c_load(object):
         self.csv_data.rest_key = rest_key
         self.csv_data.delimiter = delimiter
         self.csv_data.quote_char = quote_char
+        self.csv_data.bulk_load = self.app_config.cfg_bulk_load
+        self.csv_data.batch_size = self.app_config.cfg_bulk_batch_size
+        self.csv_data.workers = self.app_config.cfg_load_workers
+        self.csv_data.encoding = self.app_config.cfg_csv_encoding
+        self.csv_data.resume = self.app_config.cfg_resume_load
+        self.csv_data.incremental = (self.app_config.cfg_incremental_ctb and 
+                                     table_name == 'Ctb')
+        self.csv_data.clean_rules = None
+        if self.app_config.cfg_clean_on_load and (table_name in ('Ctb', 'Htb')):
+            if table_name == 'Ctb':
+                _clean_fields = self.app_config.ctb_fields
+            else:
+                _clean_fields = self.app_config.htb_fields
+            self.csv_data.clean_rules = (tuple(_clean_fields),
+                                         self.app_config.cfg_lcase,
+                                         self.app_config.cfg_strip,
+                                         self.app_config.cfg_punct,
+                                         self.app_config.cfg_rm_address_num)
 
         if auto_fields is False:
             self.view.load_csv_file(self.csv_data.csv_filename, False )
             self.csv_data.load_csv(sqlite_db, table_name, False)
+            if self.csv_data.incremental:
+                self.view.load_csv_changes(table_name,
+                                           self.csv_data.rows_inserted,
+                                           self.csv_data.rows_updated,
+                                           self.csv_data.rows_deleted)
+            if (self.csv_data.bulk_load or self.csv_data.incremental or 
+                (self.csv_data.clean_rules is not None)):
+                self.view.load_csv_stats(table_name,
+                                         self.csv_data.rows_loaded,
+                                         self.csv_data.load_time)
         else:
             self.view.load_csv_file(self.csv_data.csv_filename, True)
             self.csv_data.load_csv(sqlite_db, table_name, True)
@@ -40,7 +40,10 @@ class CMatch(object):
                             freq_ctb_limit,
                             freq_htb_limit,
                             filter_locality,
-                            filter_town):
+                            filter_town,
+                            workers=1,
+                            blocking_keys=None,
+                            expand_distance=0):
         """ <sqlite_db>:  SQLite database
             <distance_type>: Type of string distance algorithm 
                              0 = Levenshtein edit-distance,
@@ -58,6 +61,10 @@ class CMatch(object):
             <freq_htb_limit>: Limit of token frequency for the Htb table
             <filter_locality>: Block with Locality field [Boolean]
             <filter_town>: Block with Town field [Boolean]
+            <workers>: Number of matching processes
+            <blocking_keys>: List of the blocking keys of the candidates 
+                             (DistCode, Locality, Town, PCode)
+            <expand_distance>: Maximum edit distance of the expanded Ctb tokens
         """
 
         self.model.matching_tokens(sqlite_db,
@@ -70,7 +77,11 @@ class CMatch(object):
                                    freq_ctb_limit,
                                    freq_htb_limit,
                                    filter_locality,
-                                   filter_town)
+                                   filter_town,
+                                   workers,
+                                   1000,
+                                   blocking_keys,
+                                   expand_distance)
 
     def sec_matching (self, 
                       sqlite_db,
@@ -117,18 +128,22 @@ class CMatch(object):
                         freq_tables,
                         freq_ctb_limit,
                         freq_htb_limit,
-                        use_alias):
+                        use_alias,
+                        token_tables=False):
         """ <sqlite_db>: SQLite database
             <freq_tables>: Use of Frequency tables [Boolean]
             <freq_ctb_limit>: Limit of token frequency for the Ctb table
             <freq_htb_limit>: Limit of token frequency for the Htb table
             <use_alias>: Use of Alias names [Boolean]
+            <token_tables>: Count the tokens of the CtbTokens and HtbTokens 
+                            tables [Boolean]
         """
 
         self.model.build_freq_tables(sqlite_db,
                                    freq_tables,
                                    freq_ctb_limit,
                                    freq_htb_limit,
-                                   use_alias)
+                                   use_alias,
+                                   token_tables)
 
  
\ No newline at end of file
@@ -91,5 +91,18 @@ class CTokenise(object):
                                                  use_alias)
         return _tokens
     # --------------------------------------------------------------------------------
+    # <refresh_token_table> method - calls the <refresh_token_table> model 
+    # --------------------------------------------------------------------------------
+    def refresh_token_table(self, 
+                            sqlite_db, 
+                            table_name):
+
+        """ <sqlite_db>: SQLite database 
+            <table_name>: Table name (Htb or Ctb)
+        """
+
+        return self.model.refresh_token_table(sqlite_db, 
+                                              table_name)
+    # --------------------------------------------------------------------------------
 
 
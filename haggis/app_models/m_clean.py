@@ -16,9 +16,19 @@
 # Import necessary modules
 import string
 import time
+import hashlib
+import json
 import operator
+import collections
+import multiprocessing
+import sqlite3
 from app_models import m_tokenise
 
+# Punctuation characters removed by the cleaning process ('?' is kept) and the 
+# translate table of the characters for unicode strings.
+PUNCTUATION_CHARS = string.punctuation.replace('?', '')
+PUNCTUATION_TABLE = dict((ord(_p), None) for _p in PUNCTUATION_CHARS)
+
 class Clean(object):
     """<Clean> class for normalising(lowercase, strip, punctuation rem) data.
     """
@@ -28,10 +38,15 @@ class Clean(object):
         self.is_clean = False
         self.no_number = False
         self.no_duplicates = False
+        self.tokeniser = m_tokenise.Tokenise()
+        self.sttb_trie = None
+        self.norm_cache = None
     
     # <clean_field> method - Cleans the string data stored at the <field_name> field.
     #                        Converts string to lowercase, strips whitespaces and 
-    #                        removes punctuation. 
+    #                        removes punctuation. The field is updated by a single 
+    #                        sql statement using the <haggis_norm> SQLite function.
+    #                        Only the rows with a changed value are written.
     # ---------------------------------------------------------------------------------   
     def clean_field(self, 
                     sqlite_db,
@@ -45,28 +60,21 @@ class Clean(object):
         
         _start_timer = time.time() # Timer
 
+        sqlite_db.conn.create_function('haggis_norm', 
+                                       1, 
+                                       self.string_normaliser(lowercase,
+                                                              strip_white,
+                                                              rm_punctuation))
         _cur = sqlite_db.rCur()
 
-        _cur.execute('SELECT Id, %s FROM %s' % (field_name, table_name)) 
-            
-        for _row in _cur.fetchall():
-            _fld_val = _row[1]
-            _hist_val = _fld_val
-            if _fld_val != '':
-                if lowercase:
-                    _fld_val = _fld_val.lower()
-                if strip_white:
-                    _fld_val = _fld_val.strip()
-                if rm_punctuation:
-                    for p in string.punctuation:
-                        if p !='?':
-                            _fld_val = _fld_val.replace(p, '')
-                if _fld_val != _hist_val:
-                    _cur.execute("UPDATE %s SET %s = '%s' WHERE Id = %i" 
-                                  % (table_name, 
-                                     field_name,
-                                     _fld_val,
-                                     _row[0]))  
+        _cur.execute("UPDATE %s SET %s = haggis_norm(%s) WHERE %s <> '' AND \
+                      haggis_norm(%s) IS NOT %s" 
+                      % (table_name, 
+                         field_name,
+                         field_name,
+                         field_name,
+                         field_name,
+                         field_name))
         self.is_clean = True
 
         print ('Time: ' + str(time.time() - _start_timer))  # Timer
@@ -74,150 +82,311 @@ class Clean(object):
         return self.is_clean
     
     # <remove_address_numbers> method - Removes the numeric substring at the start of  
-    #                                   an address string. 
+    #                                   an address string. The rows are read in 
+    #                                   batches of <batch_size> rows (Id order) and 
+    #                                   the changed field and Num values of a batch
+    #                                   are written with one <executemany>.
     # --------------------------------------------------------------------------------- 
     def remove_address_numbers(self, 
                               sqlite_db,
                               table_name,
-                              field_name):
+                              field_name,
+                              batch_size=10000):
 
         print('Remove address numbers ...')
         _start_timer = time.time() # Timer
 
         _cur = sqlite_db.rCur()
 
-        _cur.execute('SELECT Id, %s FROM %s' % (field_name, table_name)) 
-            
-        for _row in _cur.fetchall():
-            _fld_val = _row[1]
-            _hist_val = _fld_val
-            if _fld_val != '':
-                _tokenise = m_tokenise.Tokenise()
-                _tokens = _tokenise.tokenise_street(_fld_val, 
-                                                    True)
-                
-                _fld_val = ''
-                
-                for _token in _tokens:
-                    _fld_val = _fld_val + _token + ' '
-
-                _fld_val = _fld_val[:-1]
-
-                if _fld_val != _hist_val:
-                    _cur.execute("UPDATE %s SET %s = '%s' WHERE Id = %i" 
-                                  % (table_name, 
-                                     field_name,
-                                     _fld_val,
-                                     _row[0]))  
-                    # If the first token has a digit then its value will added 
-                    # in the 'Num' field.
-                    if _tokenise.first_token != '':
-                        _cur.execute("UPDATE %s SET Num = '%s' WHERE Id = %i" 
-                                      % (table_name, 
-                                         _tokenise.first_token,
-                                         _row[0]))
+        # If the first token has a digit then its value will added in the 'Num' 
+        # field, otherwise the 'Num' value is kept. The tables without a 'Num' 
+        # field (e.g. Atb) keep only the field update.
+        _tb_flds = [_col[1] for _col in _cur.execute('PRAGMA table_info(%s)' % (table_name,))]
+        _has_num = 'Num' in _tb_flds
+        if _has_num:
+            _str_update = 'UPDATE %s SET %s = ?, Num = COALESCE(?, Num) WHERE Id = ?' % (table_name,
+                                                                                        field_name)
+        else:
+            _str_update = 'UPDATE %s SET %s = ? WHERE Id = ?' % (table_name,
+                                                                field_name)
+        _rows_read = 0
+        _rows_updated = 0
+
+        for _rows in self.read_field_batches(sqlite_db, 
+                                             table_name, 
+                                             field_name, 
+                                             batch_size):
+            _rows_read += len(_rows)
+
+            _updates = []
+            for _row in _rows:
+                _fld_val = _row[1]
+                if isinstance(_fld_val, basestring) and (_fld_val != ''):
+                    _fld_val, _first_token = self.split_address_number(_fld_val)
+                    if _fld_val != _row[1]:
+                        if _has_num:
+                            _updates.append((_fld_val, _first_token or None, _row[0]))
+                        else:
+                            _updates.append((_fld_val, _row[0]))
+
+            _cur.executemany(_str_update, _updates)
+            _rows_updated += len(_updates)
 
         self.no_number = True
 
-        print ('Time: ' + str(time.time() - _start_timer))  # Timer
+        _time = time.time() - _start_timer # Timer
+        print ('Rows: %i (%i updated), %.0f rows/sec' % (_rows_read,
+                                                         _rows_updated,
+                                                         _rows_read / max(_time, 1e-6)))
+        print ('Time: ' + str(_time))  # Timer
 
         return self.no_number
 
+    # <clean_string> method - Returns the <value> string converted to lowercase, 
+    #                         stripped and without punctuation (except '?') as set 
+    #                         by the <lowercase>, <strip_white> and <rm_punctuation>
+    #                         flags.
+    # ---------------------------------------------------------------------------------   
+    def clean_string(self, 
+                     value, 
+                     lowercase, 
+                     strip_white, 
+                     rm_punctuation):
+
+        if lowercase:
+            value = value.lower()
+        if strip_white:
+            value = value.strip()
+        if rm_punctuation:
+            if isinstance(value, unicode):
+                value = value.translate(PUNCTUATION_TABLE)
+            else:
+                value = value.translate(None, PUNCTUATION_CHARS)
+        return value
+
+    # <string_normaliser> method - Returns the normalising function of the 
+    #                              <clean_string> method for the given flags. The 
+    #                              function is registered as the <haggis_norm> 
+    #                              SQLite function and returns the non-string 
+    #                              values unchanged.
+    # ---------------------------------------------------------------------------------   
+    def string_normaliser(self, 
+                          lowercase, 
+                          strip_white, 
+                          rm_punctuation):
+
+        def _normalise(value):
+            if not isinstance(value, basestring):
+                return value
+            return self.clean_string(value,
+                                     lowercase,
+                                     strip_white,
+                                     rm_punctuation)
+        return _normalise
+
+    # <split_address_number> method - Returns the <value> address string without the
+    #                                 tokens containing a digit, and the first token
+    #                                 if it contains a digit ('' otherwise).
+    # ---------------------------------------------------------------------------------   
+    def split_address_number(self, value):
+
+        _tokens = self.tokeniser.tokenise_street(value, 
+                                                 True)
+        return ' '.join(_tokens), self.tokeniser.first_token
+
+    # <clean_row> method - Applies the cleaning process of the <clean_field> and 
+    #                      <remove_address_numbers> methods to the <row> dictionary 
+    #                      of a single address. Each of the <field_names> fields is 
+    #                      cleaned and its address numbers are removed, then the 
+    #                      address numbers of the Street field are removed if 
+    #                      <rm_address_num> is True. The values of the row are 
+    #                      identical to the values of the cleaned table.
+    # ---------------------------------------------------------------------------------   
+    def clean_row(self, 
+                  row,
+                  field_names,
+                  lowercase, 
+                  strip_white, 
+                  rm_punctuation,
+                  rm_address_num):
+
+        """ <row>: Dictionary of the field values of an address (updated)
+            <field_names>: Fields that require cleaning
+            <lowercase>: Convert to lowercase [Boolean]
+            <strip_white>: Strip whitespaces [Boolean]
+            <rm_punctuation>: Remove punctuation [Boolean]
+            <rm_address_num>: Remove the Street address numbers [Boolean]
+        """
+
+        _steps = [(_fld, True) for _fld in field_names]
+        if rm_address_num:
+            _steps.append(('Street', False))
+
+        for _fld, _clean in _steps:
+            _fld_val = row.get(_fld)
+            if isinstance(_fld_val, basestring) and (_fld_val != ''):
+                if _clean:
+                    _fld_val = self.clean_string(_fld_val,
+                                                 lowercase,
+                                                 strip_white,
+                                                 rm_punctuation)
+                    row[_fld] = _fld_val
+                if _fld_val != '':
+                    _fld_val, _first_token = self.split_address_number(_fld_val)
+                    if _fld_val != row[_fld]:
+                        row[_fld] = _fld_val
+                        if _first_token != '':
+                            row['Num'] = _first_token
+        return row
+
     # <remove_special_tokens> method - Removes tokens related to a field name and stores  
-    #                                  them in a new field. 
+    #                                  them in a new field. The names of the <csv_path>
+    #                                  file are compiled once into a token suffix trie
+    #                                  and the moved values are written in batches.
+    #                                  If more than one name matches the end of an 
+    #                                  address, the last name of the file is moved.
     # --------------------------------------------------------------------------------- 
     def remove_special_tokens(self, 
                               sqlite_db,
                               table_name,
                               rm_field_name,
                               cp_field_name,
-                              csv_path):
+                              csv_path,
+                              batch_size=10000,
+                              encoding='utf-8'):
 
         print('Remove special tokens ...')
         _start_timer = time.time() # Timer
 
-        
-        # Read <csv_path> file and store it in a List
-        _file = open(csv_path, 'rb')
-        _sp_tokens = _file.readlines()
-        _file.close()
+        _trie = self.load_special_tokens(csv_path, encoding)
 
-        # Select Id and <rm_field_name> values from the <rm_table_name> table
         _cur = sqlite_db.rCur()
-        _cur.execute('SELECT Id, %s FROM %s' % (rm_field_name, table_name)) 
-
-                    
-        for _row in _cur.fetchall():
-            _fld_val = _row[1]
-            _hist_val = _fld_val
-            if _fld_val != '':
-                _tokenise = m_tokenise.Tokenise()
-                _tokens = _tokenise.tokenise_street(_fld_val, 
-                                                    True)
-                
-                _sel_tokens = [x for x in _sp_tokens if _tokens[-1:][0] in x]
-                
-                if len(_sel_tokens) == 1:
-                    _len_sp = len(_sel_tokens[0].split())
-
-                    if _len_sp < len(_tokens):
-                        _str_sp = _sel_tokens[0].rstrip('\r\n')
-                        _str_tk = ' '.join(_tokens[-_len_sp:])
+        _str_update = 'UPDATE %s SET %s = ?, %s = ? WHERE Id = ?' % (table_name,
+                                                                   cp_field_name,
+                                                                   rm_field_name)
+        _rows_moved = 0
 
-                        if _str_sp == _str_tk:
-
-                            # Clean string using _len_sp count
-                            _clean_str = ' '.join(_tokens[:-_len_sp])
-
-                            # Move value to new column
-                            _cur.execute("UPDATE %s SET %s = '%s' WHERE Id = %i" 
-                                          % (table_name, 
-                                             cp_field_name,
-                                             _str_sp,
-                                             _row[0]))
-
-                            # Update value to old column
-                            _cur.execute("UPDATE %s SET %s = '%s' WHERE Id = %i" 
-                                          % (table_name, 
-                                             rm_field_name,
-                                             _clean_str,
-                                             _row[0]))
-
-
-                if len(_sel_tokens) > 1:
-                    for _sel_t in _sel_tokens:
-                        _len_sp = len(_sel_t.split())
-
-                        if _len_sp < len(_tokens):
-                            _str_sp = _sel_t.rstrip('\r\n')
-                            _str_tk = ' '.join(_tokens[-_len_sp:])
-
-                            if _str_sp == _str_tk:
-
-                                # Clean string using _len_sp count
-                                _clean_str = ' '.join(_tokens[:-_len_sp])
-
-                                # Move value to new column
-                                _cur.execute("UPDATE %s SET %s = '%s' WHERE Id = %i" 
-                                              % (table_name, 
-                                                 cp_field_name,
-                                                 _str_sp,
-                                                 _row[0]))
-
-                                # Update value to old column
-                                _cur.execute("UPDATE %s SET %s = '%s' WHERE Id = %i" 
-                                              % (table_name, 
-                                                 rm_field_name,
-                                                 _clean_str,
-                                                 _row[0]))
+        # Select Id and <rm_field_name> values from the <rm_table_name> table
+        for _rows in self.read_field_batches(sqlite_db, 
+                                             table_name, 
+                                             rm_field_name, 
+                                             batch_size):
+            _updates = []
+            for _row in _rows:
+                _moved = self.split_special_tokens(_row[1], _trie)
+                if _moved is not None:
+                    # Move value to new column and clean the old column
+                    _updates.append((_moved[1], _moved[0], _row[0]))
+
+            _cur.executemany(_str_update, _updates)
+            _rows_moved += len(_updates)
+
+        print ('Moved: %i' % (_rows_moved,))
+        print ('Time: ' + str(time.time() - _start_timer))  # Timer
 
+    # <load_special_tokens> method - Reads the names of the <csv_path> file (one name
+    #                                per line) and returns their token suffix trie.
+    #                                Only the names separated by single spaces can 
+    #                                match the tokens of an address. The names are
+    #                                decoded from <encoding> (undecodable bytes are 
+    #                                replaced).
+    # --------------------------------------------------------------------------------- 
+    def load_special_tokens(self, csv_path, encoding='utf-8'):
+
+        _trie = m_tokenise.TokenSuffixTrie()
+        with open(csv_path, 'rb') as _file:
+            for _line_num, _line in enumerate(_file):
+                _name = _line.rstrip('\r\n').decode(encoding, 'replace')
+                if (_name != '') and (_name == ' '.join(_name.split())):
+                    _trie.add(_name.split(), (_line_num, _name))
+        return _trie
+
+    # <split_special_tokens> method - Returns the (address, name) tuple of the <value>
+    #                                 address ending with a name of the <trie> suffix
+    #                                 trie, or None. The name must leave at least one
+    #                                 token in the address.
+    # --------------------------------------------------------------------------------- 
+    def split_special_tokens(self, 
+                             value, 
+                             trie):
+
+        if isinstance(value, basestring) and (value != ''):
+            _tokens = self.tokeniser.tokenise_street(value, 
+                                                     True)
+            _matches = trie.suffix_matches(_tokens, len(_tokens) - 1)
+            if _matches:
+                (_line_num, _str_sp), _len_sp = max(_matches)
+                return ' '.join(_tokens[:-_len_sp]), _str_sp
+        return None
+
+    # <read_field_batches> method - Generates the lists of (Id, <field_name>) rows of
+    #                               the <table_name> table in batches of 
+    #                               <batch_size> rows (Id order). The rows of a 
+    #                               batch can be updated before reading the next 
+    #                               batch.
+    # --------------------------------------------------------------------------------- 
+    def read_field_batches(self, 
+                           sqlite_db,
+                           table_name,
+                           field_name,
+                           batch_size):
 
-        print ('Time: ' + str(time.time() - _start_timer))  # Timer
+        _cur = sqlite_db.rCur()
+        _str_select = 'SELECT Id, %s FROM %s WHERE Id > ? ORDER BY Id LIMIT ?' % (field_name, 
+                                                                                 table_name)
+        _last_id = -1
+        while True:
+            _rows = _cur.execute(_str_select, (_last_id, batch_size)).fetchall()
+            if not _rows:
+                break
+            _last_id = _rows[-1][0]
+            yield _rows
+
+    # <read_alias_batches> method - Generates the lists of (Id, <field_name>) rows of
+    #                               the <table_name> table with at least one Atb 
+    #                               alias token in the <field_name> tokens of the 
+    #                               <tokens_table> token table (see the 
+    #                               <refresh_token_table> method of <Tokenise>), in 
+    #                               batches of <batch_size> rows (Id order).
+    # ---------------------------------------------------------------------------------
+    def read_alias_batches(self, 
+                           sqlite_db,
+                           table_name,
+                           field_name,
+                           tokens_table,
+                           batch_size):
 
+        _cur = sqlite_db.rCur()
+        _cur.execute('DROP TABLE IF EXISTS temp.AliasRows')
+        _cur.execute('CREATE TEMP TABLE AliasRows (Id integer NOT NULL PRIMARY KEY)')
+        _cur.execute('INSERT INTO AliasRows (Id) SELECT DISTINCT t.RecordId \
+                      FROM (SELECT DISTINCT Alias FROM Atb) a JOIN %s t \
+                      ON t.Token = a.Alias AND t.Field = ?' % (tokens_table,), 
+                     (field_name,))
+
+        _str_select = 'SELECT t.Id, t.%s FROM AliasRows a JOIN %s t ON t.Id = a.Id \
+                       WHERE a.Id > ? ORDER BY a.Id LIMIT ?' % (field_name, 
+                                                                table_name)
+        _last_id = -1
+        while True:
+            _rows = _cur.execute(_str_select, (_last_id, batch_size)).fetchall()
+            if not _rows:
+                break
+            _last_id = _rows[-1][0]
+            yield _rows
+        _cur.execute('DROP TABLE temp.AliasRows')
 
     # <remove_street_duplicates> method - Removes the street duplicates in a given   
     #                                     <field_name> field in the <sqlite_db> 
     #                                     database.
+    #                                     The unique addresses (lowest Id of each 
+    #                                     <group_by_fields> group) and their event 
+    #                                     counts (CntEvents) are copied by a single
+    #                                     GROUP BY statement to a new table with the 
+    #                                     same schema and indexes, which replaces the
+    #                                     <table_name> table. The <table_name>DupMap 
+    #                                     table maps every original Id to the Id of 
+    #                                     its unique address (RepId).
     # --------------------------------------------------------------------------------- 
     def remove_street_duplicates(self, 
                                  sqlite_db,
@@ -228,137 +397,205 @@ class Clean(object):
         _start_timer = time.time() # Timer
 
         _cur = sqlite_db.rCur()
-        args = ''
-        for item in group_by_fields:
-            args = args + item + ","
-        args = args[:-1]
-        _cur.execute('SELECT Id, %s, COUNT(*) AS Freq FROM %s GROUP BY %s' % (args,
-                                                                              table_name,
-                                                                              args))
-        uniqueAddresses = _cur.fetchall()
-        args = ''
-        for item in uniqueAddresses:
-            args = args + str(item[0]) + ","
-        args = args[:-1]
-
-        _cur.execute('DELETE FROM %s WHERE Id NOT IN (%s)' % (table_name,
-                                                              args))
+        _new_table = table_name + 'Dedup'
+        _map_table = table_name + 'DupMap'
+        args = ','.join(group_by_fields)
+
+        # Schema and indexes of the table
+        _tb_sql = _cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND \
+                                name = ?", (table_name,)).fetchone()[0]
+        _idx_sql = [_row[0] for _row in 
+                    _cur.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND \
+                                  tbl_name = ? AND sql IS NOT NULL", (table_name,))]
+
+        # Unique addresses and event frequencies
+        _cur.execute('DROP TABLE IF EXISTS temp.DupGroups')
+        _cur.execute('CREATE TEMP TABLE DupGroups AS \
+                      SELECT MIN(Id) AS RepId, COUNT(*) AS CntEvents, %s \
+                      FROM %s GROUP BY %s' % (args,
+                                              table_name,
+                                              args))
+        _cur.execute('CREATE INDEX temp.DupGroups_idx ON DupGroups (%s)' % (args,))
+
+        # Mapping of the original Ids (NULL values are grouped together)
+        _cur.execute('DROP TABLE IF EXISTS %s' % (_map_table,))
+        _cur.execute('CREATE TABLE %s (Id integer NOT NULL PRIMARY KEY, \
+                                       RepId integer NOT NULL)' % (_map_table,))
+        _cur.execute('INSERT INTO %s (Id, RepId) \
+                      SELECT t.Id, g.RepId FROM %s t JOIN DupGroups g ON %s' % 
+                     (_map_table,
+                      table_name,
+                      ' AND '.join(['t.%s IS g.%s' % (_fld, _fld) 
+                                    for _fld in group_by_fields])))
+
+        # Copy the unique addresses with the CntEvents column to the new table
+        _cur.execute('DROP TABLE IF EXISTS %s' % (_new_table,))
+        _cur.execute('CREATE TABLE %s %s' % (_new_table,
+                                             _tb_sql[_tb_sql.index('('):]))
+        _cur.execute('ALTER TABLE %s ADD COLUMN CntEvents INTEGER' % (_new_table,))
+        _cur.execute('INSERT INTO %s SELECT t.*, g.CntEvents \
+                      FROM DupGroups g JOIN %s t ON t.Id = g.RepId \
+                      ORDER BY g.RepId' % (_new_table,
+                                           table_name))
+
+        # Keep the removed rows in the deltas of the snapshots of the table (the 
+        # snapshot values of the changed rows are already kept)
+        _snapshots = self.table_snapshots(sqlite_db, table_name)
+        for _snapshot, _columns in _snapshots:
+            _cur.execute('INSERT OR IGNORE INTO %sDelta (%s) \
+                          SELECT %s FROM %s t JOIN %s m ON m.Id = t.Id \
+                          WHERE m.Id <> m.RepId' % (_snapshot,
+                                                    _columns,
+                                                    ','.join(['t.' + _col for _col in 
+                                                              _columns.split(',')]),
+                                                    table_name,
+                                                    _map_table))
+            _cur.execute('DROP VIEW IF EXISTS %s' % (_snapshot,))
+
+        # Replace the table
+        _cur.execute('DROP TABLE %s' % (table_name,))
+        _cur.execute('ALTER TABLE %s RENAME TO %s' % (_new_table,
+                                                      table_name))
+        for _sql in _idx_sql:
+            _cur.execute(_sql)
+        for _snapshot, _columns in _snapshots:
+            self.create_snapshot_view(sqlite_db, _snapshot, table_name, _columns)
+            self.create_snapshot_triggers(sqlite_db, _snapshot, table_name, _columns)
+        _cur.execute('DROP TABLE temp.DupGroups')
         sqlite_db.conn.commit()
         
         print ('Time: ' + str(time.time() - _start_timer))  # Timer
 
-        # Clean empty spaces after DELETE 
-        _cur.execute('VACUUM')
-
-        # Add CntEvents column to the table
-        _cur.execute('ALTER TABLE %s ADD COLUMN CntEvents INTEGER' % (table_name,))
 
-        # Populate the CntEvents column using event frequencies 
-        for item in uniqueAddresses:
-            _cur.execute("UPDATE %s SET CntEvents = %i WHERE Id = %i" % (table_name, 
-                                                                         item[len(item)-1],
-                                                                         item[0]))  
-        sqlite_db.conn.commit()
-
-
-    # <replace_aliases> method - Replaces the alias substrings with full names 
+    # <replace_aliases> method - Replaces the alias substrings with full names. The
+    #                            aliases are resolved by the alias resolver of the 
+    #                            database (Atb table read once) and the changed 
+    #                            addresses are written and committed in batches of 
+    #                            <batch_size> rows. If the <tokens_table> token 
+    #                            table is given, only the rows with alias tokens 
+    #                            are read.
     # --------------------------------------------------------------------------------- 
     def replace_aliases(self, 
                         sqlite_db,
                         table_name,
                         field_name,
-                        accept_substring):
+                        accept_substring,
+                        batch_size=10000,
+                        tokens_table=None):
 
-        _cur = sqlite_db.rCur()
+        print('Replace aliases ...')
+        _start_timer = time.time() # Timer
 
-        _cur.execute('SELECT Id, %s FROM %s' % (field_name, table_name)) 
-            
-        for _row in _cur.fetchall():
-            _fld_val = _row[1]
-            _hist_val = _fld_val
-            if _fld_val != '':
-                _tokenise = m_tokenise.Tokenise()
-                _tokens = _tokenise.tokenise_street(_row[1],
-                                                    False)
-
-                if accept_substring:
-                    _safe_indices = self.check_tokens(sqlite_db, _tokens)
-                else:
-                    _safe_indices = []
+        _resolver = m_tokenise.alias_resolver(sqlite_db)
+        _cur = sqlite_db.rCur()
+        _str_update = 'UPDATE %s SET %s = ? WHERE Id = ?' % (table_name,
+                                                            field_name)
+
+        # The replaced addresses depend on the Atb names and frequencies and on 
+        # the STtb names
+        if (self.norm_cache is not None) and self.norm_cache.persist:
+            _sttb_names = sorted([_row[0] for _row in _cur.execute('SELECT Name FROM STtb')
+                                  if _row[0] is not None])
+            self.norm_cache.attach(sqlite_db, 
+                                   hashlib.sha1(repr(('Alias',
+                                                      accept_substring,
+                                                      sorted(_resolver.names.items()),
+                                                      _sttb_names))).hexdigest())
+
+        if tokens_table is None:
+            _batches = self.read_field_batches(sqlite_db, 
+                                               table_name, 
+                                               field_name, 
+                                               batch_size)
+        else:
+            _batches = self.read_alias_batches(sqlite_db, 
+                                               table_name, 
+                                               field_name, 
+                                               tokens_table,
+                                               batch_size)
+
+        for _rows in _batches:
+            _updates = []
+            for _row in _rows:
+                _fld_val = _row[1]
+                if self.norm_cache is not None:
+                    _cached = self.norm_cache.get(('Alias', _fld_val))
+                    if _cached is not None:
+                        if _cached[0] is not None:
+                            _updates.append((_cached[0], _row[0]))
+                        continue
+
+                _new_val = None
+                if isinstance(_fld_val, basestring) and (_fld_val != ''):
+                    _tokens = self.tokeniser.tokenise_street(_fld_val,
+                                                             False)
+
+                    if accept_substring:
+                        _safe_indices = self.check_tokens(sqlite_db, _tokens)
+                    else:
+                        _safe_indices = []
                 
-                _build_string = ''
-                _h_flag = False
-                for idx, _token in enumerate(_tokens):
-
-                    if (idx not in _safe_indices) and \
-                       ((idx != 0) and (len(_token) >= 2)):
-
-                        _atb_sel = _cur.execute("SELECT Name, Freq FROM Atb WHERE Alias = '%s'"
-                                                % (_token)).fetchall()
-                        
-                        if len(_atb_sel) != 0:
-                            _atb_sel = sorted(_atb_sel, key=operator.itemgetter(1),reverse=True)
-                            _build_string = _build_string + _atb_sel[0][0] + ' '
+                    _new_tokens = []
+                    _h_flag = False
+                    for idx, _token in enumerate(_tokens):
+                        _name = None
+                        if (idx not in _safe_indices) and \
+                           ((idx != 0) and (len(_token) >= 2)):
+                            _name = _resolver.resolve(_token)
+
+                        if _name is not None:
+                            _new_tokens.append(_name)
                             _h_flag = True
                         else:
-                            _build_string = _build_string + _token + ' '
-                    else:
-                        _build_string = _build_string + _token + ' '
-
-                _build_string = _build_string[:-1]
-
-                # Use flag to avoid to update an address without changes
-                if  _h_flag:
-                    _cur.execute("UPDATE %s SET %s = '%s' WHERE Id = %i" 
-                                % (table_name, 
-                                    field_name,
-                                    _build_string,
-                                    _row[0]))  
-                    sqlite_db.conn.commit()
+                            _new_tokens.append(_token)
+
+                    # Use flag to avoid to update an address without changes
+                    if  _h_flag:
+                        _new_val = ' '.join(_new_tokens)
+                        _updates.append((_new_val, _row[0]))
+
+                if self.norm_cache is not None:
+                    self.norm_cache.put(('Alias', _fld_val), (_new_val,))
+
+            _cur.executemany(_str_update, _updates)
+            if self.norm_cache is not None:
+                self.norm_cache.flush()
+            sqlite_db.conn.commit()
         self.no_number = True
 
+        if self.norm_cache is not None:
+            print ('Cache: %i hits, %i misses' % (self.norm_cache.hits,
+                                                  self.norm_cache.misses))
+        print ('Time: ' + str(time.time() - _start_timer))  # Timer
+
         return self.no_number
 
     # <check_tokens> method - Search for matching between <STtb> substrings and
-    #                         the given tokens. Returns the index of token that
-    #                         needs to remain unchanged. 
+    #                         the given tokens. Returns the set of indices of the 
+    #                         tokens that need to remain unchanged. The STtb names
+    #                         are compiled once into a token trie (<sttb_trie>) 
+    #                         and the tokens are scanned in a single pass.
     # --------------------------------------------------------------------------------- 
 
     def check_tokens(self, 
                      sqlite_db,
                      _tokens):
 
-        _unchanged_tokens = []
-        
-        _addr_str = ''
-        # Build the address string from tokens       
-        for _token in _tokens:
-            _addr_str = _addr_str + _token + ' '
+        if self.sttb_trie is None:
+            self.sttb_trie = m_tokenise.TokenTrie()
+            _cur = sqlite_db.rCur()
+            for _name in _cur.execute('SELECT Name FROM STtb'):
+                if isinstance(_name[0], basestring) and (_name[0].split() != []):
+                    self.sttb_trie.add(_name[0].split(), _name[0])
 
-        _addr_str = _addr_str[:-1]
+        _unchanged_tokens = set()
 
-        _cur = sqlite_db.rCur()
-        _cur.execute('SELECT Name FROM STtb')
-
-        for _name in _cur.fetchall():
-            
-            if _name[0] in _addr_str:
-                _sttb_tokens = _name[0].split()
-                result = []
-                for i, x in enumerate(_tokens):
-                    if (x == _sttb_tokens[0]) and (i != len(_tokens) - 1):
-                        result.append(i)
-                
-                for _index in result:
-                    cnt = 0
-                    _tokens_match = 1
-                    for _stoken in _sttb_tokens[1:]: 
-                        cnt += 1 
-                        if _stoken == _tokens[_index + cnt]:
-                            _tokens_match += 1
-                    if _tokens_match == len(_sttb_tokens):
-                        for i in range(cnt + 1):
-                            _unchanged_tokens.append(_index + i)
+        # A name can not start at the last token
+        for _index in range(len(_tokens) - 1):
+            for _name, _len_name in self.sttb_trie.prefix_matches(_tokens, 
+                                                                  _index, 
+                                                                  len(_tokens)):
+                _unchanged_tokens.update(range(_index, _index + _len_name))
 
         return _unchanged_tokens
 
@@ -375,5 +612,622 @@ class Clean(object):
         _cur.execute("CREATE TABLE %s AS SELECT * FROM %s" % (new_table, db_table))
         sqlite_db.conn.commit()
 
+    # <snapshot_table> method - Takes a snapshot of an existing table without 
+    #                           copying its rows. The snapshot is a view over the 
+    #                           table and the <snapshot_name>Delta table, which 
+    #                           keeps the snapshot values of the rows removed or 
+    #                           changed after the snapshot point (triggers of the 
+    #                           table and <remove_street_duplicates>). The rows of 
+    #                           the delta table are excluded from the table side 
+    #                           of the view. Rows inserted after the snapshot point
+    #                           are seen in the snapshot.
+    # --------------------------------------------------------------------------------- 
+    def snapshot_table(self, 
+                       sqlite_db,
+                       db_table,
+                       snapshot_name):
+
+        _cur = sqlite_db.rCur()
+        sqlite_db.init_snapshot_tbl()
+
+        # A snapshot of a previous run can be a table or a view
+        _row = _cur.execute("SELECT type FROM sqlite_master WHERE name = ?", 
+                            (snapshot_name,)).fetchone()
+        if _row is not None:
+            _cur.execute("DROP %s %s" % (_row[0].upper(), snapshot_name))
+        _cur.execute("DROP TRIGGER if exists %sUpdate" % (snapshot_name,))
+        _cur.execute("DROP TRIGGER if exists %sDelete" % (snapshot_name,))
+
+        _columns = ','.join([_col[1] for _col in 
+                             _cur.execute('PRAGMA table_info(%s)' % (db_table,))])
+        _cur.execute("DROP TABLE if exists %sDelta" % (snapshot_name,))
+        _cur.execute("CREATE TABLE %sDelta AS SELECT * FROM %s WHERE 0" % (snapshot_name,
+                                                                          db_table))
+        _cur.execute("CREATE UNIQUE INDEX %sDelta_idx_Id ON %sDelta (Id)" % (snapshot_name,
+                                                                            snapshot_name))
+        _cur.execute("INSERT OR REPLACE INTO Snapshots (Name, TableName, Columns) \
+                      VALUES (?,?,?)", (snapshot_name, db_table, _columns))
+        self.create_snapshot_view(sqlite_db, snapshot_name, db_table, _columns)
+        self.create_snapshot_triggers(sqlite_db, snapshot_name, db_table, _columns)
+        sqlite_db.conn.commit()
+
+    # <table_snapshots> method - Returns the (name, columns) of the snapshots of the 
+    #                            table.
+    # --------------------------------------------------------------------------------- 
+    def table_snapshots(self, 
+                        sqlite_db,
+                        db_table):
+
+        _cur = sqlite_db.rCur()
+        if _cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND \
+                         name = 'Snapshots'").fetchone() is None:
+            return []
+
+        return _cur.execute('SELECT Name, Columns FROM Snapshots WHERE TableName = ? \
+                             ORDER BY Name', (db_table,)).fetchall()
 
+    # <create_snapshot_view> method - Creates the view of the snapshot (rows of the 
+    #                                 table missing from the delta table and rows 
+    #                                 of the delta table).
+    # --------------------------------------------------------------------------------- 
+    def create_snapshot_view(self, 
+                             sqlite_db,
+                             snapshot_name,
+                             db_table,
+                             columns):
 
+        _cur = sqlite_db.rCur()
+        _cur.execute("CREATE VIEW %s AS SELECT %s FROM %s \
+                      WHERE Id NOT IN (SELECT Id FROM %sDelta) \
+                      UNION ALL SELECT %s FROM %sDelta" % (snapshot_name,
+                                                            columns,
+                                                            db_table,
+                                                            snapshot_name,
+                                                            columns,
+                                                            snapshot_name))
+
+    # <create_snapshot_triggers> method - Creates the triggers copying the snapshot 
+    #                                     values of the updated and deleted rows of 
+    #                                     the table to the delta table (first change
+    #                                     of a row only). The triggers are dropped 
+    #                                     with the table.
+    # --------------------------------------------------------------------------------- 
+    def create_snapshot_triggers(self, 
+                                 sqlite_db,
+                                 snapshot_name,
+                                 db_table,
+                                 columns):
+
+        _cur = sqlite_db.rCur()
+        _old_values = ','.join(['OLD.' + _col for _col in columns.split(',')])
+        for _trigger, _event in (('Update', 'UPDATE'), ('Delete', 'DELETE')):
+            _cur.execute("CREATE TRIGGER %s%s BEFORE %s ON %s \
+                          BEGIN INSERT OR IGNORE INTO %sDelta (%s) VALUES (%s); END" % 
+                         (snapshot_name,
+                          _trigger,
+                          _event,
+                          db_table,
+                          snapshot_name,
+                          columns,
+                          _old_values))
+
+class CleanPipeline(object):
+    """<CleanPipeline> class for applying a list of cleaning steps to the rows of a 
+    table in a single pass. Each step updates the dictionary of a row and the 
+    changed rows are written with one <executemany> per batch.
+    """
+    # Constructor: Initialises the properties of <CleanPipeline> instance.
+    # ---------------------------------------------------------------------------------
+    def __init__(self):
+        self.clean = Clean()
+        self.steps = []
+        self.step_times = {}
+        self.signature = []
+        self.cache = None
+        self.config = None
+        self.workers = 1
+        self.rows_read = 0
+        self.rows_updated = 0
+        self.run_time = 0.0
+
+    # <add_step> method - Adds a cleaning step. The <function> is called with the 
+    #                     dictionary of each row and can change the values of the 
+    #                     <field_names> fields. The function must depend only on 
+    #                     the value of the first field, so the results of a value 
+    #                     can be cached.
+    # ---------------------------------------------------------------------------------   
+    def add_step(self, 
+                 step_name, 
+                 field_names,
+                 function,
+                 signature=None):
+
+        """ <step_name>: Name of the step (timing report)
+            <field_names>: List of the fields changed by the step, the first field 
+                           is the field read by the step
+            <function>: Function of a row dictionary
+            <signature>: Settings of the step (cache fingerprint)
+        """
+
+        self.steps.append((step_name, list(field_names), function))
+        self.step_times[step_name] = 0.0
+        self.signature.append((step_name, field_names, signature))
+
+    # <add_clean_steps> method - Adds the cleaning steps of the <table_name> table 
+    #                            set in the <app_config> settings, in the order of 
+    #                            the separate cleaning processes of the main script.
+    #                            If <cleaned_on_load> is True, the field cleaning 
+    #                            and address number steps are skipped (applied 
+    #                            while loading the csv file).
+    # ---------------------------------------------------------------------------------   
+    def add_clean_steps(self, 
+                        app_config, 
+                        table_name,
+                        cleaned_on_load):
+
+        """ <app_config>: Application settings (<AppConfig> instance)
+            <table_name>: Table name (Ctb, Htb, Atb or STtb)
+            <cleaned_on_load>: Fields cleaned while loading [Boolean]
+        """
+
+        # The settings rebuild the steps in the worker processes (<workers> > 1)
+        self.config = (app_config, table_name, cleaned_on_load)
+
+        _fields = {'Ctb': app_config.ctb_fields,
+                   'Htb': app_config.htb_fields,
+                   'Atb': app_config.atb_fields,
+                   'STtb': app_config.sttb_fields}[table_name]
+
+        if not cleaned_on_load:
+            for _fld in _fields:
+                self.add_step('Clean ' + _fld, 
+                              [_fld, 'Num'],
+                              self.field_step(_fld, 
+                                              app_config.cfg_lcase,
+                                              app_config.cfg_strip,
+                                              app_config.cfg_punct),
+                              (app_config.cfg_lcase,
+                               app_config.cfg_strip,
+                               app_config.cfg_punct))
+
+            if app_config.cfg_rm_address_num and (table_name in ('Ctb', 'Htb')):
+                self.add_step('Remove address numbers', 
+                              ['Street', 'Num'],
+                              self.field_step('Street', False, False, False, False))
+
+        if table_name == 'Htb':
+            if app_config.cfg_rm_town:
+                self.add_step('Remove towns', 
+                              ['Street', 'Town'],
+                              self.special_tokens_step('Street', 
+                                                       'Town', 
+                                                       app_config.cfg_towns_csv,
+                                                       app_config.cfg_csv_encoding),
+                              (file_hash(app_config.cfg_towns_csv),
+                               app_config.cfg_csv_encoding))
+            if app_config.cfg_rm_locality:
+                self.add_step('Remove localities', 
+                              ['Street', 'Locality'],
+                              self.special_tokens_step('Street', 
+                                                       'Locality', 
+                                                       app_config.cfg_localities_csv,
+                                                       app_config.cfg_csv_encoding),
+                              (file_hash(app_config.cfg_localities_csv),
+                               app_config.cfg_csv_encoding))
+
+    # <field_step> method - Returns the step of the <clean_field> and 
+    #                       <remove_address_numbers> methods for the <field_name> 
+    #                       field (see the <clean_row> method).
+    # ---------------------------------------------------------------------------------   
+    def field_step(self, 
+                   field_name, 
+                   lowercase, 
+                   strip_white, 
+                   rm_punctuation,
+                   clean_field=True):
+
+        if clean_field:
+            _field_names = [field_name]
+        else:
+            _field_names = []
+
+        def _step(row):
+            self.clean.clean_row(row,
+                                 _field_names,
+                                 lowercase,
+                                 strip_white,
+                                 rm_punctuation,
+                                 not clean_field)
+        return _step
+
+    # <special_tokens_step> method - Returns the step of the <remove_special_tokens> 
+    #                                method for the names of the <csv_path> file.
+    # ---------------------------------------------------------------------------------   
+    def special_tokens_step(self, 
+                            rm_field_name, 
+                            cp_field_name, 
+                            csv_path,
+                            encoding='utf-8'):
+
+        _trie = self.clean.load_special_tokens(csv_path, encoding)
+
+        def _step(row):
+            _moved = self.clean.split_special_tokens(row.get(rm_field_name), _trie)
+            if _moved is not None:
+                row[rm_field_name], row[cp_field_name] = _moved
+        return _step
+
+    # <chain_writes> method - Returns the (step index, field, value) writes of the 
+    #                         <step_idx> steps reading the <field_name> field for the 
+    #                         <value> value. The writes are cached by the value.
+    # ---------------------------------------------------------------------------------   
+    def chain_writes(self, 
+                     field_name, 
+                     step_idx,
+                     value):
+
+        if self.cache is not None:
+            _writes = self.cache.get((field_name, value))
+            if _writes is not None:
+                return _writes
+
+        _writes = []
+        _value = value
+        for _idx in step_idx:
+            _step_name, _field_names, _function = self.steps[_idx]
+            _row = {field_name: _value}
+            _step_timer = time.time()
+            _function(_row)
+            self.step_times[_step_name] += time.time() - _step_timer
+            _value = _row.pop(field_name)
+            for _fld, _val in _row.items():
+                _writes.append((_idx, _fld, _val))
+        _writes.append((step_idx[-1], field_name, _value))
+        _writes = tuple(_writes)
+
+        if self.cache is not None:
+            self.cache.put((field_name, value), _writes)
+        return _writes
+
+    # <step_chains> method - Returns the dictionary of the step indices by the field
+    #                        read by the steps (in the order of the steps).
+    # ---------------------------------------------------------------------------------   
+    def step_chains(self):
+
+        _chains = collections.OrderedDict()
+        for _idx, (_step_name, _field_names, _function) in enumerate(self.steps):
+            _chains.setdefault(_field_names[0], []).append(_idx)
+        return _chains
+
+    # <row_updates> method - Returns the list of the changed <rows> (values of the 
+    #                        <fields> fields and Id) after the steps.
+    # ---------------------------------------------------------------------------------   
+    def row_updates(self, 
+                    rows, 
+                    fields, 
+                    chains):
+
+        """ <rows>: List of (Id, <fields> values) rows
+            <fields>: List of the fields of the rows
+            <chains>: Dictionary of the step indices by field (<step_chains> method)
+        """
+
+        _updates = []
+        for _row in rows:
+            _values = dict(zip(fields, _row[1:]))
+            _writes = []
+            for _fld, _step_idx in chains.items():
+                _writes.extend(self.chain_writes(_fld, 
+                                                 _step_idx, 
+                                                 _values.get(_fld)))
+            _writes.sort(key=operator.itemgetter(0))
+            for _idx, _fld, _val in _writes:
+                _values[_fld] = _val
+
+            _new_row = tuple([_values.get(_fld) for _fld in fields])
+            if _new_row != tuple(_row[1:]):
+                _updates.append(_new_row + (_row[0],))
+        return _updates
+
+    # <run> method - Applies the steps to the rows of the <table_name> table, read 
+    #                and written in batches of <batch_size> rows. The steps reading 
+    #                the same field are applied as a chain to the field value (see 
+    #                the <chain_writes> method) and the writes of the chains are 
+    #                applied to the row in the order of the steps.
+    #                If <workers> is greater than 1, the rows are cleaned by 
+    #                <workers> processes (see the <parallel_updates> method).
+    # ---------------------------------------------------------------------------------   
+    def run(self, 
+            sqlite_db, 
+            table_name,
+            batch_size=10000):
+
+        """ <sqlite_db>: SQLite database 
+            <table_name>: Table name 
+            <batch_size>: Number of rows per batch
+        """
+
+        _start_timer = time.time() # Timer
+        self.rows_read = 0
+        self.rows_updated = 0
+
+        # Fields of the steps that exist in the table (e.g. Atb has no Num field)
+        _cur = sqlite_db.rCur()
+        _tb_flds = [_col[1] for _col in _cur.execute('PRAGMA table_info(%s)' % (table_name,))]
+        _fields = []
+        for _step_name, _field_names, _function in self.steps:
+            for _fld in _field_names:
+                if (_fld in _tb_flds) and (_fld not in _fields):
+                    _fields.append(_fld)
+
+        # Path of the database file ('' for a memory database)
+        _db_path = [_row[2] for _row in _cur.execute('PRAGMA database_list') 
+                    if _row[1] == 'main'][0]
+
+        if _fields:
+            _str_update = 'UPDATE %s SET %s WHERE Id = ?' % (table_name,
+                                                            ','.join([_fld + ' = ?' 
+                                                                      for _fld in _fields]))
+            if (self.workers > 1) and (self.config is not None) and _db_path:
+                _batches = self.parallel_updates(sqlite_db, 
+                                                 _db_path,
+                                                 table_name, 
+                                                 _fields, 
+                                                 batch_size)
+            else:
+                _batches = self.serial_updates(sqlite_db, 
+                                               table_name, 
+                                               _fields, 
+                                               batch_size)
+
+            # Each batch is committed, the worker processes read the table with 
+            # their own connections while the batches are written
+            for _rows_read, _updates in _batches:
+                _cur.executemany(_str_update, _updates)
+                sqlite_db.conn.commit()
+                self.rows_read += _rows_read
+                self.rows_updated += len(_updates)
+
+        self.run_time = time.time() - _start_timer # Timer
+
+        return self.rows_updated
+
+    # <serial_updates> method - Generates the (rows read, changed rows) tuples of 
+    #                           the batches of the <table_name> table in the 
+    #                           current process.
+    # ---------------------------------------------------------------------------------   
+    def serial_updates(self, 
+                       sqlite_db, 
+                       table_name, 
+                       fields, 
+                       batch_size):
+
+        if (self.cache is not None) and self.cache.persist:
+            self.cache.attach(sqlite_db, 
+                              hashlib.sha1(repr((table_name, 
+                                                 self.signature))).hexdigest())
+
+        _chains = self.step_chains()
+        for _rows in self.clean.read_field_batches(sqlite_db, 
+                                                   table_name, 
+                                                   ','.join(fields), 
+                                                   batch_size):
+            yield len(_rows), self.row_updates(_rows, fields, _chains)
+            if self.cache is not None:
+                self.cache.flush()
+
+    # <parallel_updates> method - Generates the (rows read, changed rows) tuples of 
+    #                             the batches of the <table_name> table. The Id 
+    #                             range of the table is split into ranges of 
+    #                             <batch_size> Ids and the rows of each range are 
+    #                             read and cleaned by one of the <workers> processes
+    #                             using its own connection to the <db_path> database.
+    #                             The changed rows are written by the current 
+    #                             process only, in the Id order.
+    #                             Note: The worker processes use a memory cache only.
+    # ---------------------------------------------------------------------------------   
+    def parallel_updates(self, 
+                         sqlite_db, 
+                         db_path,
+                         table_name, 
+                         fields, 
+                         batch_size):
+
+        _cur = sqlite_db.rCur()
+        _min_id, _max_id = _cur.execute('SELECT MIN(Id), MAX(Id) FROM %s' % 
+                                        (table_name,)).fetchone()
+        if _min_id is None:
+            return
+
+        # The worker connections read the committed rows
+        sqlite_db.conn.commit()
+
+        _ranges = [(fields, _start, _start + batch_size) 
+                   for _start in xrange(_min_id, _max_id + 1, batch_size)]
+
+        _cache_size = 0
+        if self.cache is not None:
+            _cache_size = self.cache.max_size
+
+        _pool = multiprocessing.Pool(self.workers, 
+                                     init_clean_worker, 
+                                     (db_path, self.config, _cache_size))
+        try:
+            for _rows_read, _updates, _step_times in _pool.imap(clean_id_range, _ranges):
+                for _step_name, _step_time in _step_times.items():
+                    self.step_times[_step_name] += _step_time
+                yield _rows_read, _updates
+            _pool.close()
+        finally:
+            _pool.terminate()
+            _pool.join()
+
+class NormalisationCache(object):
+    """<NormalisationCache> class for memoising the normalised values of the raw 
+    address strings. At most <max_size> values are kept in memory (least recently
+    used values are evicted). If <persist> is True, the values are also stored in 
+    the NormCache table of the database with the fingerprint of the settings that 
+    produced them, so they are reused by the next runs with the same settings.
+    """
+    # Constructor: Initialises the properties of <NormalisationCache> instance.
+    # ---------------------------------------------------------------------------------
+    def __init__(self, 
+                 max_size, 
+                 persist):
+        self.max_size = max_size
+        self.persist = persist
+        self.values = collections.OrderedDict()
+        self.sqlite_db = None
+        self.fingerprint = ''
+        self.pending = []
+        self.hits = 0
+        self.misses = 0
+
+    # <attach> method - Uses the NormCache table of the <sqlite_db> database for 
+    #                   the values of the <fingerprint> settings.
+    # ---------------------------------------------------------------------------------   
+    def attach(self, 
+               sqlite_db, 
+               fingerprint):
+
+        self.flush()
+        if fingerprint != self.fingerprint:
+            self.values.clear()
+        self.sqlite_db = sqlite_db
+        self.fingerprint = fingerprint
+        sqlite_db.init_norm_cache_tbl()
+
+    # <get> method - Returns the cached value of the <key> (field, raw value) tuple 
+    #                or None.
+    # ---------------------------------------------------------------------------------   
+    def get(self, key):
+
+        try:
+            _value = self.values.pop(key)
+        except KeyError:
+            _value = None
+            if (self.sqlite_db is not None) and isinstance(key[1], basestring):
+                _row = self.sqlite_db.rCur().execute('SELECT Value FROM NormCache \
+                                                      WHERE Fingerprint = ? AND Field = ? \
+                                                      AND RawValue = ?', 
+                                                     (self.fingerprint, 
+                                                      key[0], 
+                                                      key[1])).fetchone()
+                if _row is not None:
+                    _value = json_to_tuple(json.loads(_row[0]))
+                    self.store(key, _value)
+            if _value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return _value
+
+        self.values[key] = _value
+        self.hits += 1
+        return _value
+
+    # <put> method - Caches the <value> of the <key> (field, raw value) tuple.
+    # ---------------------------------------------------------------------------------   
+    def put(self, 
+            key, 
+            value):
+
+        self.store(key, value)
+        if (self.sqlite_db is not None) and isinstance(key[1], basestring):
+            self.pending.append((self.fingerprint, 
+                                 key[0], 
+                                 key[1], 
+                                 json.dumps(value)))
+
+    # <store> method - Keeps the <value> in memory evicting the least recently used
+    #                  value.
+    # ---------------------------------------------------------------------------------   
+    def store(self, 
+              key, 
+              value):
+
+        self.values.pop(key, None)
+        self.values[key] = value
+        if len(self.values) > self.max_size:
+            self.values.popitem(last=False)
+
+    # <flush> method - Writes the new values to the NormCache table.
+    # ---------------------------------------------------------------------------------   
+    def flush(self):
+
+        if self.pending:
+            self.sqlite_db.rCur().executemany('INSERT OR REPLACE INTO NormCache \
+                                               (Fingerprint, Field, RawValue, Value) \
+                                               VALUES (?,?,?,?)', self.pending)
+            self.pending = []
+# -------------------------------------------------------------------------------------
+
+# Cleaning pipeline and database connection of a worker process (see the 
+# <parallel_updates> method of <CleanPipeline>)
+_worker_pipeline = None
+_worker_conn = None
+
+# <init_clean_worker> function - Creates the cleaning pipeline of the <config> 
+#                                settings and the connection to the <db_path> 
+#                                database of a worker process.
+# -------------------------------------------------------------------------------------
+def init_clean_worker(db_path, config, cache_size):
+
+    """ <db_path>: Path of the SQLite database
+        <config>: Tuple of (application settings, table name, cleaned on load)
+        <cache_size>: Size of the normalisation cache (0: no cache)
+    """
+
+    global _worker_pipeline, _worker_conn
+
+    _worker_pipeline = CleanPipeline()
+    _worker_pipeline.add_clean_steps(*config)
+    if cache_size > 0:
+        _worker_pipeline.cache = NormalisationCache(cache_size, False)
+    _worker_conn = sqlite3.connect(db_path)
+
+# <clean_id_range> function - Returns the number of rows, the changed rows and the 
+#                             step times of the rows of an Id range. Runs in the 
+#                             worker processes.
+# -------------------------------------------------------------------------------------
+def clean_id_range(id_range):
+
+    """ <id_range>: Tuple of (fields, first Id, last Id + 1)
+    """
+
+    _fields, _start, _end = id_range
+    _table_name = _worker_pipeline.config[1]
+
+    _rows = _worker_conn.execute('SELECT Id, %s FROM %s WHERE Id >= ? AND Id < ? \
+                                  ORDER BY Id' % (','.join(_fields), _table_name),
+                                 (_start, _end)).fetchall()
+    _updates = _worker_pipeline.row_updates(_rows, 
+                                            _fields, 
+                                            _worker_pipeline.step_chains())
+
+    _step_times = dict(_worker_pipeline.step_times)
+    for _step_name in _worker_pipeline.step_times:
+        _worker_pipeline.step_times[_step_name] = 0.0
+
+    return len(_rows), _updates, _step_times
+
+# <json_to_tuple> function - Returns the <value> decoded from json with the lists 
+#                            converted to tuples.
+# -------------------------------------------------------------------------------------
+def json_to_tuple(value):
+
+    if isinstance(value, list):
+        return tuple([json_to_tuple(_val) for _val in value])
+    return value
+
+# <file_hash> function - Returns the SHA-1 hash of the content of the <file_path> 
+#                        file.
+# -------------------------------------------------------------------------------------
+def file_hash(file_path):
+
+    _hash = hashlib.sha1()
+    with open(file_path, 'rb') as _file:
+        for _block in iter(lambda: _file.read(1024 * 1024), ''):
+            _hash.update(_block)
+    return _hash.hexdigest()
+# -------------------------------------------------------------------------------------
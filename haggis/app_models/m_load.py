@@ -20,7 +20,33 @@ import yaml
 import csv
 import string
 import time
+import itertools
+import collections
+import multiprocessing
+import hashlib
+import zlib
+import bz2
 import tqdm
+from app_models import m_clean
+
+# The xz compressed csv files require the <lzma> module (<backports.lzma> package 
+# for Python 2.7).
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# Column types of the tables loaded from csv files. The csv values of the listed
+# columns are converted to the given type before the insertion, all the other 
+# columns are inserted as text.
+TABLE_COLUMN_TYPES = {'Htb': {'Hid': int},
+                      'Ctb': {'Cid': int, 
+                              'GREasting': float, 
+                              'GRNorthing': float},
+                      'Atb': {'Freq': int}}
 
 class AppConfig(object):
     """<AppConfig> class for loading application settings.
@@ -38,6 +64,21 @@ class AppConfig(object):
         self.cfg_db_freq_tables = True
         self.cfg_db_freq_ctb_limit = 10000
         self.cfg_db_freq_htb_limit = 10000
+        self.cfg_bulk_load = False
+        self.cfg_bulk_batch_size = 10000
+        self.cfg_load_workers = 1
+        self.cfg_csv_encoding = 'utf-8'
+        self.cfg_resume_load = False
+        self.cfg_incremental_ctb = False
+        self.cfg_clean_on_load = False
+        self.cfg_clean_pipeline = False
+        self.cfg_norm_cache_size = 0
+        self.cfg_norm_cache_persist = False
+        self.cfg_clean_workers = 1
+        self.cfg_token_tables = False
+        self.cfg_match_workers = 1
+        self.cfg_blocking_keys = []
+        self.cfg_expand_distance = 0
         # System settings
         #------------------------------------------------------------------------------
         self.cfg_gui = False
@@ -171,6 +212,38 @@ class AppConfig(object):
             self.cfg_db_freq_tables = cfg_data['db_freq_tables']
             self.cfg_db_freq_ctb_limit = cfg_data['db_freq_ctb_limit']
             self.cfg_db_freq_htb_limit = cfg_data['db_freq_htb_limit']
+            # Performance settings (optional, the class defaults are kept for 
+            # the configuration files without these settings)
+            if cfg_data.get('bulk_load') is not None:
+                self.cfg_bulk_load = cfg_data['bulk_load']
+            if cfg_data.get('bulk_batch_size') is not None:
+                self.cfg_bulk_batch_size = cfg_data['bulk_batch_size']
+            if cfg_data.get('load_workers') is not None:
+                self.cfg_load_workers = cfg_data['load_workers']
+            if cfg_data.get('csv_encoding') is not None:
+                self.cfg_csv_encoding = cfg_data['csv_encoding']
+            if cfg_data.get('resume_load') is not None:
+                self.cfg_resume_load = cfg_data['resume_load']
+            if cfg_data.get('incremental_ctb') is not None:
+                self.cfg_incremental_ctb = cfg_data['incremental_ctb']
+            if cfg_data.get('clean_on_load') is not None:
+                self.cfg_clean_on_load = cfg_data['clean_on_load']
+            if cfg_data.get('clean_pipeline') is not None:
+                self.cfg_clean_pipeline = cfg_data['clean_pipeline']
+            if cfg_data.get('norm_cache_size') is not None:
+                self.cfg_norm_cache_size = cfg_data['norm_cache_size']
+            if cfg_data.get('norm_cache_persist') is not None:
+                self.cfg_norm_cache_persist = cfg_data['norm_cache_persist']
+            if cfg_data.get('clean_workers') is not None:
+                self.cfg_clean_workers = cfg_data['clean_workers']
+            if cfg_data.get('token_tables') is not None:
+                self.cfg_token_tables = cfg_data['token_tables']
+            if cfg_data.get('match_workers') is not None:
+                self.cfg_match_workers = cfg_data['match_workers']
+            if cfg_data.get('blocking_keys') is not None:
+                self.cfg_blocking_keys = cfg_data['blocking_keys']
+            if cfg_data.get('expand_distance') is not None:
+                self.cfg_expand_distance = cfg_data['expand_distance']
             
 
             # System settings
@@ -532,12 +605,49 @@ class CsvData(object):
         self.rest_key = ''
         self.delimiter = ''
         self.quote_char = ''
+        self.bulk_load = False
+        self.batch_size = 10000
+        self.workers = 1
+        self.queue_size = 4
+        self.chunk_size = 16 * 1024 * 1024
+        self.resume = False
+        self.incremental = False
+        self.clean_rules = None
+        self.encoding = 'utf-8'
+        self.row_num = 0
+        self.rows_loaded = 0
+        self.rows_inserted = 0
+        self.rows_updated = 0
+        self.rows_deleted = 0
+        self.load_time = 0.0
     
     # <load_csv> method - loads the csv data to the SQLite database 
     # ---------------------------------------------------------------------------------   
     def load_csv(self, sqlite_db, table_name, auto_fields):
-        if auto_fields is False:
-            _csv_fp = open(self.csv_filename, 'rb')
+        if self.resume:
+            # Skip the tables completely loaded by a previous run
+            _checkpoint = self.read_checkpoint(sqlite_db, table_name)
+            if (_checkpoint is not None) and _checkpoint[2]:
+                print('<%s> table already loaded from "%s"' % (table_name,
+                                                               self.csv_filename))
+                self.rows_loaded = 0
+                self.load_time = 0.0
+                return
+
+        self.row_num = 0
+
+        if (auto_fields is False) and self.incremental and ('Cid' not in self.table_fields()):
+            # The csv rows are identified by their Cid value
+            print('<%s> table: Cid is not mapped, the csv file is loaded in full' % 
+                  (table_name,))
+            self.incremental = False
+
+        if (auto_fields is False) and self.incremental:
+            self.load_csv_incremental(sqlite_db, table_name)
+        elif (auto_fields is False) and (self.bulk_load or (self.clean_rules is not None)):
+            self.load_csv_bulk(sqlite_db, table_name)
+        elif auto_fields is False:
+            _csv_fp = CsvStream(self.csv_filename)
             _csv_fld = []
             # Read csv field names
             for _fld in self.field_names:
@@ -602,7 +712,7 @@ class CsvData(object):
                     _cur.execute(_str_exec)
                     
         else:
-            _csv_fp = open(self.csv_filename, 'rb')
+            _csv_fp = CsvStream(self.csv_filename)
             _csv_reader = csv.DictReader(_csv_fp, 
                                          fieldnames=self.field_names,
                                          restkey=self.rest_key,
@@ -633,5 +743,705 @@ class CsvData(object):
                                                                 _str_fld,
                                                                 _str_vals)
                 _cur.execute(_str_exec)
+
+        if self.resume:
+            self.save_checkpoint(sqlite_db, 
+                                 table_name, 
+                                 os.path.getsize(self.csv_filename), 
+                                 self.row_num, 
+                                 True)
+        sqlite_db.conn.commit()
+
+    # <read_checkpoint> method - Returns the (byte offset, row number, done) tuple of 
+    #                            the last committed batch of the <table_name> table 
+    #                            or None. The checkpoint of a different or modified 
+    #                            csv file is discarded with the rows loaded from it.
+    # ---------------------------------------------------------------------------------   
+    def read_checkpoint(self, sqlite_db, table_name):
+
+        """ <sqlite_db>: SQLite database 
+            <table_name>: Table name 
+        """
+
+        _cur = sqlite_db.rCur()
+        _checkpoint = _cur.execute('SELECT CsvPath, CsvSize, CsvMtime, ByteOffset, RowNum, Done \
+                                    FROM LoadCheckpoint WHERE TableName = ?', 
+                                    (table_name,)).fetchone()
+        if _checkpoint is None:
+            return None
+
+        if ((_checkpoint[0] == self.csv_filename) and
+            (_checkpoint[1] == os.path.getsize(self.csv_filename)) and
+            (_checkpoint[2] == os.path.getmtime(self.csv_filename))):
+            return (_checkpoint[3], _checkpoint[4], _checkpoint[5] == 1)
+
+        print('Reloading <%s> table, the csv file has changed' % (table_name,))
+        _cur.execute('DELETE FROM %s' % (table_name,))
+        _cur.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table_name,))
+        _cur.execute('DELETE FROM LoadCheckpoint WHERE TableName = ?', (table_name,))
+        sqlite_db.conn.commit()
+        return None
+
+    # <save_checkpoint> method - Records the <byte_offset> and <row_num> position of 
+    #                            the last loaded row of the <table_name> table. The 
+    #                            checkpoint is committed with the loaded rows.
+    # ---------------------------------------------------------------------------------   
+    def save_checkpoint(self, sqlite_db, table_name, byte_offset, row_num, done):
+
+        """ <sqlite_db>: SQLite database 
+            <table_name>: Table name 
+            <byte_offset>: Csv file position after the last loaded row
+            <row_num>: Number of the last loaded row
+            <done>: The csv file is completely loaded [Boolean]
+        """
+
+        _cur = sqlite_db.rCur()
+        _cur.execute('INSERT OR REPLACE INTO LoadCheckpoint (TableName, CsvPath, CsvSize, \
+                      CsvMtime, ByteOffset, RowNum, Done) VALUES (?,?,?,?,?,?,?)',
+                      (table_name,
+                       self.csv_filename,
+                       os.path.getsize(self.csv_filename),
+                       os.path.getmtime(self.csv_filename),
+                       byte_offset,
+                       row_num,
+                       int(done)))
+
+    # <load_csv_bulk> method - loads the csv data to the SQLite database using 
+    #                          parameterised INSERT statements. The rows are 
+    #                          inserted with <executemany> and committed in batches 
+    #                          of <batch_size> rows. If <resume> is True, a 
+    #                          checkpoint is recorded with each batch and the load 
+    #                          continues after the last committed batch.
+    # ---------------------------------------------------------------------------------   
+    def load_csv_bulk(self, sqlite_db, table_name):
+
+        """ <sqlite_db>: SQLite database 
+            <table_name>: Table name 
+        """
+
+        _start_timer = time.time() # Timer
+
+        _tb_flds = self.table_fields()
+        _str_fld = ','.join(_tb_flds)
+        _str_vals = ','.join(['?'] * len(_tb_flds))
+        _str_exec = 'INSERT INTO %s (%s) VALUES (%s)' % (table_name,
+                                                         _str_fld,
+                                                         _str_vals)
+
+        _start_offset = None
+        if self.resume:
+            _checkpoint = self.read_checkpoint(sqlite_db, table_name)
+            if _checkpoint is not None:
+                _start_offset, self.row_num = _checkpoint[0], _checkpoint[1]
+                print('Resuming <%s> table after row %i' % (table_name, self.row_num))
+
+        if (self.workers > 1) and (csv_compression(self.csv_filename) is None):
+            _rows = self.parallel_rows(table_name, _start_offset)
+        else:
+            _rows = self.serial_rows(table_name, _start_offset)
+
+        # The rows are written by this process only, in the csv order
+        _cur = sqlite_db.rCur()
+        self.rows_loaded = 0
+
+        while True:
+            _batch = list(itertools.islice(_rows, self.batch_size))
+            if not _batch:
+                break
+            _cur.executemany(_str_exec, [_row for _offset, _row in _batch])
+            self.rows_loaded += len(_batch)
+            self.row_num += len(_batch)
+            if self.resume:
+                self.save_checkpoint(sqlite_db, 
+                                     table_name, 
+                                     _batch[-1][0], 
+                                     self.row_num,
+                                     False)
+            sqlite_db.conn.commit()
+
+        self.load_time = time.time() - _start_timer # Timer
+
+        return self.rows_loaded
+
+    # <load_csv_incremental> method - loads the csv data to the <table_name> table 
+    #                                 applying only the changes of the csv file 
+    #                                 since the previous run. The rows of the csv 
+    #                                 file are kept in the <table_name>Src source 
+    #                                 table with a hash of their values, and the 
+    #                                 hash of the csv file is kept in the 
+    #                                 LoadManifest table. Only the rows with a new 
+    #                                 hash are inserted or updated and the missing 
+    #                                 rows are deleted from the source table, which 
+    #                                 is then copied to the <table_name> table.
+    #                                 Note: The rows are identified by the value of 
+    #                                 the Cid field, which must be mapped.
+    # ---------------------------------------------------------------------------------   
+    def load_csv_incremental(self, sqlite_db, table_name):
+
+        """ <sqlite_db>: SQLite database 
+            <table_name>: Table name 
+        """
+
+        _start_timer = time.time() # Timer
+
+        _src_table = table_name + 'Src'
+        _tb_flds = self.table_fields()
+        _key_index = _tb_flds.index('Cid')
+
+        self.rows_inserted = 0
+        self.rows_updated = 0
+        self.rows_deleted = 0
+
+        _cur = sqlite_db.rCur()
+
+        # Compare the hash of the csv file with the manifest, a change of the 
+        # field mapping or of the column types requires a new comparison of 
+        # the rows
+        _col_types = sorted([(_fld, _type.__name__) for _fld, _type in 
+                             TABLE_COLUMN_TYPES.get(table_name, {}).items()])
+        _file_hash = hashlib.sha1(csv_file_hash(self.csv_filename) + 
+                                  repr(self.field_names) + 
+                                  repr(_col_types) +
+                                  repr(self.encoding)).hexdigest()
+        if self.clean_rules is not None:
+            # The source rows are cleaned, a change of the cleaning rules 
+            # requires a new comparison of the rows
+            _file_hash = hashlib.sha1(_file_hash + repr(self.clean_rules)).hexdigest()
+        _manifest = _cur.execute('SELECT FileHash FROM LoadManifest WHERE TableName = ?', 
+                                 (table_name,)).fetchone()
+
+        if (_manifest is not None) and (_manifest[0] == _file_hash):
+            print('<%s> csv file unchanged since the last run' % (table_name,))
+        else:
+            # Row hashes of the previous run, the key of a row is its Cid value 
+            # and its occurrence number (duplicate values in the csv file)
+            _src_rows = {}
+            _key_cnt = collections.Counter()
+            for _src_row in _cur.execute('SELECT Id, Cid, RowHash FROM %s ORDER BY Id' % 
+                                         (_src_table,)):
+                _key_cnt[_src_row[1]] += 1
+                _src_rows[(_src_row[1], _key_cnt[_src_row[1]])] = (_src_row[0], _src_row[2])
+
+            _str_ins = 'INSERT INTO %s (%s,RowHash) VALUES (%s)' % (_src_table,
+                                                                   ','.join(_tb_flds),
+                                                                   ','.join(['?'] * (len(_tb_flds) + 1)))
+            _str_upd = 'UPDATE %s SET %s,RowHash = ? WHERE Id = ?' % (_src_table,
+                                                                     ','.join([_fld + ' = ?' for _fld in _tb_flds]))
+
+            _key_cnt = collections.Counter()
+            _ins_rows = []
+            _upd_rows = []
+            for _offset, _row in self.serial_rows(table_name, None):
+                _key = _row[_key_index]
+                _key_cnt[_key] += 1
+                _row_hash = hashlib.sha1(repr(_row)).hexdigest()
+                _src_row = _src_rows.pop((_key, _key_cnt[_key]), None)
+                if _src_row is None:
+                    _ins_rows.append(_row + (_row_hash,))
+                elif _src_row[1] != _row_hash:
+                    _upd_rows.append(_row + (_row_hash, _src_row[0]))
+
+                if len(_ins_rows) >= self.batch_size:
+                    _cur.executemany(_str_ins, _ins_rows)
+                    self.rows_inserted += len(_ins_rows)
+                    _ins_rows = []
+                if len(_upd_rows) >= self.batch_size:
+                    _cur.executemany(_str_upd, _upd_rows)
+                    self.rows_updated += len(_upd_rows)
+                    _upd_rows = []
+
+            _cur.executemany(_str_ins, _ins_rows)
+            self.rows_inserted += len(_ins_rows)
+            _cur.executemany(_str_upd, _upd_rows)
+            self.rows_updated += len(_upd_rows)
+
+            # Rows missing from the csv file
+            _cur.executemany('DELETE FROM %s WHERE Id = ?' % (_src_table,), 
+                             [(_src_row[0],) for _src_row in _src_rows.values()])
+            self.rows_deleted = len(_src_rows)
+
+            _cur.execute('INSERT OR REPLACE INTO LoadManifest (TableName, CsvPath, FileHash) \
+                          VALUES (?,?,?)', (table_name, self.csv_filename, _file_hash))
+            sqlite_db.conn.commit()
+
+        # Copy the source rows to the table keeping their Ids
+        _cur.execute('DELETE FROM %s' % (table_name,))
+        _cur.execute('INSERT INTO %s (Id,%s) SELECT Id,%s FROM %s ORDER BY Id' % 
+                     (table_name, 
+                      ','.join(_tb_flds), 
+                      ','.join(_tb_flds), 
+                      _src_table))
+        self.rows_loaded = _cur.execute('SELECT COUNT(*) FROM %s' % (table_name,)).fetchone()[0]
+        self.row_num = self.rows_loaded
         sqlite_db.conn.commit()
-# -------------------------------------------------------------------------------------
\ No newline at end of file
+
+        self.load_time = time.time() - _start_timer # Timer
+
+        return self.rows_loaded
+
+    # <table_fields> method - Returns the table fields of the values generated by 
+    #                         the <serial_rows> and <parallel_rows> methods. The 
+    #                         Num field is added to the mapped fields if the rows 
+    #                         are cleaned while loading.
+    # ---------------------------------------------------------------------------------   
+    def table_fields(self):
+
+        _tb_flds = [_fld[0] for _fld in self.field_names]
+        if (self.clean_rules is not None) and ('Num' not in _tb_flds):
+            _tb_flds.append('Num')
+        return _tb_flds
+
+    # <read_csv_header> method - Returns the csv field names and the byte offset of 
+    #                            the first row following the heading row.
+    # ---------------------------------------------------------------------------------   
+    def read_csv_header(self):
+
+        _csv_fp = CsvStream(self.csv_filename)
+        _csv_header = next(csv.reader([_csv_fp.readline()],
+                                      delimiter=self.delimiter, 
+                                      quotechar=self.quote_char))
+        _offset = _csv_fp.tell()
+        _csv_fp.close()
+        return _csv_header, _offset
+
+    # <serial_rows> method - Generates the (byte offset, values) tuples inserted by 
+    #                        the <load_csv_bulk> method parsing the csv file in the
+    #                        current process from the <start_offset> position. 
+    #                        The progress is reported on the bytes read from the 
+    #                        disk (compressed bytes for compressed csv files).
+    # ---------------------------------------------------------------------------------   
+    def serial_rows(self, table_name, start_offset):
+
+        """ <table_name>: Table name 
+            <start_offset>: Csv file position of the first row to load or None
+        """
+
+        _csv_header, _first_offset = self.read_csv_header()
+        if start_offset is None:
+            start_offset = _first_offset
+
+        _csv_fp = CsvStream(self.csv_filename)
+        _csv_fp.seek(start_offset)
+        _csv_lines = CsvLines(_csv_fp, None)
+        _csv_reader = csv.DictReader(_csv_lines,
+                                     fieldnames=_csv_header,
+                                     delimiter=self.delimiter, 
+                                     quotechar=self.quote_char)
+        _csv_rows = _csv_reader
+        if start_offset == _first_offset:
+            # Skip heading row
+            _csv_rows = itertools.islice(_csv_rows, 1, None)
+
+        _progress = tqdm.tqdm(desc='Progress', 
+                              total=os.path.getsize(self.csv_filename),
+                              unit='B',
+                              unit_scale=True)
+        _progress.update(_csv_fp.disk_tell())
+        try:
+            for _cnt, _row in enumerate(map_csv_rows(_csv_rows, 
+                                                     self.field_names, 
+                                                     table_name,
+                                                     self.clean_rules,
+                                                     self.encoding)):
+                if _cnt % 1000 == 0:
+                    _progress.update(_csv_fp.disk_tell() - _progress.n)
+                yield (_csv_lines.offset, _row)
+            _progress.update(_csv_fp.disk_tell() - _progress.n)
+        finally:
+            _progress.close()
+            _csv_fp.close()
+
+    # <parallel_rows> method - Generates the (byte offset, values) tuples inserted by 
+    #                          the <load_csv_bulk> method from the <start_offset> 
+    #                          position. The csv file is split into byte-range 
+    #                          chunks on line boundaries and the chunks are parsed 
+    #                          by a pool of <workers> processes. At most 
+    #                          <queue_size> parsed chunks are held in memory and the 
+    #                          rows are generated in the csv order.
+    #                          Note: Quoted csv values must not contain line breaks.
+    # ---------------------------------------------------------------------------------   
+    def parallel_rows(self, table_name, start_offset):
+
+        """ <table_name>: Table name 
+            <start_offset>: Csv file position of the first row to load or None
+        """
+
+        _csv_header, _first_offset = self.read_csv_header()
+        if start_offset is None:
+            start_offset = _first_offset
+
+        _chunks = []
+        for _start, _end in csv_chunks(self.csv_filename, start_offset, self.chunk_size):
+            _chunks.append((self.csv_filename,
+                            _start,
+                            _end,
+                            _csv_header,
+                            self.delimiter,
+                            self.quote_char,
+                            self.field_names,
+                            table_name,
+                            _start == _first_offset, # Skip heading row
+                            self.clean_rules,
+                            self.encoding))
+
+        _pool = multiprocessing.Pool(self.workers)
+        _pending = collections.deque()
+        try:
+            for _chunk in tqdm.tqdm(_chunks, 'Progress', len(_chunks), True):
+                _pending.append(_pool.apply_async(parse_csv_chunk, (_chunk,)))
+                if len(_pending) >= self.queue_size:
+                    for _row in _pending.popleft().get():
+                        yield _row
+            while _pending:
+                for _row in _pending.popleft().get():
+                    yield _row
+            _pool.close()
+        finally:
+            _pool.terminate()
+            _pool.join()
+# -------------------------------------------------------------------------------------
+
+class CsvStream(object):
+    """<CsvStream> class for reading a plain or compressed (gzip, bz2, xz) csv file 
+       as a stream of lines without expanding it to the disk.
+    """
+    # Constructor: Opens the <csv_filename> file. The compression is chosen by 
+    # the <csv_compression> function.
+    # ---------------------------------------------------------------------------------
+    def __init__(self, csv_filename):
+        self.csv_filename = csv_filename
+        self.compression = csv_compression(csv_filename)
+        if (self.compression == 'xz') and (lzma is None):
+            raise IOError('The lzma module is required for reading "%s"' % (csv_filename,))
+        self.raw_fp = open(csv_filename, 'rb')
+        self.rewind()
+
+    # <rewind> method - Restarts the stream from the start of the file.
+    # ---------------------------------------------------------------------------------
+    def rewind(self):
+        self.raw_fp.seek(0)
+        self.decompressor = self.new_decompressor()
+        self.buffer = ''
+        self.buffer_pos = 0
+        self.offset = 0
+
+    # <new_decompressor> method - Returns a decompressor of a compressed stream or 
+    #                             None for plain csv files.
+    # ---------------------------------------------------------------------------------
+    def new_decompressor(self):
+        if self.compression == 'gz':
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self.compression == 'bz2':
+            return bz2.BZ2Decompressor()
+        if self.compression == 'xz':
+            return lzma.LZMADecompressor()
+        return None
+
+    # <fill_buffer> method - Decompresses the next block of the file into the line 
+    #                        buffer. Returns False at the end of file.
+    # ---------------------------------------------------------------------------------
+    def fill_buffer(self):
+        _data = self.raw_fp.read(1024 * 1024)
+        if not _data:
+            return False
+        _out = []
+        while _data:
+            try:
+                _out.append(self.decompressor.decompress(_data))
+            except EOFError:
+                # Concatenated compressed streams
+                self.decompressor = self.new_decompressor()
+                continue
+            _data = self.decompressor.unused_data
+            if _data:
+                self.decompressor = self.new_decompressor()
+        self.buffer = self.buffer[self.buffer_pos:] + ''.join(_out)
+        self.buffer_pos = 0
+        return True
+
+    # <readline> method - Returns the next line of the csv file ('' at the end).
+    # ---------------------------------------------------------------------------------
+    def readline(self):
+        if self.decompressor is None:
+            _line = self.raw_fp.readline()
+        else:
+            _end = self.buffer.find('\n', self.buffer_pos)
+            while (_end == -1) and self.fill_buffer():
+                _end = self.buffer.find('\n', self.buffer_pos)
+            if _end == -1:
+                _end = len(self.buffer)
+            else:
+                _end += 1
+            _line = self.buffer[self.buffer_pos:_end]
+            self.buffer_pos = _end
+        self.offset += len(_line)
+        return _line
+
+    # <seek> method - Moves to the <offset> position of the decompressed stream. 
+    #                 Compressed streams are read up to the position.
+    # ---------------------------------------------------------------------------------
+    def seek(self, offset):
+        if self.decompressor is None:
+            self.raw_fp.seek(offset)
+            self.offset = offset
+            return
+        if offset < self.offset:
+            self.rewind()
+        while self.offset < offset:
+            if self.buffer_pos == len(self.buffer) and not self.fill_buffer():
+                break
+            _skip = min(offset - self.offset, len(self.buffer) - self.buffer_pos)
+            self.buffer_pos += _skip
+            self.offset += _skip
+
+    # <tell> method - Returns the position of the decompressed stream.
+    # ---------------------------------------------------------------------------------
+    def tell(self):
+        return self.offset
+
+    # <disk_tell> method - Returns the position of the file on the disk.
+    # ---------------------------------------------------------------------------------
+    def disk_tell(self):
+        return self.raw_fp.tell()
+
+    def close(self):
+        self.raw_fp.close()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        _line = self.readline()
+        if not _line:
+            raise StopIteration
+        return _line
+# -------------------------------------------------------------------------------------
+
+class CsvLines(object):
+    """<CsvLines> class for iterating the lines of an open csv file keeping the byte 
+       offset following the last read line.
+    """
+    # Constructor: Iterates the lines of <csv_fp> from its current position up to 
+    # the <end> byte offset (None for the end of file).
+    # ---------------------------------------------------------------------------------
+    def __init__(self, csv_fp, end):
+        self.csv_fp = csv_fp
+        self.offset = csv_fp.tell()
+        self.end = end
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if (self.end is not None) and (self.offset >= self.end):
+            raise StopIteration
+        _line = self.csv_fp.readline()
+        if not _line:
+            raise StopIteration
+        self.offset += len(_line)
+        return _line
+# -------------------------------------------------------------------------------------
+
+# <csv_chunks> function - Returns the (start, end) byte ranges of the csv file rows
+#                         following the <start_offset> position split into chunks 
+#                         of about <chunk_size> bytes. The ranges end on line 
+#                         boundaries.
+# -------------------------------------------------------------------------------------
+def csv_chunks(csv_filename, start_offset, chunk_size):
+
+    """ <csv_filename>: Path of the csv file
+        <start_offset>: Csv file position of the first row
+        <chunk_size>: Size of the chunks in bytes
+    """
+
+    _chunks = []
+    _csv_size = os.path.getsize(csv_filename)
+    _csv_fp = open(csv_filename, 'rb')
+    _start = start_offset
+    while _start < _csv_size:
+        _csv_fp.seek(min(_start + chunk_size, _csv_size) - 1)
+        _csv_fp.readline()
+        _end = _csv_fp.tell()
+        _chunks.append((_start, _end))
+        _start = _end
+    _csv_fp.close()
+    return _chunks
+
+# <csv_compression> function - Returns the compression of a csv file ('gz', 'bz2', 
+#                              'xz') or None for plain csv files. The compression is 
+#                              chosen by the file extension or the magic bytes.
+# -------------------------------------------------------------------------------------
+def csv_compression(csv_filename):
+
+    """ <csv_filename>: Path of the csv file
+    """
+
+    _ext = os.path.splitext(csv_filename)[1].lower()
+    if _ext in ('.gz', '.gzip'):
+        return 'gz'
+    if _ext in ('.bz2',):
+        return 'bz2'
+    if _ext in ('.xz', '.lzma'):
+        return 'xz'
+
+    _csv_fp = open(csv_filename, 'rb')
+    _magic = _csv_fp.read(6)
+    _csv_fp.close()
+    if _magic.startswith('\x1f\x8b'):
+        return 'gz'
+    if _magic.startswith('BZh'):
+        return 'bz2'
+    if _magic.startswith('\xfd7zXZ\x00'):
+        return 'xz'
+    return None
+
+# <csv_file_hash> function - Returns the SHA-1 hash of the content of a csv file.
+# -------------------------------------------------------------------------------------
+def csv_file_hash(csv_filename):
+
+    """ <csv_filename>: Path of the csv file
+    """
+
+    _hash = hashlib.sha1()
+    _csv_fp = open(csv_filename, 'rb')
+    for _block in iter(lambda: _csv_fp.read(1024 * 1024), ''):
+        _hash.update(_block)
+    _csv_fp.close()
+    return _hash.hexdigest()
+
+# <parse_csv_chunk> function - Parses the rows of a csv byte-range chunk and returns 
+#                              the list of (byte offset, values) tuples inserted by 
+#                              the <load_csv_bulk> method. Runs in the worker 
+#                              processes.
+# -------------------------------------------------------------------------------------
+def parse_csv_chunk(chunk):
+
+    """ <chunk>: Tuple of (csv path, start, end, csv field names, delimiter, 
+                 quote char, field mapping, table name, skip first row, 
+                 cleaning rules, csv encoding)
+    """
+
+    (_csv_filename, _start, _end, _csv_header, _delimiter, _quote_char, 
+     _field_names, _table_name, _skip_first, _clean_rules, _encoding) = chunk
+
+    _csv_fp = open(_csv_filename, 'rb')
+    _csv_fp.seek(_start)
+    _csv_lines = CsvLines(_csv_fp, _end)
+
+    _csv_rows = csv.DictReader(_csv_lines,
+                               fieldnames=_csv_header,
+                               delimiter=_delimiter,
+                               quotechar=_quote_char)
+    if _skip_first:
+        _csv_rows = itertools.islice(_csv_rows, 1, None)
+
+    _rows = [(_csv_lines.offset, _row) 
+             for _row in map_csv_rows(_csv_rows, 
+                                      _field_names, 
+                                      _table_name, 
+                                      _clean_rules,
+                                      _encoding)]
+    _csv_fp.close()
+
+    return _rows
+
+# <map_csv_rows> function - Generates the tuples of values of the <csv_rows> rows.
+#                           The contemporary addresses without coordinates are 
+#                           skipped. If <clean_rules> is set, the values are 
+#                           cleaned as by the cleaning stage and the Num value is 
+#                           added if Num is not a mapped field.
+# -------------------------------------------------------------------------------------
+def map_csv_rows(csv_rows, field_names, table_name, clean_rules=None, encoding='utf-8'):
+
+    """ <csv_rows>: Iterable of csv rows (dictionaries)
+        <field_names>: List of (table field, csv field) tuples
+        <table_name>: Table name 
+        <clean_rules>: Tuple of (fields to clean, lowercase, strip whitespaces, 
+                       remove punctuation, remove Street address numbers) or None
+        <encoding>: Encoding of the csv file
+    """
+
+    _col_types = TABLE_COLUMN_TYPES.get(table_name, {})
+
+    # Csv fields that must have a value for a contemporary address
+    _csv_coords = [_fld[1] for _fld in field_names 
+                   if _fld[0] in ('GREasting', 'GRNorthing')]
+    _clean = m_clean.Clean()
+
+    for _row in csv_rows:
+        if table_name == 'Ctb':
+            if '' in [_row[_fld] for _fld in _csv_coords]:
+                continue
+        if clean_rules is None:
+            yield map_csv_row(_row, field_names, _col_types, encoding)
+        else:
+            yield clean_csv_row(map_csv_row(_row, field_names, _col_types, encoding), 
+                                field_names, 
+                                clean_rules,
+                                _clean)
+
+# <map_csv_row> function - Returns the tuple of values of a csv <row> in the order 
+#                          of the <field_names> mapping. The values of the columns 
+#                          in <col_types> are converted to the column type. The
+#                          strings are decoded from <encoding>; the undecodable
+#                          bytes are replaced and the row is reported.
+# -------------------------------------------------------------------------------------
+def map_csv_row(row, field_names, col_types, encoding='utf-8'):
+
+    """ <row>: Csv row (dictionary)
+        <field_names>: List of (table field, csv field) tuples
+        <col_types>: Dictionary of table field types
+        <encoding>: Encoding of the csv file
+    """
+
+    _vals = []
+    for _fld in field_names:
+        # The apostrophes are removed as in the <load_csv> method, the cleaning 
+        # methods still build quoted sql strings with these values.
+        _val = row[_fld[1]].replace("'","")
+        if _fld[0] in col_types:
+            try:
+                _val = col_types[_fld[0]](_val)
+            except ValueError:
+                pass
+        if isinstance(_val, str):
+            try:
+                _val = _val.decode(encoding)
+            except UnicodeDecodeError:
+                print('Csv field <%s> is not %s encoded in row: %r' % (_fld[1],
+                                                                      encoding,
+                                                                      row))
+                _val = _val.decode(encoding, 'replace')
+        _vals.append(_val)
+    return tuple(_vals)
+# -------------------------------------------------------------------------------------
+
+# <clean_csv_row> function - Returns the tuple of <values> of a csv row cleaned by 
+#                            the <clean_row> method of the cleaning stage. The Num 
+#                            value is added if Num is not a mapped field.
+# -------------------------------------------------------------------------------------
+def clean_csv_row(values, field_names, clean_rules, clean):
+
+    """ <values>: Tuple of values in the order of the <field_names> mapping
+        <field_names>: List of (table field, csv field) tuples
+        <clean_rules>: Tuple of (fields to clean, lowercase, strip whitespaces, 
+                       remove punctuation, remove Street address numbers)
+        <clean>: <Clean> instance
+    """
+
+    _tb_flds = [_fld[0] for _fld in field_names]
+    _row = dict(zip(_tb_flds, values))
+    _row.setdefault('Num', None)
+
+    _clean_fields, _lowercase, _strip_white, _rm_punctuation, _rm_address_num = clean_rules
+    clean.clean_row(_row,
+                    _clean_fields,
+                    _lowercase,
+                    _strip_white,
+                    _rm_punctuation,
+                    _rm_address_num)
+
+    if 'Num' not in _tb_flds:
+        _tb_flds.append('Num')
+    return tuple([_row[_fld] for _fld in _tb_flds])
+# -------------------------------------------------------------------------------------
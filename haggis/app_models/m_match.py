@@ -15,17 +15,32 @@
 
 # -------------------------------------------------------------------------------------
 # Import necessary modules
+import os
 import string
+import time
+import hashlib
 import sqlite3
 import collections
 import itertools
 import operator
 import csv
+import multiprocessing
 
 from Levenshtein import setratio, distance
 from app_models import m_tokenise, m_spatial
+import db.dbTools as DB
 import cProfile
 
+# Maximum number of cached token edit-distances (see <token_distance>)
+DISTANCE_CACHE_SIZE = 1000000
+
+# Blocking keys of the Htb/Ctb candidates: key name -> (Ctb field, Htb field)
+# (see <BlockingIndex>)
+BLOCKING_FIELDS = {'DistCode': ('DistCode', 'DistCode'),
+                   'Locality': ('Locality', 'Locality'),
+                   'Town': ('Town', 'Town'),
+                   'PCode': ('CPCode', 'HPCode')}
+
 class Match(object):
     """<Match> class for matching the <Htb> and <Ctb> address tokens
     """
@@ -34,6 +49,14 @@ class Match(object):
     def __init__(self):
         self.ctb_freq_tokens = []
         self.htb_freq_tokens = []
+        self.distance_vocabulary = None
+        self.distance_cache = {}
+        self.vocabulary = None
+        self.ctb_store = None
+        self.ctb_full_store = None
+        self.score_settings = None
+        self.ctb_blocks = None
+        self.ctb_trigrams = None
 
     # PROFILER................................
     def do_cprofile(func):
@@ -63,7 +86,11 @@ class Match(object):
                         freq_ctb_limit,
                         freq_htb_limit,
                         filter_locality,
-                        filter_town):
+                        filter_town,
+                        workers=1,
+                        batch_size=1000,
+                        blocking_keys=None,
+                        expand_distance=0):
 
         """ <sqlite_db>:  SQLite database
             <distance_type>: Type of string distance algorithm 
@@ -82,6 +109,16 @@ class Match(object):
             <freq_htb_limit>: Limit of token frequency for the Htb table
             <filter_locality>: Block with Locality field [Boolean]
             <filter_town>: Block with Town field [Boolean]
+            <workers>: Number of processes scoring the Htb rows (1: no worker 
+                       processes)
+            <batch_size>: Number of Htb Ids of the partitions scored by the 
+                          worker processes
+            <blocking_keys>: List of the blocking keys of the candidates 
+                             (DistCode, Locality, Town, PCode), None for no 
+                             blocking
+            <expand_distance>: Maximum edit distance of the Ctb tokens added to the 
+                               candidate query for each Htb token missing from the 
+                               Ctb tokens (0: no expansion)
         """
 
         if freq_tables:
@@ -92,33 +129,9 @@ class Match(object):
                                    use_alias)
 
         _cur = sqlite_db.rCur()
-        # Select all RowID from Htb table
-        _htb_ids = _cur.execute('SELECT Id, Locality, Town FROM Htb').fetchall()        
-
-        _num_matches = 0
-
-        # Create virtual table for Ctb.
-        con = sqlite3.connect(":memory:")
-        con.execute("CREATE VIRTUAL TABLE CtbMem USING fts3(Name,Street,Locality,Town)")
 
-        # Copy Ctb records to the new virtual table.
-        _cur.execute('SELECT Id,Name,Street,Locality,Town FROM Ctb') 
-        _ctb_ids = _cur.fetchall()
-
-        for _ctb_row in _ctb_ids:
-            _str_fld = 'docid,Name,Street,Locality,Town'
-            _str_vals = str(_ctb_row[0]) + ','
-            _str_vals += '\'' + _ctb_row[1] + '\','
-            _str_vals += '\'' + _ctb_row[2] + '\','
-            _str_vals += '\'' + _ctb_row[3] + '\','
-            _str_vals += '\'' + _ctb_row[4] + '\''
-
-            _str_exec = 'INSERT INTO %s (%s) VALUES (%s)' % ('CtbMem',
-                                                              _str_fld,
-                                                              _str_vals) 
-            con.execute(_str_exec)
-
-        #_ctb_mem_ids = con.execute('SELECT * FROM CtbMem') 
+        # Full-text index of Ctb (rebuilt only if the Ctb rows have changed)
+        self.ctb_fts_index(sqlite_db)
 
         if use_freq_tables:
             # Select tokens with freq > freq_htb_limit
@@ -129,226 +142,33 @@ class Match(object):
             _cur.execute("SELECT Token FROM HtbFreq") 
             _freq_htb_tokens = _cur.fetchall()
 
-        _freq_tokens = []
+        _freq_tokens = set()
         for _token in _freq_htb_tokens:
-            _freq_tokens.append(_token[0]) 
-        
-        _tuple_ids = []
-        _unmatched_ids = []
-
-        _cnt_htb_row = 0
-
-        # For each row in Htb
-        for _htb_row in _htb_ids:
-            _cnt_htb_row += 1
-            _htb_tokenise = m_tokenise.Tokenise()
-            _htb_tokenise.tokenise_address(sqlite_db,
-                                            'Htb', 
-                                            _htb_row[0],
-                                            False,
-                                            False,
-                                            True,
-                                            False,
-                                            False,
-                                            False)
-
-            if _htb_tokenise.is_tokenised:
-                
-                _tot_ids = []
-                _tot_token = ''
-                for  _token in _htb_tokenise.tokens:
-                    if (len(_token) > 0) and (_token not in _freq_tokens):
-                        _tot_token = _tot_token + _token + ' OR '
-                _tot_token = _tot_token[:-4]
-                _tot_token = '\'' + _tot_token + '\''
-                if (filter_locality == True) and (filter_town == True):
-                    _ctb_ids = con.execute("SELECT docid FROM CtbMem WHERE Street MATCH %s AND \
-                                            Locality = '%s' AND Town = '%s'" % (_tot_token,
-                                                                                _htb_row[1],
-                                                                                _htb_row[2])).fetchall()
-                elif (filter_locality == True) and (filter_town == False):
-                    _ctb_ids = con.execute("SELECT docid FROM CtbMem WHERE Street MATCH %s AND \
-                                            Locality = '%s'" % (_tot_token,
-                                                                _htb_row[1])).fetchall()
-                elif (filter_locality == False) and (filter_town == True):
-                    _ctb_ids = con.execute("SELECT docid FROM CtbMem WHERE Street MATCH %s AND \
-                                            Town = '%s'" % (_tot_token,
-                                                            _htb_row[2])).fetchall()
-                else:
-                    _ctb_ids = con.execute("SELECT docid FROM CtbMem WHERE Street MATCH %s" % (_tot_token,)).fetchall()
-
-                    
-                if _ctb_ids == []:
-                    # Select RowIDs from Ctb table (use Name)
-                    _ctb_ids = con.execute("SELECT docid FROM CtbMem WHERE Name MATCH %s" % (_tot_token,)).fetchall()
-                
-                _no_ids = False
-                if _ctb_ids == []:
-                    # Raise True for empty id list
-                    _no_ids = True
-                    
-                    
-                _scores = {}       
-                _cnt = len(_ctb_ids)
-                print(str(_cnt_htb_row) + ': ' + str(_cnt) + ' M:' + str(_num_matches))
-                if not _no_ids:
-                    # For each row in Ctb       
-                    for _ctb_row in _ctb_ids:
-                                              
-                        _ctb_tokenise = m_tokenise.Tokenise()
-                        if (_htb_row[1] is None) and (_htb_row[2] is None):
-                            _ctb_tokenise.tokenise_address(sqlite_db,
-                                                           'Ctb', 
-                                                           _ctb_row[0],
-                                                           True,
-                                                           False,
-                                                           True,
-                                                           True,
-                                                           True,
-                                                           False)
-                        else:
-                            _ctb_tokenise.tokenise_address(sqlite_db,
-                                                           'Ctb', 
-                                                           _ctb_row[0],
-                                                           True,
-                                                           False,
-                                                           True,
-                                                           False,
-                                                           False,
-                                                           False)
-                         
-                        _tmp_score = self.matching_distance(_htb_tokenise.tokens,
-                                                            _ctb_tokenise.tokens,
-                                                            0)
-                         
-                        if _tmp_score == 1:
-                            _scores.update({_ctb_row[0] : _tmp_score * 100})
-                            break
-                        elif _tmp_score >= matching_threshold:
-                            _scores.update({_ctb_row[0] : _tmp_score * 100})
-
-                    if len(_scores) > 0:
-                        _max_score_row = max(_scores, key=_scores.get)
-                        _max_score_val = _scores[_max_score_row]
-                        _tuple_ids.append((_htb_row[0], 
-                                           _max_score_row, 
-                                           _max_score_val))
-                        _num_matches += 1
-                    else:
-                        _unmatched_ids.append(_htb_row[0])
-                        _max_score_row = 0
-                        _max_score_val = 0
-  
-                    # 
-                    # Write automated matching results to <Ttb> table
-                    if len(_tuple_ids) > 1000:
-                        # Matched addresses
-                        for _ids in _tuple_ids:
-                            _htb_data = _cur.execute("SELECT * FROM Htb WHERE Id = ?", (_ids[0],)).fetchall()
-                            _ctb_data = _cur.execute("SELECT * FROM Ctb WHERE Id = ?", (_ids[1],)).fetchall()
-                            _cur.execute("INSERT INTO Stb (Name,Street,HPCode,Locality,Town) VALUES (?,?,?,?,?)", 
-                                         (str(_htb_data[0][2]),
-                                          str(_htb_data[0][4]),
-                                          str(_htb_data[0][5]),
-                                          str(_ctb_data[0][6]),
-                                          str(_ctb_data[0][7])))
-                            _ins_record = _cur.execute("SELECT SNId FROM Stb ORDER BY SNId DESC LIMIT 1").fetchall()
-                            _cur.execute("INSERT INTO Ttb (Cid,Hid,Num,SNId,CPCode,GREasting,GRNorthing, \
-                                          StartYear,AutoEval,DistCode,Status) VALUES (?,?,?,?,?,?,?,?,?,?,?)", 
-                                          (_ctb_data[0][1],
-                                           _htb_data[0][1],
-                                           str(_htb_data[0][3]),
-                                           _ins_record[0][0],
-                                           str(_ctb_data[0][5]),
-                                           _ctb_data[0][8],
-                                           _ctb_data[0][9],
-                                           str(_htb_data[0][8]),
-                                           (_ids[2]),
-                                           str(_htb_data[0][9]),
-                                           100))
-                        print('Partial save of 1000 matches!')
-                        
-                        # Empty 1000 matches list
-                        _tuple_ids = [] 
-
-                    if len(_unmatched_ids) > 1000:
-                        # Unmatched addresses
-                        for _ids in _unmatched_ids:
-                            _htb_data = _cur.execute("SELECT * FROM Htb WHERE Id = ?", (_ids,)).fetchall()
-                            _cur.execute("INSERT INTO Stb (Name,Street,HPCode) VALUES (?,?,?)", 
-                                         (str(_htb_data[0][2]),
-                                          str(_htb_data[0][4]),
-                                          str(_htb_data[0][5])))
-                            _ins_record = _cur.execute("SELECT SNId FROM Stb ORDER BY SNId DESC LIMIT 1").fetchall()
-                            _cur.execute("INSERT INTO Ttb (Hid,Num,SNId, \
-                                          StartYear,AutoEval,DistCode,Status) VALUES (?,?,?,?,?,?,?)", 
-                                          (_htb_data[0][1],
-                                           str(_htb_data[0][3]),
-                                           _ins_record[0][0],
-                                           str(_htb_data[0][8]),
-                                           0,
-                                           str(_htb_data[0][9]),
-                                           101))
-                        sqlite_db.conn.commit()
-                        print('Partial save of 1000 matches!')
-                        
-                        # Empty 1000 no-matches list
-                        _unmatched_ids = []
-                else:
-                    _unmatched_ids.append(_htb_row[0])
-                
-            else:
-                _unmatched_ids.append(_htb_row[0])
+            _freq_tokens.add(_token[0]) 
+
+        # Token ids of the Ctb candidates (shared by the worker processes)
+        self.init_scoring(sqlite_db,
+                          (matching_threshold,
+                           filter_locality,
+                           filter_town,
+                           _freq_tokens,
+                           tuple(blocking_keys or ()),
+                           expand_distance))
+
+        # Path of the database file ('' for a memory database)
+        _db_path = [_row[2] for _row in _cur.execute('PRAGMA database_list') 
+                    if _row[1] == 'main'][0]
+
+        if (workers > 1) and _db_path:
+            _scores = self.parallel_scores(sqlite_db, 
+                                           _db_path, 
+                                           workers, 
+                                           batch_size)
+        else:
+            _scores = self.serial_scores(sqlite_db)
 
-        # Write the last set of automated matching results to <Ttb> table
-        if len(_tuple_ids) > 0:
-            # Matched addresses
-            for _ids in _tuple_ids:
-                _htb_data = _cur.execute("SELECT * FROM Htb WHERE Id = ?", (_ids[0],)).fetchall()
-                _ctb_data = _cur.execute("SELECT * FROM Ctb WHERE Id = ?", (_ids[1],)).fetchall()
-                _cur.execute("INSERT INTO Stb (Name,Street,HPCode,Locality,Town) VALUES (?,?,?,?,?)", 
-                                (str(_htb_data[0][2]),
-                                str(_htb_data[0][4]),
-                                str(_htb_data[0][5]),
-                                str(_ctb_data[0][6]),
-                                str(_ctb_data[0][7])))
-                _ins_record = _cur.execute("SELECT SNId FROM Stb ORDER BY SNId DESC LIMIT 1").fetchall()
-                _cur.execute("INSERT INTO Ttb (Cid,Hid,Num,SNId,CPCode,GREasting,GRNorthing, \
-                                StartYear,AutoEval,DistCode,Status) VALUES (?,?,?,?,?,?,?,?,?,?,?)", 
-                                (_ctb_data[0][1],
-                                _htb_data[0][1],
-                                str(_htb_data[0][3]),
-                                _ins_record[0][0],
-                                str(_ctb_data[0][5]),
-                                _ctb_data[0][8],
-                                _ctb_data[0][9],
-                                str(_htb_data[0][8]),
-                                (_ids[2]),
-                                str(_htb_data[0][9]),
-                                100))
-            sqlite_db.conn.commit()
-
-        if len(_unmatched_ids) > 0:
-            # Unmatched addresses
-            for _ids in _unmatched_ids:
-                _htb_data = _cur.execute("SELECT * FROM Htb WHERE Id = ?", (_ids,)).fetchall()
-                _cur.execute("INSERT INTO Stb (Name,Street,HPCode) VALUES (?,?,?)", 
-                                (str(_htb_data[0][2]),
-                                str(_htb_data[0][4]),
-                                str(_htb_data[0][5])))
-                _ins_record = _cur.execute("SELECT SNId FROM Stb ORDER BY SNId DESC LIMIT 1").fetchall()
-                _cur.execute("INSERT INTO Ttb (Hid,Num,SNId, \
-                                StartYear,AutoEval,DistCode,Status) VALUES (?,?,?,?,?,?,?)", 
-                                (_htb_data[0][1],
-                                str(_htb_data[0][3]),
-                                _ins_record[0][0],
-                                str(_htb_data[0][8]),
-                                0,
-                                str(_htb_data[0][9]),
-                                101))
-                        
-            sqlite_db.conn.commit()
-        print('Save the last set of address matches!')
+        # Write automated matching results to <Ttb> table (Htb Id order)
+        self.save_scores(sqlite_db, _scores)
 
         # Create HEvents column and update with num of events using <Htb> table - 
         # <CntEvents> column
@@ -374,6 +194,351 @@ class Match(object):
                                 (hid_rec[0][2],tid[0])) 
         sqlite_db.conn.commit()
 
+    # <init_scoring> method - Loads the Ctb token stores (see <ctb_token_store>) 
+    #                         and sets the <settings> of the scoring of the Htb rows.
+    # ---------------------------------------------------------------------------------   
+    def init_scoring(self,
+                     sqlite_db,
+                     settings):
+
+        """ <sqlite_db>:  SQLite database
+            <settings>: Tuple of (matching threshold, filter locality, filter town,
+                        set of the frequent Htb tokens, blocking keys, 
+                        expand distance)
+        """
+
+        self.vocabulary = m_tokenise.TokenVocabulary()
+        self.score_settings = settings
+
+        # Token ids of the Ctb candidates without and with the Locality and Town
+        # tokens
+        self.ctb_store = self.ctb_token_store(sqlite_db, self.vocabulary, False)
+        self.ctb_full_store = self.ctb_token_store(sqlite_db, self.vocabulary, True)
+
+        # Ctb candidate blocks of the blocking keys
+        self.ctb_blocks = None
+        if settings[4]:
+            self.ctb_blocks = self.ctb_blocking_index(sqlite_db, settings[4])
+
+        # Trigram index of the Ctb tokens (the vocabulary holds only Ctb tokens
+        # before the scoring)
+        self.ctb_trigrams = None
+        if settings[5] > 0:
+            print('Ctb token trigram index ...')
+            _start_timer = time.time() # Timer
+            self.ctb_trigrams = TrigramIndex(self.vocabulary.tokens, settings[5])
+            print ('Tokens: %i, Trigrams: %i, Time: %s' % (len(self.ctb_trigrams.tokens),
+                                                           len(self.ctb_trigrams.postings),
+                                                           str(time.time() - _start_timer)))  # Timer
+
+    # <htb_score_fields> method - Returns the Htb fields read for the scoring of the 
+    #                             Htb rows: Id, Locality, Town and the Htb fields of 
+    #                             the blocking keys.
+    # ---------------------------------------------------------------------------------   
+    def htb_score_fields(self):
+
+        _fields = ['Id', 'Locality', 'Town']
+        if self.ctb_blocks is not None:
+            _fields.extend(self.ctb_blocks.htb_fields())
+        return ', '.join(_fields)
+
+    # <score_htb_row> method - Scores the Ctb candidates (CtbFts full-text index) of 
+    #                          an Htb row. Returns the (Htb Id, Ctb Id, score, number 
+    #                          of candidates) tuple. The Ctb Id is None if no 
+    #                          candidate reaches the matching threshold and the 
+    #                          number of candidates is None if the Htb row has no 
+    #                          street tokens. The candidates are restricted to the 
+    #                          blocks of the Htb row (see <BlockingIndex>) and the
+    #                          query adds the nearest Ctb tokens of the misspelt
+    #                          Htb tokens (see <TrigramIndex>).
+    # ---------------------------------------------------------------------------------   
+    def score_htb_row(self,
+                      con,
+                      htb_row,
+                      htb_tokens):
+
+        """ <con>: Cursor of the database of the CtbFts index
+            <htb_row>: The values of the <htb_score_fields> of the Htb row
+            <htb_tokens>: Street tokens of the Htb row
+        """
+
+        _matching_threshold, filter_locality, filter_town, _freq_tokens = self.score_settings[:4]
+
+        if not htb_tokens:
+            return (htb_row[0], None, 0, None)
+
+        _htb_token_ids = self.vocabulary.encode(htb_tokens)
+        _tot_token = ''
+        for  _token in htb_tokens:
+            if (len(_token) > 0) and (_token not in _freq_tokens):
+                _tot_token = _tot_token + _token + ' OR '
+                if self.ctb_trigrams is not None:
+                    for _near_token in self.ctb_trigrams.nearest(_token):
+                        _tot_token = _tot_token + _near_token + ' OR '
+        _tot_token = _tot_token[:-4]
+        if (filter_locality == True) and (filter_town == True):
+            _ctb_ids = con.execute("SELECT docid FROM CtbFts WHERE Street MATCH ? AND \
+                                    Locality = ? AND Town = ?", (_tot_token,
+                                                                 htb_row[1],
+                                                                 htb_row[2])).fetchall()
+        elif (filter_locality == True) and (filter_town == False):
+            _ctb_ids = con.execute("SELECT docid FROM CtbFts WHERE Street MATCH ? AND \
+                                    Locality = ?", (_tot_token,
+                                                    htb_row[1])).fetchall()
+        elif (filter_locality == False) and (filter_town == True):
+            _ctb_ids = con.execute("SELECT docid FROM CtbFts WHERE Street MATCH ? AND \
+                                    Town = ?", (_tot_token,
+                                                htb_row[2])).fetchall()
+        else:
+            _ctb_ids = con.execute("SELECT docid FROM CtbFts WHERE Street MATCH ?", 
+                                   (_tot_token,)).fetchall()
+        if self.ctb_blocks is not None:
+            _ctb_ids = self.ctb_blocks.filter(_ctb_ids, htb_row[3:])
+
+        if _ctb_ids == []:
+            # Select RowIDs from Ctb table (use Name)
+            _ctb_ids = con.execute("SELECT docid FROM CtbFts WHERE Name MATCH ?", 
+                                   (_tot_token,)).fetchall()
+            if self.ctb_blocks is not None:
+                _ctb_ids = self.ctb_blocks.filter(_ctb_ids, htb_row[3:])
+
+        if _ctb_ids == []:
+            return (htb_row[0], None, 0, 0)
+
+        _scores = {}       
+        # For each row in Ctb       
+        for _ctb_row in _ctb_ids:
+            if (htb_row[1] is None) and (htb_row[2] is None):
+                _ctb_token_ids = self.ctb_full_store[_ctb_row[0]]
+            else:
+                _ctb_token_ids = self.ctb_store[_ctb_row[0]]
+                         
+            _tmp_score = self.matching_distance(_htb_token_ids,
+                                                _ctb_token_ids,
+                                                0,
+                                                self.vocabulary)
+                         
+            if _tmp_score == 1:
+                _scores.update({_ctb_row[0] : _tmp_score * 100})
+                break
+            elif _tmp_score >= _matching_threshold:
+                _scores.update({_ctb_row[0] : _tmp_score * 100})
+
+        if len(_scores) > 0:
+            _max_score_row = max(_scores, key=_scores.get)
+            return (htb_row[0], _max_score_row, _scores[_max_score_row], len(_ctb_ids))
+        return (htb_row[0], None, 0, len(_ctb_ids))
+
+    # <serial_scores> method - Scores the Htb rows in Id order in this process.
+    #                          Yields the tuples of the <score_htb_row> method.
+    # ---------------------------------------------------------------------------------   
+    def serial_scores(self,
+                      sqlite_db):
+
+        """ <sqlite_db>:  SQLite database
+        """
+
+        _cur = sqlite_db.rCur()
+        # Select all RowID from Htb table
+        _htb_ids = _cur.execute('SELECT %s FROM Htb ORDER BY Id' % 
+                                self.htb_score_fields()).fetchall()        
+
+        # Street tokens of the Htb rows (streamed in Id order)
+        _htb_tokenise = m_tokenise.Tokenise()
+        _htb_token_rows = _htb_tokenise.tokenise_table(sqlite_db,
+                                                       'Htb',
+                                                       False,
+                                                       False,
+                                                       True,
+                                                       False,
+                                                       False,
+                                                       False)
+
+        con = sqlite_db.rCur()
+        for _htb_row, (_htb_id, _htb_tokens) in itertools.izip(_htb_ids, 
+                                                                _htb_token_rows):
+            yield self.score_htb_row(con, _htb_row, _htb_tokens)
+
+    # <parallel_scores> method - Scores the Htb rows by <workers> processes. The Htb 
+    #                            table is split into Id ranges of <batch_size> Ids, 
+    #                            the workers share the Ctb token stores and the 
+    #                            CtbFts index (read only) and the scores are yielded 
+    #                            in Htb Id order, so the results of a serial run are 
+    #                            reproduced. Prints the throughput of each worker.
+    # ---------------------------------------------------------------------------------   
+    def parallel_scores(self,
+                        sqlite_db,
+                        db_path,
+                        workers,
+                        batch_size):
+
+        """ <sqlite_db>:  SQLite database
+            <db_path>: Path of the database file
+            <workers>: Number of worker processes
+            <batch_size>: Number of Htb Ids of each partition
+        """
+
+        global _worker_match
+
+        _cur = sqlite_db.rCur()
+        _min_id, _max_id = _cur.execute('SELECT MIN(Id), MAX(Id) FROM Htb').fetchone()
+        if _min_id is None:
+            return
+
+        # The worker connections read the committed rows
+        sqlite_db.conn.commit()
+
+        _ranges = [(_start, _start + batch_size) 
+                   for _start in xrange(_min_id, _max_id + 1, batch_size)]
+
+        # The forked workers inherit the loaded token stores
+        _worker_match = self
+        _worker_stats = {}
+        _pool = multiprocessing.Pool(workers, 
+                                     init_match_worker, 
+                                     (db_path, self.score_settings))
+        try:
+            for _pid, _scores, _run_time in _pool.imap(score_id_range, _ranges):
+                _stats = _worker_stats.setdefault(_pid, [0, 0.0])
+                _stats[0] += len(_scores)
+                _stats[1] += _run_time
+                for _score in _scores:
+                    yield _score
+            _pool.close()
+        finally:
+            _pool.terminate()
+            _pool.join()
+            _worker_match = None
+
+        for _pid, (_rows, _run_time) in sorted(_worker_stats.items()):
+            print ('Worker %i: %i rows, %.1f rows/sec' % (_pid,
+                                                          _rows,
+                                                          _rows / max(_run_time, 1e-6)))
+
+    # <save_scores> method - Writes the matched and unmatched Htb rows of <scores> 
+    #                        (tuples of the <score_htb_row> method) to the <Stb> and 
+    #                        <Ttb> tables in sets of 1000 rows.
+    # ---------------------------------------------------------------------------------   
+    def save_scores(self,
+                    sqlite_db,
+                    scores):
+
+        """ <sqlite_db>:  SQLite database
+            <scores>: Iterable of the (Htb Id, Ctb Id, score, number of candidates) 
+                      tuples in Htb Id order
+        """
+
+        _num_matches = 0
+        _tuple_ids = []
+        _unmatched_ids = []
+
+        _cnt_htb_row = 0
+
+        # For each row in Htb
+        for _htb_id, _ctb_id, _score, _cnt in scores:
+            _cnt_htb_row += 1
+
+            if _cnt is not None:
+                print(str(_cnt_htb_row) + ': ' + str(_cnt) + ' M:' + str(_num_matches))
+
+            if _ctb_id is not None:
+                _tuple_ids.append((_htb_id, 
+                                   _ctb_id, 
+                                   _score))
+                _num_matches += 1
+            else:
+                _unmatched_ids.append(_htb_id)
+
+            # 
+            # Write automated matching results to <Ttb> table
+            if _cnt:
+                if len(_tuple_ids) > 1000:
+                    # Matched addresses
+                    self.save_matched(sqlite_db, _tuple_ids)
+                    sqlite_db.conn.commit()
+                    print('Partial save of 1000 matches!')
+                        
+                    # Empty 1000 matches list
+                    _tuple_ids = [] 
+
+                if len(_unmatched_ids) > 1000:
+                    # Unmatched addresses
+                    self.save_unmatched(sqlite_db, _unmatched_ids)
+                    sqlite_db.conn.commit()
+                    print('Partial save of 1000 matches!')
+                        
+                    # Empty 1000 no-matches list
+                    _unmatched_ids = []
+
+        # Write the last set of automated matching results to <Ttb> table
+        if len(_tuple_ids) > 0:
+            # Matched addresses
+            self.save_matched(sqlite_db, _tuple_ids)
+            sqlite_db.conn.commit()
+
+        if len(_unmatched_ids) > 0:
+            # Unmatched addresses
+            self.save_unmatched(sqlite_db, _unmatched_ids)
+            sqlite_db.conn.commit()
+        print('Save the last set of address matches!')
+
+    # <save_matched> method - Writes the matched addresses of <tuple_ids> (Htb Id, 
+    #                         Ctb Id, score) to the <Stb> and <Ttb> tables.
+    # ---------------------------------------------------------------------------------   
+    def save_matched(self,
+                     sqlite_db,
+                     tuple_ids):
+
+        _cur = sqlite_db.rCur()
+        for _ids in tuple_ids:
+            _htb_data = _cur.execute("SELECT * FROM Htb WHERE Id = ?", (_ids[0],)).fetchall()
+            _ctb_data = _cur.execute("SELECT * FROM Ctb WHERE Id = ?", (_ids[1],)).fetchall()
+            _cur.execute("INSERT INTO Stb (Name,Street,HPCode,Locality,Town) VALUES (?,?,?,?,?)", 
+                            (str(_htb_data[0][2]),
+                            str(_htb_data[0][4]),
+                            str(_htb_data[0][5]),
+                            str(_ctb_data[0][6]),
+                            str(_ctb_data[0][7])))
+            _ins_record = _cur.execute("SELECT SNId FROM Stb ORDER BY SNId DESC LIMIT 1").fetchall()
+            _cur.execute("INSERT INTO Ttb (Cid,Hid,Num,SNId,CPCode,GREasting,GRNorthing, \
+                            StartYear,AutoEval,DistCode,Status) VALUES (?,?,?,?,?,?,?,?,?,?,?)", 
+                            (_ctb_data[0][1],
+                            _htb_data[0][1],
+                            str(_htb_data[0][3]),
+                            _ins_record[0][0],
+                            str(_ctb_data[0][5]),
+                            _ctb_data[0][8],
+                            _ctb_data[0][9],
+                            str(_htb_data[0][8]),
+                            (_ids[2]),
+                            str(_htb_data[0][9]),
+                            100))
+
+    # <save_unmatched> method - Writes the unmatched addresses of <unmatched_ids> 
+    #                           (Htb Ids) to the <Stb> and <Ttb> tables.
+    # ---------------------------------------------------------------------------------   
+    def save_unmatched(self,
+                       sqlite_db,
+                       unmatched_ids):
+
+        _cur = sqlite_db.rCur()
+        for _ids in unmatched_ids:
+            _htb_data = _cur.execute("SELECT * FROM Htb WHERE Id = ?", (_ids,)).fetchall()
+            _cur.execute("INSERT INTO Stb (Name,Street,HPCode) VALUES (?,?,?)", 
+                            (str(_htb_data[0][2]),
+                            str(_htb_data[0][4]),
+                            str(_htb_data[0][5])))
+            _ins_record = _cur.execute("SELECT SNId FROM Stb ORDER BY SNId DESC LIMIT 1").fetchall()
+            _cur.execute("INSERT INTO Ttb (Hid,Num,SNId, \
+                            StartYear,AutoEval,DistCode,Status) VALUES (?,?,?,?,?,?,?)", 
+                            (_htb_data[0][1],
+                            str(_htb_data[0][3]),
+                            _ins_record[0][0],
+                            str(_htb_data[0][8]),
+                            0,
+                            str(_htb_data[0][9]),
+                            101))
+
     # <matching_sec_run> method - Second Round of Matching the unmatched <Ttb> addresses.
     # ---------------------------------------------------------------------------------   
     #@do_cprofile    
@@ -581,6 +746,16 @@ class Match(object):
                         bbox_rds.append((_rd_code[0], xy_min[0], xy_min[1], xy_max[0], xy_max[1]))
 
         
+        # Token ids of the compared addresses
+        _vocabulary = m_tokenise.TokenVocabulary()
+
+        # Full-text index of Ctb (rebuilt only if the Ctb rows have changed)
+        self.ctb_fts_index(sqlite_db)
+        con = sqlite_db.rCur()
+
+        # Token ids of the Ctb candidates (Name and Street tokens)
+        _ctb_store = self.ctb_token_store(sqlite_db, _vocabulary, False)
+
         for _rd in bbox_rds:
 
             rd_pointer = bbox_rds.index(_rd)
@@ -591,28 +766,12 @@ class Match(object):
                   
             _num_matches = 0
 
-            # Create virtual table for Ctb.
-            con = sqlite3.connect(":memory:")
-            con.execute("CREATE VIRTUAL TABLE CtbMem USING fts3(Name,Street)")
-
-            # Copy Ctb records to the new virtual table.
-            _cur.execute('SELECT Id,Name,Street FROM Ctb WHERE GREasting > %s AND \
-                          GREasting < %s AND GRNorthing > %s AND GRNorthing < %s' %
+            # Ctb rows in the bounding box of the RD region
+            _cur.execute('DROP TABLE IF EXISTS temp.RdCtb')
+            _cur.execute('CREATE TEMP TABLE RdCtb (Id integer NOT NULL PRIMARY KEY)')
+            _cur.execute('INSERT INTO RdCtb (Id) SELECT Id FROM Ctb WHERE GREasting > ? AND \
+                          GREasting < ? AND GRNorthing > ? AND GRNorthing < ?',
                           (_rd[1],_rd[3],_rd[2],_rd[4])) 
-            _ctb_ids = _cur.fetchall()
-
-            for _ctb_row in _ctb_ids:
-                _str_fld = 'docid,Name,Street'
-                _str_vals = str(_ctb_row[0]) + ','
-                _str_vals += '\'' + _ctb_row[1] + '\','
-                _str_vals += '\'' + _ctb_row[2] + '\''
-
-                _str_exec = 'INSERT INTO %s (%s) VALUES (%s)' % ('CtbMem',
-                                                                  _str_fld,
-                                                                  _str_vals) 
-                con.execute(_str_exec)
-
-            _ctb_mem_ids = con.execute('SELECT * FROM CtbMem') 
 
       
             _tuple_ids = []
@@ -637,6 +796,7 @@ class Match(object):
                                                  False)
                 if _htb_tokenise.is_tokenised:
                 
+                    _htb_token_ids = _vocabulary.encode(_htb_tokenise.tokens)
                     _tot_ids = []
                     _tot_token = ''
                     for  _token in _htb_tokenise.tokens:
@@ -644,13 +804,15 @@ class Match(object):
                             _tot_token = _tot_token + _token + ' OR '
                     _tot_token = _tot_token[:-4]
                     _tot_token = '\'' + _tot_token + '\''
-                    _ctb_ids = con.execute("SELECT docid, Name, Street FROM CtbMem WHERE Street MATCH ?",
+                    _ctb_ids = con.execute("SELECT docid, Name, Street FROM CtbFts WHERE Street MATCH ? \
+                                            AND docid IN (SELECT Id FROM temp.RdCtb)",
                                            (_tot_token,)).fetchall()
 
                     
                     if _ctb_ids == []:
                         # Select RowIDs from Ctb table (use Locality)
-                        _ctb_ids = con.execute("SELECT docid, Name, Street FROM CtbMem WHERE Name MATCH ?",
+                        _ctb_ids = con.execute("SELECT docid, Name, Street FROM CtbFts WHERE Name MATCH ? \
+                                                AND docid IN (SELECT Id FROM temp.RdCtb)",
                                                (_tot_token,)).fetchall()
                 
                     _no_ids = False
@@ -666,17 +828,10 @@ class Match(object):
                         # For each row in Ctb       
                         for _ctb_row in _ctb_ids:
                                               
-                            _ctb_tokenise = m_tokenise.Tokenise()
-                            _ctb_tokenise.tokenise_mem_address(con,
-                                                               'CtbMem', 
-                                                                _ctb_row[0],
-                                                                True,
-                                                                True,
-                                                                False)
-                         
-                            _tmp_score = self.matching_distance(_htb_tokenise.tokens,
-                                                                _ctb_tokenise.tokens,
-                                                                0)
+                            _tmp_score = self.matching_distance(_htb_token_ids,
+                                                                _ctb_store[_ctb_row[0]],
+                                                                0,
+                                                                _vocabulary)
                          
                             if _tmp_score == 1:
                                 _scores.update({_ctb_row[0] : _tmp_score * 100})
@@ -781,7 +936,8 @@ class Match(object):
     def matching_distance(self,
                           tokens_a,
                           tokens_b,
-                          string_type):
+                          string_type,
+                          vocabulary=None):
 
         """ <tokens_a>: List of Tokens A
             <tokens_b>: List of Tokens B
@@ -791,6 +947,8 @@ class Match(object):
                            2 = FREE SLOT
                            3 = FREE SLOT
                            4 = Similarity ratio [Not final]
+            <vocabulary>: Token vocabulary of the token ids (None if the tokens
+                          are strings)
         """
         
         _distance_lst = []
@@ -798,17 +956,23 @@ class Match(object):
 
         # 0: Levenshtein edit-distance
         if string_type == 0:
+            _set_b = set(tokens_b)
             for _token_a in tokens_a:
-                if tokens_b.count(_token_a) > 0:
+                if _token_a in _set_b:
                     _distance_lst.append(0.0)
                 else:
                     if len(tokens_a)>0 and len(tokens_b)>0:
                         _scores = []
+                        if vocabulary is None:
+                            _len_a = len(_token_a)
+                        else:
+                            _len_a = len(vocabulary.tokens[_token_a])
                         for _token_b in tokens_b:
-                            _dist_score = distance (_token_a, 
-                                                    _token_b)
+                            _dist_score = self.token_distance(_token_a, 
+                                                              _token_b,
+                                                              vocabulary)
 
-                            _scores.append(float(_dist_score)/float(len(_token_a)))
+                            _scores.append(float(_dist_score)/float(_len_a))
 
                         # stores the smallest score in <_distance_lst>
                         # Note: smallest score = similar A and B tokens
@@ -880,10 +1044,44 @@ class Match(object):
         #    The best match between any strings in the first set and the second set 
         #    (passed as sequences) is attempted. I.e., the order doesn't matter here.
         if string_type == 4:
+            if vocabulary is not None:
+                tokens_a = vocabulary.decode(tokens_a)
+                tokens_b = vocabulary.decode(tokens_b)
             _distance_fin = setratio(tokens_a, tokens_b)
 
         return _distance_fin
 
+    # <token_distance> method - Returns the Levenshtein edit-distance of two tokens. 
+    #                           The distances of the token ids of <vocabulary> are 
+    #                           cached (at most DISTANCE_CACHE_SIZE pairs).
+    # ---------------------------------------------------------------------------------   
+    def token_distance(self,
+                       token_a,
+                       token_b,
+                       vocabulary=None):
+
+        """ <token_a>: Token A
+            <token_b>: Token B
+            <vocabulary>: Token vocabulary of the token ids (None if the tokens
+                          are strings)
+        """
+
+        if vocabulary is None:
+            return distance(token_a, token_b)
+
+        if (vocabulary is not self.distance_vocabulary) or \
+           (len(self.distance_cache) >= DISTANCE_CACHE_SIZE):
+            self.distance_vocabulary = vocabulary
+            self.distance_cache = {}
+
+        _key = (token_a, token_b)
+        _distance = self.distance_cache.get(_key)
+        if _distance is None:
+            _distance = distance(vocabulary.tokens[token_a], 
+                                 vocabulary.tokens[token_b])
+            self.distance_cache[_key] = _distance
+        return _distance
+
     # <build_freq_tables> method - Creates frequency tables for Ctb and Htb address 
     #  tokens in the database, selects the top freq tokens based on <freq_ctb_limit>
     #  and <freq_htb_limit> limits and sets the selected tokens in the 
@@ -897,96 +1095,46 @@ class Match(object):
                           freq_tables,
                           freq_ctb_limit,
                           freq_htb_limit,
-                          use_alias):
+                          use_alias,
+                          token_tables=False):
 
         """ <sqlite_db>: SQLite database
             <freq_tables>: Use of Frequency tables [Boolean]
             <freq_ctb_limit>: Limit of token frequency for the Ctb table
             <freq_htb_limit>: Limit of token frequency for the Htb table
             <use_alias>: Use of Alias names [Boolean]
+            <token_tables>: Count the tokens of the CtbTokens and HtbTokens 
+                            tables (see the <refresh_token_table> method of 
+                            <Tokenise>) [Boolean]
         """
 
         if freq_tables == True:
             # Create freq Ctb table
             print('Creating the CtbFreq frequency table using the Ctb address tokens ...')
+            self.create_freq_table(sqlite_db,
+                                   'Ctb',
+                                   use_alias,
+                                   token_tables)
+
+            # update Atb table with Ctb freq token values
             _cur = sqlite_db.rCur()
-            _ctb_ids = _cur.execute('SELECT Id FROM Ctb').fetchall()        
-
-            tot_tokens = []
-            _ctb_freq_tokenise = m_tokenise.Tokenise()
-            _ctb_freq_tokenise.tokenise_all(sqlite_db,
-                                            'Ctb',
-                                            True,
-                                            True,
-                                            True,
-                                            True,
-                                            False,
-                                            use_alias)
-            for token in _ctb_freq_tokenise.tokens:
-                tot_tokens.append(token)
-
-            freq_info = collections.Counter(tot_tokens)
-
-            _cur.execute("DROP TABLE if exists CtbFreq")
-            _cur.execute("CREATE TABLE CtbFreq (Token text, Freq integer)")
-
-            for key, val in freq_info.items():
-                
-                _str_fld = 'Token,Freq'
-                _str_vals = '\'' + key + '\','
-                _str_vals += str(val)
-                
-                _str_exec = 'INSERT INTO %s (%s) VALUES (%s)' % ('CtbFreq',
-                                                                  _str_fld,
-                                                                  _str_vals) 
-                _cur.execute(_str_exec)
-                
-                # update Atb table with Ctb freq token value
-                _con = sqlite_db.rCur()
-                _str_exec = "SELECT Id FROM Atb WHERE Name = '%s'" % (key)
-                _con_ids = _con.execute(_str_exec).fetchall()
-
-                if _con_ids is not None:
-                    for _ids in _con_ids:
-                        _con.execute("UPDATE Atb SET Freq = %s WHERE Id = %i" % 
-                                     (val,_ids[0]))
+            _cur.execute('UPDATE Atb SET Freq = (SELECT f.Freq FROM CtbFreq f \
+                                                 WHERE f.Token = Atb.Name) \
+                          WHERE Name IN (SELECT Token FROM CtbFreq)')
+
+            # Keep the alias resolver in sync with the Atb table
+            if sqlite_db.alias_resolver is not None:
+                for _name, _freq in _cur.execute('SELECT Token, Freq FROM CtbFreq \
+                                                  WHERE Token IN (SELECT Name FROM Atb)').fetchall():
+                    sqlite_db.alias_resolver.update_freq(_name, _freq)
             sqlite_db.conn.commit()
 
             # Create freq Htb table
             print('Creating the HtbFreq frequency table using the Htb address tokens ...')
-            _cur = sqlite_db.rCur()
-            _htb_ids = _cur.execute('SELECT Id FROM Htb').fetchall()        
-
-            tot_tokens = []
-            _htb_freq_tokenise = m_tokenise.Tokenise()
-            _htb_freq_tokenise.tokenise_all(sqlite_db,
-                                            'Htb',
-                                            True,
-                                            True,
-                                            True,
-                                            True,
-                                            False,
-                                            use_alias)
-
-            for token in _htb_freq_tokenise.tokens:
-                tot_tokens.append(token)
-
-            freq_info = collections.Counter(tot_tokens)
-
-            _cur.execute("DROP TABLE if exists HtbFreq")
-            _cur.execute("CREATE TABLE HtbFreq (Token text, Freq integer)")
-
-            for key, val in freq_info.items():
-                _str_fld = 'Token,Freq'
-                _str_vals = '\'' + key + '\','
-                _str_vals += str(val)
-
-                _str_exec = 'INSERT INTO %s (%s) VALUES (%s)' % ('HtbFreq',
-                                                                  _str_fld,
-                                                                  _str_vals) 
-                _cur.execute(_str_exec)
-
-            sqlite_db.conn.commit()
+            self.create_freq_table(sqlite_db,
+                                   'Htb',
+                                   use_alias,
+                                   token_tables)
 
             # Select freq Ctb tokens
 
@@ -1001,4 +1149,432 @@ class Match(object):
 
             pass
 
+    # <create_freq_table> method - Creates the <table_name>Freq frequency table of 
+    #                              the Name, Num, Street and Locality tokens of the 
+    #                              <table_name> table. The tokens are counted by 
+    #                              streaming the rows of the table or, if 
+    #                              <token_tables> is True, by one GROUP BY of the 
+    #                              <table_name>Tokens token table.
+    # --------------------------------------------------------------------------------- 
+    def create_freq_table(self,
+                          sqlite_db,
+                          table_name,
+                          use_alias,
+                          token_tables):
+
+        """ <sqlite_db>: SQLite database
+            <table_name>: Table name (Htb or Ctb)
+            <use_alias>: Use of Alias names [Boolean]
+            <token_tables>: Count the tokens of the <table_name>Tokens table [Boolean]
+        """
+
+        _cur = sqlite_db.rCur()
+        _freq_table = table_name + 'Freq'
+        _cur.execute("DROP TABLE if exists %s" % (_freq_table,))
+        _cur.execute("CREATE TABLE %s (Token text, Freq integer)" % (_freq_table,))
+
+        if token_tables:
+            _cur.execute("INSERT INTO %s (Token, Freq) \
+                          SELECT Token, COUNT(*) FROM %sTokens \
+                          WHERE Field IN ('Name','Num','Street','Locality') \
+                          GROUP BY Token" % (_freq_table,
+                                             table_name))
+        else:
+            _freq_info = collections.Counter()
+            _freq_tokenise = m_tokenise.Tokenise()
+            for _id, _tokens in _freq_tokenise.tokenise_table(sqlite_db,
+                                                              table_name,
+                                                              True,
+                                                              True,
+                                                              True,
+                                                              True,
+                                                              False,
+                                                              use_alias,
+                                                              unique=False):
+                _freq_info.update(_tokens)
+
+            _cur.executemany("INSERT INTO %s (Token, Freq) VALUES (?,?)" % (_freq_table,),
+                             _freq_info.iteritems())
+
+        _cur.execute("CREATE INDEX %s_idx_Token ON %s (Token)" % (_freq_table, 
+                                                                  _freq_table))
+        sqlite_db.conn.commit()
+
+    # <ctb_fts_index> method - Builds the CtbFts full-text index of the Name, 
+    #                          Street, Locality and Town columns of the Ctb table in
+    #                          the database. The index is tagged with the 
+    #                          fingerprint of the Ctb rows and it is rebuilt only 
+    #                          if the fingerprint has changed.
+    #                          Returns True if the index has been rebuilt.
+    # --------------------------------------------------------------------------------- 
+    def ctb_fts_index(self,
+                      sqlite_db,
+                      batch_size=10000):
+
+        """ <sqlite_db>: SQLite database
+            <batch_size>: Number of Ctb rows read and inserted in each batch
+        """
+
+        print('Ctb full-text index ...')
+        _start_timer = time.time() # Timer
+
+        sqlite_db.init_fts_index_tbl()
+        _cur = sqlite_db.rCur()
+        _fingerprint = self.table_fingerprint(sqlite_db,
+                                              'Ctb',
+                                              ('Name', 'Street', 'Locality', 'Town'),
+                                              batch_size)
+        _row = _cur.execute("SELECT Fingerprint FROM FtsIndex WHERE Name = 'CtbFts'").fetchone()
+        if (_row is not None) and (_row[0] == _fingerprint):
+            print ('Reused, Time: ' + str(time.time() - _start_timer))  # Timer
+            return False
+
+        _cur.execute("DROP TABLE CtbFts")
+        sqlite_db.init_fts_index_tbl()
+        _last_id = -1
+        while True:
+            _rows = _cur.execute('SELECT Id, Name, Street, Locality, Town FROM Ctb \
+                                  WHERE Id > ? ORDER BY Id LIMIT ?', (_last_id, 
+                                                                      batch_size)).fetchall()
+            if not _rows:
+                break
+            _last_id = _rows[-1][0]
+            _cur.executemany('INSERT INTO CtbFts (docid, Name, Street, Locality, Town) \
+                              VALUES (?,?,?,?,?)', _rows)
+
+        _cur.execute("INSERT OR REPLACE INTO FtsIndex (Name, Fingerprint) VALUES (?,?)", 
+                     ('CtbFts', _fingerprint))
+        sqlite_db.conn.commit()
+        print ('Rebuilt, Time: ' + str(time.time() - _start_timer))  # Timer
+        return True
+
+    # <table_fingerprint> method - Returns the SHA-1 fingerprint of the Id and the 
+    #                              <field_names> values of the rows of <table_name> 
+    #                              table (Id order).
+    # --------------------------------------------------------------------------------- 
+    def table_fingerprint(self,
+                          sqlite_db,
+                          table_name,
+                          field_names,
+                          batch_size=10000):
+
+        """ <sqlite_db>: SQLite database
+            <table_name>: Table name
+            <field_names>: Names of the fingerprinted fields
+            <batch_size>: Number of rows read in each batch
+        """
+
+        _cur = sqlite_db.rCur()
+        _hash = hashlib.sha1(repr(tuple(field_names)))
+        _str_select = 'SELECT Id, %s FROM %s WHERE Id > ? ORDER BY Id LIMIT ?' % \
+                      (','.join(field_names), table_name)
+        _last_id = -1
+        while True:
+            _rows = _cur.execute(_str_select, (_last_id, batch_size)).fetchall()
+            if not _rows:
+                break
+            _last_id = _rows[-1][0]
+            _hash.update(repr(_rows))
+        return _hash.hexdigest()
+
+    # <ctb_token_store> method - Loads the Name and Street tokens (and the Locality 
+    #                            and Town tokens if <locality_town> is True) of all 
+    #                            the Ctb rows into a <TokenStore> of <vocabulary> 
+    #                            token ids, so the candidates are scored without 
+    #                            reading the Ctb table.
+    # --------------------------------------------------------------------------------- 
+    def ctb_token_store(self,
+                        sqlite_db,
+                        vocabulary,
+                        locality_town):
+
+        """ <sqlite_db>: SQLite database
+            <vocabulary>: Token vocabulary (<TokenVocabulary>)
+            <locality_town>: Add the Locality and Town tokens [Boolean]
+        """
+
+        print('Loading the Ctb tokens ...')
+        _start_timer = time.time() # Timer
+
+        _ctb_tokenise = m_tokenise.Tokenise()
+        _store = _ctb_tokenise.token_store(sqlite_db,
+                                           'Ctb',
+                                           True,
+                                           False,
+                                           True,
+                                           locality_town,
+                                           locality_town,
+                                           False,
+                                           vocabulary)
+
+        print ('Rows: %i, Tokens: %i, Time: %s' % (len(_store),
+                                                   len(_store.values),
+                                                   str(time.time() - _start_timer)))  # Timer
+        return _store
+
+    # <ctb_blocking_index> method - Loads the Ctb candidate blocks of the 
+    #                               <blocking_keys> (see <BlockingIndex>).
+    # --------------------------------------------------------------------------------- 
+    def ctb_blocking_index(self,
+                           sqlite_db,
+                           blocking_keys,
+                           batch_size=10000):
+
+        """ <sqlite_db>: SQLite database
+            <blocking_keys>: List of the blocking keys (DistCode, Locality, Town, PCode)
+            <batch_size>: Number of rows read in each batch
+        """
+
+        print('Ctb blocking index (' + ', '.join(blocking_keys) + ') ...')
+        _start_timer = time.time() # Timer
+
+        _blocks = BlockingIndex(blocking_keys)
+        _cur = sqlite_db.rCur()
+        _str_select = 'SELECT Id, %s FROM Ctb WHERE Id > ? ORDER BY Id LIMIT ?' % \
+                      ', '.join(_blocks.ctb_fields())
+        _last_id = -1
+        while True:
+            _rows = _cur.execute(_str_select, (_last_id, batch_size)).fetchall()
+            if not _rows:
+                break
+            _last_id = _rows[-1][0]
+            for _row in _rows:
+                _blocks.add(_row[0], _row[1:])
+
+        print ('Blocks: %s, Time: %s' % (', '.join(['%s %i' % (_key, len(_key_blocks)) 
+                                                    for _key, _key_blocks in 
+                                                    zip(_blocks.keys, _blocks.blocks)]),
+                                         str(time.time() - _start_timer)))  # Timer
+        return _blocks
+
+class BlockingIndex(object):
+    """<BlockingIndex> class for keeping the Ctb candidates of each value of the 
+    blocking keys (DistCode, Locality, Town, PCode) in hash partitions 
+    (value -> set of Ctb Ids). An Htb row is scored only against the Ctb rows of 
+    its blocks of all the keys; the keys without an Htb value are not used. 
+    The PCode blocks use the postcode outward code (text before the space) of 
+    the CPCode/HPCode fields.
+    """
+    # Constructor: Initialises the properties of <BlockingIndex> instance.
+    # ---------------------------------------------------------------------------------
+    def __init__(self, 
+                 keys):
+        for _key in keys:
+            if _key not in BLOCKING_FIELDS:
+                raise ValueError('Unknown blocking key: ' + str(_key))
+        self.keys = tuple(keys)
+        self.blocks = [{} for _key in self.keys]
+
+    # <ctb_fields> method - Returns the Ctb fields of the blocking keys.
+    # ---------------------------------------------------------------------------------   
+    def ctb_fields(self):
+        return [BLOCKING_FIELDS[_key][0] for _key in self.keys]
+
+    # <htb_fields> method - Returns the Htb fields of the blocking keys.
+    # ---------------------------------------------------------------------------------   
+    def htb_fields(self):
+        return [BLOCKING_FIELDS[_key][1] for _key in self.keys]
+
+    # <block_value> method - Returns the block of the <value> of the <key> field 
+    #                        (None for an empty value).
+    # ---------------------------------------------------------------------------------   
+    def block_value(self, 
+                    key,
+                    value):
+
+        """ <key>: Blocking key
+            <value>: Field value
+        """
+
+        if value is None:
+            return None
+        if key == 'PCode':
+            _parts = unicode(value).lower().split()
+            if not _parts:
+                return None
+            return _parts[0]
+        if value == '':
+            return None
+        return value
+
+    # <add> method - Adds the <record_id> Ctb row to the blocks of its <values>.
+    # ---------------------------------------------------------------------------------   
+    def add(self, 
+            record_id,
+            values):
+
+        """ <record_id>: Ctb row identification number
+            <values>: Values of the <ctb_fields> of the row
+        """
+
+        for _key, _key_blocks, _value in zip(self.keys, self.blocks, values):
+            _block = self.block_value(_key, _value)
+            if _block is not None:
+                _key_blocks.setdefault(_block, set()).add(record_id)
+
+    # <candidates> method - Returns the list of the Ctb Id sets of the blocks of an 
+    #                       Htb row (an empty list if no key has an Htb value).
+    # ---------------------------------------------------------------------------------   
+    def candidates(self, 
+                   values):
+
+        """ <values>: Values of the <htb_fields> of the Htb row
+        """
+
+        _sets = []
+        for _key, _key_blocks, _value in zip(self.keys, self.blocks, values):
+            _block = self.block_value(_key, _value)
+            if _block is not None:
+                _sets.append(_key_blocks.get(_block, frozenset()))
+        return _sets
+
+    # <filter> method - Returns the <ctb_ids> rows (docid first) in the blocks of an 
+    #                   Htb row.
+    # ---------------------------------------------------------------------------------   
+    def filter(self, 
+               ctb_ids,
+               values):
+
+        """ <ctb_ids>: List of Ctb rows (Id first)
+            <values>: Values of the <htb_fields> of the Htb row
+        """
+
+        _sets = self.candidates(values)
+        if not _sets:
+            return ctb_ids
+        _sets.sort(key=len)
+        return [_row for _row in ctb_ids 
+                if all(_row[0] in _set for _set in _sets)]
+
+class TrigramIndex(object):
+    """<TrigramIndex> class for finding the nearest tokens of a vocabulary to a 
+    misspelt token. Each token is split into its character trigrams (padded with 
+    '$') and the inverted index keeps the tokens (ids and trigram counts) of each 
+    trigram. A token of the vocabulary within <max_distance> edits of the query 
+    token shares at least max(length) + 2 - 3 * <max_distance> trigrams with it 
+    (q-gram count filter), so the Levenshtein distance is computed only for the 
+    tokens passing the length and the count filters.
+    """
+    # Constructor: Initialises the properties of <TrigramIndex> instance.
+    # ---------------------------------------------------------------------------------
+    def __init__(self, 
+                 tokens,
+                 max_distance=1):
+        self.tokens = list(tokens)
+        self.token_ids = dict((_token, _id) for _id, _token in enumerate(self.tokens))
+        self.max_distance = max_distance
+        self.postings = {}
+        self.cache = {}
+        for _id, _token in enumerate(self.tokens):
+            for _gram, _count in self.trigrams(_token).iteritems():
+                self.postings.setdefault(_gram, []).append((_id, _count))
+
+    # <trigrams> method - Returns the counts of the padded character trigrams of 
+    #                     <token>.
+    # ---------------------------------------------------------------------------------   
+    def trigrams(self, 
+                 token):
+
+        """ <token>: Token string
+        """
+
+        _padded = '$$' + token + '$$'
+        return collections.Counter(_padded[_i:_i + 3] for _i in xrange(len(_padded) - 2))
+
+    # <nearest> method - Returns the sorted list of the vocabulary tokens with the 
+    #                    smallest edit distance (up to <max_distance>) to <token>. 
+    #                    The list is empty for the tokens of the vocabulary and the 
+    #                    tokens of up to 2 * <max_distance> characters.
+    # ---------------------------------------------------------------------------------   
+    def nearest(self, 
+                token):
+
+        """ <token>: Token string
+        """
+
+        if (token in self.token_ids) or (len(token) <= 2 * self.max_distance):
+            return []
+        _nearest = self.cache.get(token)
+        if _nearest is not None:
+            return _nearest
+
+        # Shared trigrams of the vocabulary tokens
+        _common = {}
+        for _gram, _count in self.trigrams(token).iteritems():
+            for _id, _token_count in self.postings.get(_gram, ()):
+                _common[_id] = _common.get(_id, 0) + min(_count, _token_count)
+
+        _nearest = []
+        _min_distance = self.max_distance + 1
+        for _id, _shared in _common.iteritems():
+            _token = self.tokens[_id]
+            if abs(len(_token) - len(token)) > self.max_distance:
+                continue
+            if _shared < max(len(_token), len(token)) + 2 - 3 * self.max_distance:
+                continue
+            _distance = distance(token, _token)
+            if _distance < _min_distance:
+                _min_distance = _distance
+                _nearest = [_token]
+            elif _distance == _min_distance:
+                _nearest.append(_token)
+
+        _nearest.sort()
+        self.cache[token] = _nearest
+        return _nearest
+
+# -------------------------------------------------------------------------------------
+# Matcher and database of the worker processes of <Match.parallel_scores>
+_worker_match = None
+_worker_db = None
+
+# <init_match_worker> function - Opens the database of a worker process. A forked 
+#                                worker inherits the matcher of the parent process 
+#                                (loaded Ctb token stores), otherwise the stores are
+#                                loaded from the database.
+# -------------------------------------------------------------------------------------
+def init_match_worker(db_path, settings):
+
+    """ <db_path>: Path of the SQLite database
+        <settings>: Scoring settings (see the <init_scoring> method of <Match>)
+    """
+
+    global _worker_match, _worker_db
+
+    _worker_db = DB.dbSQLiteManager(db_path)
+    if _worker_match is None:
+        _worker_match = Match()
+        _worker_match.init_scoring(_worker_db, settings)
+
+# <score_id_range> function - Returns the process id, the scores of the Htb rows of
+#                             an Id range and the scoring time. Runs in the worker 
+#                             processes.
+# -------------------------------------------------------------------------------------
+def score_id_range(id_range):
+
+    """ <id_range>: Tuple of (first Id, last Id + 1)
+    """
 
+    _start_timer = time.time() # Timer
+    _start, _end = id_range
+
+    _cur = _worker_db.rCur()
+    _htb_ids = _cur.execute('SELECT %s FROM Htb WHERE Id >= ? AND Id < ? ORDER BY Id' % 
+                            _worker_match.htb_score_fields(), (_start, _end)).fetchall()
+    _htb_tokenise = m_tokenise.Tokenise()
+    _htb_token_rows = _htb_tokenise.tokenise_table(_worker_db,
+                                                   'Htb',
+                                                   False,
+                                                   False,
+                                                   True,
+                                                   False,
+                                                   False,
+                                                   False,
+                                                   _start,
+                                                   _end - 1)
+
+    _scores = [_worker_match.score_htb_row(_cur, _htb_row, _htb_tokens)
+               for _htb_row, (_htb_id, _htb_tokens) in itertools.izip(_htb_ids, 
+                                                                       _htb_token_rows)]
+
+    return os.getpid(), _scores, time.time() - _start_timer
@@ -18,8 +18,18 @@
 # Import necessary modules
 import string
 import re
+import time
+import bisect
+import hashlib
+from array import array
 from collections import OrderedDict
 
+# Precompiled regular expression of the tokens containing a digit
+DIGITS = re.compile('\d')
+
+# Tokenised columns of the token tables (<table_name>Tokens)
+TOKEN_FIELDS = ('Name', 'Num', 'Street', 'Locality', 'Town')
+
 class Tokenise(object):
     """<Tokenise> class for tokenising street field.
     """
@@ -62,20 +72,12 @@ class Tokenise(object):
                       FROM %s WHERE Id = %i' % (table_name, record_id)) 
         _tokens = []    
         for _row in _cur.fetchall():
-            if (_row[1] is not None) and (_row[1] != '') and (bool_name == True):
-                _tokens += _row[1].split()
-
-            if (_row[2] is not None) and (_row[2] != '') and (bool_num == True):
-                _tokens += _row[2].split()
-
-            if (_row[3] is not None) and (_row[3] != '') and (bool_street == True):
-                _tokens += _row[3].split()
-            
-            if (_row[4] is not None) and (_row[4] != '') and (bool_locality == True):
-                _tokens += _row[4].split()
-
-            if (_row[5] is not None) and (_row[5] != '') and (bool_town == True):
-                _tokens += _row[5].split()
+            _tokens += self.row_tokens(_row[1:],
+                                       bool_name,
+                                       bool_num,
+                                       bool_street,
+                                       bool_locality,
+                                       bool_town)
        
         self.tokens = _tokens
         
@@ -87,6 +89,151 @@ class Tokenise(object):
 
         return  self.tokens
 
+    # <row_tokens> method - Returns the list of tokens of the (Name, Num, Street, 
+    #                       Locality, Town) values of a row. If <unique> is True, 
+    #                       the duplicate tokens are removed (the order of the 
+    #                       tokens is preserved).
+    # ---------------------------------------------------------------------------------   
+    def row_tokens(self, 
+                   row,
+                   bool_name,
+                   bool_num,
+                   bool_street,
+                   bool_locality,
+                   bool_town,
+                   unique=True):
+
+        """ <row>: The (Name, Num, Street, Locality, Town) values 
+            <bool_name>: Tokenize Name column [Boolean]
+            <bool_num>: Tokenize Num column [Boolean]
+            <bool_street>: Tokenize Street column [Boolean]
+            <bool_locality>: Tokenize Locality column [Boolean]
+            <bool_town>: Tokenize Town column [Boolean]
+            <unique>: Remove the duplicate tokens [Boolean]
+        """
+
+        _tokens = []
+        for _value, _use_fld in zip(row, (bool_name, 
+                                          bool_num, 
+                                          bool_street, 
+                                          bool_locality, 
+                                          bool_town)):
+            if (_value is not None) and (_value != '') and (_use_fld == True):
+                _tokens += _value.split()
+
+        if unique:
+            return list(OrderedDict.fromkeys(_tokens))
+        return _tokens
+
+    # <tokenise_table> method - Tokenises the rows of <table_name> table (or the rows 
+    #                           of the <min_id> - <max_id> range) in Id order.
+    #                           Yields the (Id, tokens) tuple of each row. The rows 
+    #                           are read in batches of <batch_size> rows, so the 
+    #                           connection can be committed while the tokens are 
+    #                           consumed.
+    # ---------------------------------------------------------------------------------   
+    def tokenise_table(self, 
+                       sqlite_db,
+                       table_name,
+                       bool_name,
+                       bool_num,
+                       bool_street,
+                       bool_locality,
+                       bool_town,
+                       use_alias,
+                       min_id=None,
+                       max_id=None,
+                       batch_size=10000,
+                       unique=True):
+
+        """ <sqlite_db>: SQLite database 
+            <table_name>: Table name 
+            <bool_name>: Tokenize Name column [Boolean]
+            <bool_num>: Tokenize Num column [Boolean]
+            <bool_street>: Tokenize Street column [Boolean]
+            <bool_locality>: Tokenize Locality column [Boolean]
+            <bool_town>: Tokenize Town column [Boolean]
+            <use_alias>: Use of Alias names [Boolean]
+            <min_id>: First Id of the rows (None for the first row)
+            <max_id>: Last Id of the rows (None for the last row)
+            <batch_size>: Number of rows read by each query
+            <unique>: Remove the duplicate tokens of each row [Boolean]
+        """
+
+        _cur = sqlite_db.rCur()
+        _str_select = 'SELECT Id, Name, Num, Street, Locality, Town FROM %s \
+                       WHERE Id > ? AND Id <= ? ORDER BY Id LIMIT ?' % (table_name,)
+
+        if min_id is None:
+            _last_id = _cur.execute('SELECT MIN(Id) FROM %s' % (table_name,)).fetchone()[0]
+            if _last_id is None:
+                return
+            _last_id -= 1
+        else:
+            _last_id = min_id - 1
+        if max_id is None:
+            max_id = _cur.execute('SELECT MAX(Id) FROM %s' % (table_name,)).fetchone()[0]
+            if max_id is None:
+                return
+
+        while True:
+            _rows = _cur.execute(_str_select, (_last_id, 
+                                               max_id, 
+                                               batch_size)).fetchall()
+            for _row in _rows:
+                yield (_row[0], self.row_tokens(_row[1:],
+                                                bool_name,
+                                                bool_num,
+                                                bool_street,
+                                                bool_locality,
+                                                bool_town,
+                                                unique))
+            if len(_rows) < batch_size:
+                break
+            _last_id = _rows[-1][0]
+
+    # <token_store> method - Tokenises the rows of <table_name> table (see the 
+    #                        <tokenise_table> method) into a <TokenStore> of 
+    #                        integer token ids. The tokens are interned in 
+    #                        <vocabulary> (a new vocabulary if None).
+    # ---------------------------------------------------------------------------------   
+    def token_store(self, 
+                    sqlite_db,
+                    table_name,
+                    bool_name,
+                    bool_num,
+                    bool_street,
+                    bool_locality,
+                    bool_town,
+                    use_alias,
+                    vocabulary=None,
+                    unique=True):
+
+        """ <sqlite_db>: SQLite database 
+            <table_name>: Table name 
+            <bool_name>: Tokenize Name column [Boolean]
+            <bool_num>: Tokenize Num column [Boolean]
+            <bool_street>: Tokenize Street column [Boolean]
+            <bool_locality>: Tokenize Locality column [Boolean]
+            <bool_town>: Tokenize Town column [Boolean]
+            <use_alias>: Use of Alias names [Boolean]
+            <vocabulary>: Token vocabulary (<TokenVocabulary>)
+            <unique>: Remove the duplicate tokens of each row [Boolean]
+        """
+
+        _store = TokenStore(vocabulary)
+        for _id, _tokens in self.tokenise_table(sqlite_db,
+                                                table_name,
+                                                bool_name,
+                                                bool_num,
+                                                bool_street,
+                                                bool_locality,
+                                                bool_town,
+                                                use_alias,
+                                                unique=unique):
+            _store.add(_id, _tokens)
+        return _store
+
     # <tokenise_mem_address> method - Tokenises the string data stored at the <record_id> 
     #                                 row of <table_name> memory table.
     #                                 Returns a list of <tokens> for a given address
@@ -136,6 +283,8 @@ class Tokenise(object):
     #                            if <remove_digit_tokens> is True. 
     #                            Returns a list of <tokens> for a given address removing
     #                            tokens that they are containing a digit.
+    #                            The <first_token> is reset on each call, so the same
+    #                            instance can tokenise a stream of rows.
     # ---------------------------------------------------------------------------------   
     def tokenise_street(self, 
                         row,
@@ -145,21 +294,17 @@ class Tokenise(object):
             <remove_digit_tokens>: Removing tokens containing a digit [Boolean]
         """
 
-        _digits = re.compile('\d')
-        
-        _tokens = []    
-        _tokens += row.split()       
+        _tokens = row.split()       
         self.tokens = _tokens
+        self.first_token = ''
         
-        if bool(_digits.search(_tokens[0])):
+        if _tokens and bool(DIGITS.search(_tokens[0])):
             self.first_token = _tokens[0]
 
-       
         # Remove tokens consisting of digits only
         if remove_digit_tokens:
-            for _token in self.tokens:
-                self.tokens[:] = [_token for _token in self.tokens 
-                                  if not bool(_digits.search(_token))]
+            self.tokens = [_token for _token in _tokens 
+                           if not DIGITS.search(_token)]
 
         if len(self.tokens) >= 1:
             self.is_tokenised = True
@@ -193,8 +338,7 @@ class Tokenise(object):
         _cur.execute('SELECT Id, Name, Num, Street, Locality, Town \
                       FROM %s' % (table_name)) 
         _tokens = [] 
-        _digits = re.compile('\d')   
-        for _row in _cur.fetchall():
+        for _row in _cur:
             if (_row[1] is not None) and (_row[1] != '') and (bool_name == True):
                 for token in _row[1].split():
                     _tokens.append(token)
@@ -212,7 +356,8 @@ class Tokenise(object):
                     _tokens.append(token)
 
             if (_row[5] is not None) and (_row[5] != '') and (bool_town == True):
-                _tokens += word_tokenize(_row[5])
+                for token in _row[5].split():
+                    _tokens.append(token)
        
         self.tokens = _tokens
 
@@ -236,4 +381,363 @@ class Tokenise(object):
         return  self.tokens
 
 
-   
\ No newline at end of file
+   
+
+    # <refresh_token_table> method - Materialises the tokens of the rows of 
+    #                                <table_name> table in the <table_name>Tokens 
+    #                                table (RecordId, Field, Position, Token). Only 
+    #                                the new and changed rows (hash of the 
+    #                                tokenised values) are tokenised and the tokens 
+    #                                of the removed rows are deleted.
+    #                                Returns the number of (read, tokenised, 
+    #                                removed) rows.
+    # ---------------------------------------------------------------------------------   
+    def refresh_token_table(self, 
+                            sqlite_db,
+                            table_name,
+                            batch_size=10000):
+
+        """ <sqlite_db>: SQLite database 
+            <table_name>: Table name 
+            <batch_size>: Number of rows read by each query
+        """
+
+        print('Refresh <%sTokens> table ...' % (table_name,))
+        _start_timer = time.time() # Timer
+
+        sqlite_db.init_token_tbl(table_name)
+        _cur = sqlite_db.rCur()
+        _str_select = 'SELECT Id, %s FROM %s WHERE Id > ? ORDER BY Id LIMIT ?' % \
+                      (','.join(TOKEN_FIELDS), table_name)
+        _str_hashes = 'SELECT RecordId, RowHash FROM %sTokenRows \
+                       WHERE RecordId > ? AND RecordId <= ?' % (table_name,)
+        _str_delete = 'DELETE FROM %sTokens WHERE RecordId = ?' % (table_name,)
+        _str_insert = 'INSERT INTO %sTokens (RecordId, Field, Position, Token) \
+                       VALUES (?,?,?,?)' % (table_name,)
+        _str_hash = 'INSERT OR REPLACE INTO %sTokenRows (RecordId, RowHash) \
+                     VALUES (?,?)' % (table_name,)
+
+        _rows_read = 0
+        _rows_changed = 0
+        _last_id = -1
+        while True:
+            _rows = _cur.execute(_str_select, (_last_id, batch_size)).fetchall()
+            if not _rows:
+                break
+            _hashes = dict(_cur.execute(_str_hashes, (_last_id, _rows[-1][0])).fetchall())
+            _last_id = _rows[-1][0]
+
+            _changed = []
+            _tokens = []
+            for _row in _rows:
+                _row_hash = hashlib.sha1(repr(_row[1:])).hexdigest()
+                if _hashes.get(_row[0]) == _row_hash:
+                    continue
+                _changed.append((_row[0], _row_hash))
+                for _field, _value in zip(TOKEN_FIELDS, _row[1:]):
+                    if (_value is not None) and (_value != ''):
+                        for _pos, _token in enumerate(unicode(_value).split()):
+                            _tokens.append((_row[0], _field, _pos, _token))
+
+            _cur.executemany(_str_delete, [(_id,) for _id, _row_hash in _changed 
+                                           if _id in _hashes])
+            _cur.executemany(_str_insert, _tokens)
+            _cur.executemany(_str_hash, _changed)
+            sqlite_db.conn.commit()
+            _rows_read += len(_rows)
+            _rows_changed += len(_changed)
+
+        # Tokens of the removed rows
+        _rows_removed = _cur.execute('DELETE FROM %sTokenRows WHERE RecordId NOT IN \
+                                      (SELECT Id FROM %s)' % (table_name,
+                                                              table_name)).rowcount
+        _cur.execute('DELETE FROM %sTokens WHERE RecordId NOT IN \
+                      (SELECT Id FROM %s)' % (table_name, table_name))
+        sqlite_db.conn.commit()
+
+        print ('Rows: %i (%i tokenised, %i removed)' % (_rows_read,
+                                                        _rows_changed,
+                                                        _rows_removed))
+        print ('Time: ' + str(time.time() - _start_timer))  # Timer
+
+        return (_rows_read, _rows_changed, _rows_removed)
+
+class TokenVocabulary(object):
+    """<TokenVocabulary> class for interning the address tokens. Each distinct 
+    token is stored once and is represented by an integer id, so the token lists 
+    of the addresses can be kept in compact integer arrays and compared as integers.
+    """
+    # Constructor: Initialises the properties of <TokenVocabulary> instance.
+    # ---------------------------------------------------------------------------------
+    def __init__(self):
+        self.ids = {}
+        self.tokens = []
+
+    def __len__(self):
+        return len(self.tokens)
+
+    # <token_id> method - Returns the id of <token>. A new token gets the next id.
+    # ---------------------------------------------------------------------------------   
+    def token_id(self, 
+                 token):
+
+        """ <token>: Token string
+        """
+
+        _id = self.ids.get(token)
+        if _id is None:
+            _id = len(self.tokens)
+            self.ids[token] = _id
+            self.tokens.append(token)
+        return _id
+
+    # <encode> method - Returns the array of the ids of <tokens>.
+    # ---------------------------------------------------------------------------------   
+    def encode(self, 
+               tokens):
+
+        """ <tokens>: List of tokens
+        """
+
+        return array('i', [self.token_id(_token) for _token in tokens])
+
+    # <decode> method - Returns the list of the tokens of <token_ids>.
+    # ---------------------------------------------------------------------------------   
+    def decode(self, 
+               token_ids):
+
+        """ <token_ids>: List (or array) of token ids
+        """
+
+        return [self.tokens[_id] for _id in token_ids]
+
+class TokenStore(object):
+    """<TokenStore> class for keeping the token lists of the rows of a table as 
+    integer token ids. The ids of all the rows are stored in one array and the 
+    rows are located by the array of their offsets, so the memory used per token 
+    is a few bytes instead of a string object. The rows have to be added in 
+    ascending Id order.
+    """
+    # Constructor: Initialises the properties of <TokenStore> instance.
+    # ---------------------------------------------------------------------------------
+    def __init__(self, 
+                 vocabulary=None):
+        if vocabulary is None:
+            vocabulary = TokenVocabulary()
+        self.vocabulary = vocabulary
+        self.record_ids = array('l')
+        self.offsets = array('l', [0])
+        self.values = array('i')
+
+    def __len__(self):
+        return len(self.record_ids)
+
+    def __contains__(self, 
+                     record_id):
+        return self.slot(record_id) is not None
+
+    def __getitem__(self, 
+                    record_id):
+        _slot = self.slot(record_id)
+        if _slot is None:
+            raise KeyError(record_id)
+        return self.values[self.offsets[_slot]:self.offsets[_slot + 1]]
+
+    # <add> method - Adds the tokens of the <record_id> row.
+    # ---------------------------------------------------------------------------------   
+    def add(self, 
+            record_id,
+            tokens):
+
+        """ <record_id>: Row identification number (greater than the last row)
+            <tokens>: List of tokens
+        """
+
+        if self.record_ids and (record_id <= self.record_ids[-1]):
+            raise ValueError('Rows must be added in ascending Id order')
+        self.record_ids.append(record_id)
+        self.values.extend(self.vocabulary.encode(tokens))
+        self.offsets.append(len(self.values))
+
+    # <slot> method - Returns the position of the <record_id> row (None if the row 
+    #                 is not in the store).
+    # ---------------------------------------------------------------------------------   
+    def slot(self, 
+             record_id):
+
+        """ <record_id>: Row identification number
+        """
+
+        _slot = bisect.bisect_left(self.record_ids, record_id)
+        if (_slot < len(self.record_ids)) and (self.record_ids[_slot] == record_id):
+            return _slot
+        return None
+
+    # <tokens> method - Returns the list of the token strings of the <record_id> row.
+    # ---------------------------------------------------------------------------------   
+    def tokens(self, 
+               record_id):
+
+        """ <record_id>: Row identification number
+        """
+
+        return self.vocabulary.decode(self[record_id])
+
+class TokenTrie(object):
+    """<TokenTrie> class for matching a list of names (e.g. accepted street names) 
+    in the token list of an address. The names are stored by their tokens, so the 
+    names starting at a token are found in time proportional to their length.
+    """
+    # Constructor: Initialises the properties of <TokenTrie> instance.
+    # ---------------------------------------------------------------------------------
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    # <add> method - Adds the <tokens> of a name and the <value> returned when the 
+    #                name is matched.
+    # ---------------------------------------------------------------------------------   
+    def add(self, 
+            tokens, 
+            value):
+
+        """ <tokens>: List of the name tokens 
+            <value>: Value of the name
+        """
+
+        _node = self.root
+        for _token in tokens:
+            _node = _node.setdefault(_token, {})
+        if None not in _node:
+            self.size += 1
+        # The None key holds the value of a name ending at the node
+        _node[None] = value
+
+    # <prefix_matches> method - Returns the list of (value, token count) tuples of 
+    #                           the names matching the tokens of <tokens> from the 
+    #                           <start> index, using at most <max_tokens> tokens.
+    # ---------------------------------------------------------------------------------   
+    def prefix_matches(self, 
+                       tokens, 
+                       start,
+                       max_tokens):
+
+        """ <tokens>: List of the address tokens 
+            <start>: Index of the first token of the names
+            <max_tokens>: Maximum number of tokens of a name
+        """
+
+        _matches = []
+        _node = self.root
+        for _cnt, _token in enumerate(tokens[start:start + max_tokens]):
+            _node = _node.get(_token)
+            if _node is None:
+                break
+            if None in _node:
+                _matches.append((_node[None], _cnt + 1))
+        return _matches
+
+class TokenSuffixTrie(TokenTrie):
+    """<TokenSuffixTrie> class for matching a list of names (e.g. towns, localities)
+    at the end of the token list of an address. The names are stored by their 
+    reversed tokens, so the matching names of an address are found in time 
+    proportional to the number of its tokens.
+    """
+    # <add> method - Adds the <tokens> of a name and the <value> returned when the 
+    #                name is matched.
+    # ---------------------------------------------------------------------------------   
+    def add(self, 
+            tokens, 
+            value):
+
+        """ <tokens>: List of the name tokens 
+            <value>: Value of the name
+        """
+
+        super(TokenSuffixTrie, self).add(tokens[::-1], value)
+
+    # <suffix_matches> method - Returns the list of (value, token count) tuples of 
+    #                           the names matching the last tokens of <tokens>, 
+    #                           using at most <max_tokens> tokens.
+    # ---------------------------------------------------------------------------------   
+    def suffix_matches(self, 
+                       tokens, 
+                       max_tokens):
+
+        """ <tokens>: List of the address tokens 
+            <max_tokens>: Maximum number of tokens of a name
+        """
+
+        if max_tokens < 1:
+            return []
+        return self.prefix_matches(tokens[::-1], 0, max_tokens)
+
+class AliasResolver(object):
+    """<AliasResolver> class for resolving the alias tokens (e.g. 'st') to the full 
+    names of the Atb table. The Atb table is read once and an alias is resolved to 
+    its highest frequency name (lowest Id for equal frequencies).
+    """
+    # Constructor: Initialises the properties of <AliasResolver> instance.
+    # ---------------------------------------------------------------------------------
+    def __init__(self):
+        self.entries = {}
+        self.alias_ids = {}
+        self.name_ids = {}
+        self.names = {}
+
+    # <load> method - Reads the Alias, Name and Freq values of the Atb table.
+    # ---------------------------------------------------------------------------------   
+    def load(self, sqlite_db):
+
+        """ <sqlite_db>: SQLite database 
+        """
+
+        _cur = sqlite_db.rCur()
+        for _row in _cur.execute('SELECT Id, Alias, Name, Freq FROM Atb ORDER BY Id'):
+            self.entries[_row[0]] = [_row[1], _row[2], _row[3]]
+            self.alias_ids.setdefault(_row[1], []).append(_row[0])
+            self.name_ids.setdefault(_row[2], []).append(_row[0])
+
+        for _alias in self.alias_ids:
+            self.select_name(_alias)
+        return self
+
+    # <select_name> method - Selects the highest frequency name of the <alias>.
+    # ---------------------------------------------------------------------------------   
+    def select_name(self, alias):
+
+        _best_id = None
+        for _id in self.alias_ids[alias]:
+            if (_best_id is None) or (self.entries[_id][2] > self.entries[_best_id][2]):
+                _best_id = _id
+        self.names[alias] = self.entries[_best_id][1]
+
+    # <update_freq> method - Sets the frequency of the Atb rows of the <name> name 
+    #                        as the <Freq> column of the Atb table.
+    # ---------------------------------------------------------------------------------   
+    def update_freq(self, 
+                    name, 
+                    freq):
+
+        for _id in self.name_ids.get(name, []):
+            self.entries[_id][2] = freq
+            self.select_name(self.entries[_id][0])
+
+    # <resolve> method - Returns the full name of the <token> alias or None.
+    # ---------------------------------------------------------------------------------   
+    def resolve(self, token):
+        return self.names.get(token)
+# -------------------------------------------------------------------------------------
+
+# <alias_resolver> function - Returns the alias resolver of the <sqlite_db> database.
+#                             The resolver is created once per database connection.
+# -------------------------------------------------------------------------------------
+def alias_resolver(sqlite_db):
+
+    """ <sqlite_db>: SQLite database 
+    """
+
+    if sqlite_db.alias_resolver is None:
+        sqlite_db.alias_resolver = AliasResolver().load(sqlite_db)
+    return sqlite_db.alias_resolver
+# -------------------------------------------------------------------------------------
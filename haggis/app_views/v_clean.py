@@ -22,4 +22,20 @@ class VClean(object):
     def cmd_clean(self, table_name, field_name):
         print ('Cleaning <' + field_name + '> field in <' + table_name + '> table...')
 
+    # <cmd_clean_table> method - presents the cleaning steps of a table.
+    # --------------------------------------------------------------------------------
+    def cmd_clean_table(self, table_name, step_names):
+        print ('Cleaning <' + table_name + '> table (' + ', '.join(step_names) + ')...')
+
+    # <clean_table_stats> method - presents the rows and the time of each cleaning 
+    # step of a table.
+    # --------------------------------------------------------------------------------
+    def clean_table_stats(self, table_name, step_times, rows_read, rows_updated, run_time):
+        for _step_name, _step_time in step_times:
+            print ('  %s: %.3f sec' % (_step_name, _step_time))
+        print ('<%s> table: %i rows (%i updated), Time: %s' % (table_name,
+                                                               rows_read,
+                                                               rows_updated,
+                                                               str(run_time)))
+
 
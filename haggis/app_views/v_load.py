@@ -28,6 +28,21 @@ class v_load(object):
         print('Loading csv file "%s" (auto read fields: "%s") ...' % (csv_file, 
                                                                       auto_fields))
 
+    # <load_csv_changes> method - presents the changes of an incremental load.
+    # --------------------------------------------------------------------------------
+    def load_csv_changes(self, table_name, rows_inserted, rows_updated, rows_deleted):
+        print('<%s> table changes: %i inserted, %i updated, %i deleted rows' % (table_name,
+                                                                              rows_inserted,
+                                                                              rows_updated,
+                                                                              rows_deleted))
 
-
-
+    # <load_csv_stats> method - presents the loading throughput of a table.
+    # --------------------------------------------------------------------------------
+    def load_csv_stats(self, table_name, rows_loaded, load_time):
+        _rows_sec = 0.0
+        if load_time > 0:
+            _rows_sec = rows_loaded / load_time
+        print('Loaded %i rows to <%s> table in %.2f sec (%.0f rows/sec)' % (rows_loaded,
+                                                                         table_name,
+                                                                         load_time,
+                                                                         _rows_sec))
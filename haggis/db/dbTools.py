@@ -39,6 +39,9 @@ class dbSQLiteManager(object):
         self.conn.execute('PRAGMA count_changes = OFF')
         self.conn.commit()
         self.cur = self.conn.cursor()
+        # Alias resolver of the Atb table, shared by the cleaning and matching 
+        # processes of the database (see the <m_tokenise> model)
+        self.alias_resolver = None
     # -------------------------------------------------------------------------
 
     # Applies the <sqlschema> schema to the <db> initialised SQLite database
@@ -169,3 +172,126 @@ class dbSQLiteManager(object):
                           Density real)")
         self.cur.execute("CREATE INDEX LUT_Regions_idx_Id ON LUT_Regions (RegionId ASC)")
     # -------------------------------------------------------------------------
+
+    # Initialise LoadCheckpoint table (bookkeeping of the csv loading process).
+    # The table is not part of the schema and survives the schema application.
+    # -------------------------------------------------------------------------
+    def init_checkpoint_tbl (self):
+
+        self.cur.execute("CREATE TABLE if not exists LoadCheckpoint ( \
+                          TableName text NOT NULL PRIMARY KEY, \
+                          CsvPath text, \
+                          CsvSize integer, \
+                          CsvMtime real, \
+                          ByteOffset integer, \
+                          RowNum integer, \
+                          Done integer NOT NULL DEFAULT 0)")
+        self.conn.commit()
+    # -------------------------------------------------------------------------
+
+    # Initialise the tables of the incremental loading of the Ctb table: the
+    # LoadManifest table (hashes of the loaded csv files) and the CtbSrc table 
+    # (csv rows and their hashes). The tables are not part of the schema and 
+    # survive the schema application.
+    # -------------------------------------------------------------------------
+    def init_incremental_tbls (self):
+
+        self.cur.execute("CREATE TABLE if not exists LoadManifest ( \
+                          TableName text NOT NULL PRIMARY KEY, \
+                          CsvPath text, \
+                          FileHash text)")
+        self.cur.execute("CREATE TABLE if not exists CtbSrc ( \
+                          Id integer NOT NULL PRIMARY KEY AUTOINCREMENT, \
+                          Cid integer NOT NULL, \
+                          Name text, \
+                          Num text, \
+                          Street text, \
+                          CPCode text, \
+                          Locality text, \
+                          Town text, \
+                          GREasting real, \
+                          GRNorthing real, \
+                          DistCode text, \
+                          RowHash text)")
+        self.conn.commit()
+    # -------------------------------------------------------------------------
+
+    # Creates the NormCache table (normalised values of the raw address strings 
+    # for the fingerprint of the cleaning settings). The table is not part of the 
+    # schema and survives the schema application.
+    # -------------------------------------------------------------------------
+    def init_norm_cache_tbl (self):
+
+        self.cur.execute("CREATE TABLE if not exists NormCache ( \
+                          Fingerprint text NOT NULL, \
+                          Field text NOT NULL, \
+                          RawValue text NOT NULL, \
+                          Value text, \
+                          PRIMARY KEY (Fingerprint, Field, RawValue))")
+        self.conn.commit()
+    # -------------------------------------------------------------------------
+
+    # Creates the Snapshots table (snapshot views of the tables and the columns 
+    # of the snapshot point). The rows removed from a table after the snapshot 
+    # point are kept in the <Name>Delta table.
+    # -------------------------------------------------------------------------
+    def init_snapshot_tbl (self):
+
+        self.cur.execute("CREATE TABLE if not exists Snapshots ( \
+                          Name text NOT NULL PRIMARY KEY, \
+                          TableName text NOT NULL, \
+                          Columns text NOT NULL)")
+        self.conn.commit()
+    # -------------------------------------------------------------------------
+
+    # Creates the <table_name>Tokens table (tokens of the Name, Num, Street, 
+    # Locality and Town columns of each row) and the <table_name>TokenRows table
+    # (hash of the tokenised values of each row). The tables are not part of the 
+    # schema and are refreshed by the <refresh_token_table> method of <Tokenise>.
+    # -------------------------------------------------------------------------
+    def init_token_tbl (self, table_name):
+
+        self.cur.execute("CREATE TABLE if not exists %sTokens ( \
+                          RecordId integer NOT NULL, \
+                          Field text NOT NULL, \
+                          Position integer NOT NULL, \
+                          Token text NOT NULL, \
+                          PRIMARY KEY (RecordId, Field, Position))" % (table_name,))
+        self.cur.execute("CREATE INDEX if not exists %sTokens_idx_Token \
+                          ON %sTokens (Token, Field)" % (table_name, table_name))
+        self.cur.execute("CREATE TABLE if not exists %sTokenRows ( \
+                          RecordId integer NOT NULL PRIMARY KEY, \
+                          RowHash text NOT NULL)" % (table_name,))
+        self.conn.commit()
+    # -------------------------------------------------------------------------
+
+    # Creates the CtbFts full-text index (Name, Street, Locality and Town of the
+    # Ctb rows, docid = Ctb Id) and the FtsIndex table (fingerprint of the 
+    # indexed rows). The tables are not part of the schema and are rebuilt by 
+    # the <ctb_fts_index> method of <Match> when the Ctb rows change.
+    # -------------------------------------------------------------------------
+    def init_fts_index_tbl (self):
+
+        self.cur.execute("CREATE VIRTUAL TABLE if not exists CtbFts \
+                          USING fts3(Name,Street,Locality,Town)")
+        self.cur.execute("CREATE TABLE if not exists FtsIndex ( \
+                          Name text NOT NULL PRIMARY KEY, \
+                          Fingerprint text NOT NULL)")
+        self.conn.commit()
+    # -------------------------------------------------------------------------
+
+    # Returns True if a previous csv loading process has not been completed.
+    # -------------------------------------------------------------------------
+    def has_checkpoints (self):
+
+        self.cur.execute("SELECT COUNT(*) FROM LoadCheckpoint")
+        return self.cur.fetchone()[0] > 0
+    # -------------------------------------------------------------------------
+
+    # Removes the checkpoints of the csv loading process.
+    # -------------------------------------------------------------------------
+    def clear_checkpoints (self):
+
+        self.cur.execute("DELETE FROM LoadCheckpoint")
+        self.conn.commit()
+    # -------------------------------------------------------------------------
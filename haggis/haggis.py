@@ -54,10 +54,19 @@ def create_db (cfg_data):
 
         # Create SQLite database.
         newdb = DB.dbSQLiteManager(cfg_data.cfg_db_path)
-        newdb.apply_schema_db(cfg_data.cfg_db_path,
-                                cfg_data.cfg_db_schema)
-        newdb.apply_indexes_db(cfg_data.cfg_db_path,
-                                cfg_data.cfg_db_indexes)
+        newdb.init_checkpoint_tbl()
+        if cfg_data.cfg_incremental_ctb:
+            newdb.init_incremental_tbls()
+
+        # Resume an interrupted loading process or apply the schema
+        if cfg_data.cfg_resume_load and newdb.has_checkpoints():
+            print('Resuming the loading process of "%s"' % cfg_data.cfg_db_path)
+        else:
+            newdb.clear_checkpoints()
+            newdb.apply_schema_db(cfg_data.cfg_db_path,
+                                    cfg_data.cfg_db_schema)
+            newdb.apply_indexes_db(cfg_data.cfg_db_path,
+                                    cfg_data.cfg_db_indexes)
 
         # Add records to Atb
         if (cfg_data.cfg_atb_alias is None or
@@ -184,6 +193,10 @@ def create_db (cfg_data):
                                         cfg_data.cfg_delimiter,
                                         cfg_data.cfg_quote_char,
                                         False)
+
+        # All csv files are loaded
+        newdb.clear_checkpoints()
+
         # Close SQLite database
         newdb.close_db()
 
@@ -216,8 +229,31 @@ if __name__ == "__main__":
             opendb = DB.dbSQLiteManager(cfg_data.cfg_db_path)
             opendb.cur
 
+            # The Ctb and Htb rows are already cleaned if the cleaning is applied 
+            # while loading the csv files (mapped fields only)
+            ctb_cleaned = (cfg_data.cfg_clean_on_load and 
+                           cfg_data.cfg_db_schema is not None and 
+                           cfg_data.cfg_ctb_cid != '')
+            htb_cleaned = (cfg_data.cfg_clean_on_load and 
+                           cfg_data.cfg_db_schema is not None and 
+                           cfg_data.cfg_htb_hid != '')
+
+            # Single pass cleaning of each table, replaces the separate cleaning 
+            # processes below
+            if cfg_data.cfg_clean_pipeline:
+                for table_name, cleaned_on_load in (('Ctb', ctb_cleaned),
+                                                    ('Htb', htb_cleaned),
+                                                    ('Atb', False),
+                                                    ('STtb', False)):
+                    app_clean = CClean.CClean()
+                    app_clean.clean_table(opendb,
+                                          table_name,
+                                          cfg_data,
+                                          cleaned_on_load)
+            step_clean = not cfg_data.cfg_clean_pipeline
+
             # Clean process for Ctb table
-            if cfg_data.ctb_fields:
+            if step_clean and cfg_data.ctb_fields and not ctb_cleaned:
                 for fld in cfg_data.ctb_fields:
                     app_clean = CClean.CClean()
                     app_clean.clean_field(opendb,
@@ -228,7 +264,7 @@ if __name__ == "__main__":
                                           cfg_data.cfg_punct)
 
             # Clean process for Htb table
-            if cfg_data.htb_fields:
+            if step_clean and cfg_data.htb_fields and not htb_cleaned:
                 for fld in cfg_data.htb_fields:
                     app_clean = CClean.CClean()
                     app_clean.clean_field(opendb,
@@ -240,7 +276,7 @@ if __name__ == "__main__":
 
 
             # Clean process for Atb table
-            if cfg_data.atb_fields:
+            if step_clean and cfg_data.atb_fields:
                 for fld in cfg_data.atb_fields:
                     app_clean = CClean.CClean()
                     app_clean.clean_field(opendb,
@@ -251,7 +287,7 @@ if __name__ == "__main__":
                                           cfg_data.cfg_punct)
 
             # Clean process for STtb table
-            if cfg_data.sttb_fields:
+            if step_clean and cfg_data.sttb_fields:
                 for fld in cfg_data.sttb_fields:
                     app_clean = CClean.CClean()
                     app_clean.clean_field(opendb,
@@ -262,44 +298,48 @@ if __name__ == "__main__":
                                           cfg_data.cfg_punct)
 
             # Clean address numbers
-            if cfg_data.cfg_rm_address_num:
+            if step_clean and cfg_data.cfg_rm_address_num:
                 app_clean = CClean.CClean()
-                app_clean.remove_address_numbers(opendb,
-                                                 'Ctb', 
-                                                 'Street')
-                app_clean.remove_address_numbers(opendb,
-                                                 'Htb', 
-                                                 'Street')
+                if not ctb_cleaned:
+                    app_clean.remove_address_numbers(opendb,
+                                                     'Ctb', 
+                                                     'Street')
+                if not htb_cleaned:
+                    app_clean.remove_address_numbers(opendb,
+                                                     'Htb', 
+                                                     'Street')
 
             # Clean Town information
-            if cfg_data.cfg_rm_town:
+            if step_clean and cfg_data.cfg_rm_town:
                 app_clean = CClean.CClean()
                 app_clean.remove_special_tokens(opendb,
                                                 'Htb',
                                                 'Street',
                                                 'Town',
-                                                cfg_data.cfg_towns_csv)
+                                                cfg_data.cfg_towns_csv,
+                                                cfg_data.cfg_csv_encoding)
 
             # Clean Locality information
-            if cfg_data.cfg_rm_locality:
+            if step_clean and cfg_data.cfg_rm_locality:
                 app_clean = CClean.CClean()
                 app_clean.remove_special_tokens(opendb,
                                                 'Htb',
                                                 'Street',
                                                 'Locality',
-                                                cfg_data.cfg_localities_csv)
+                                                cfg_data.cfg_localities_csv,
+                                                cfg_data.cfg_csv_encoding)
 
 
-            # Clone Htb table
+            # Snapshot of Htb table (HtbFull)
             app_clean = CClean.CClean()
-            app_clean.clone_table(opendb,
-                                  'Htb', 
-                                  'HtbFull')
-
-            # Clone Ctb table
-            app_clean.clone_table(opendb,
-                                  'Ctb', 
-                                  'CtbFull')
+            app_clean.snapshot_table(opendb,
+                                     'Htb', 
+                                     'HtbFull')
+
+            # Snapshot of Ctb table (CtbFull)
+            app_clean.snapshot_table(opendb,
+                                     'Ctb', 
+                                     'CtbFull')
             
             # Remove Htb street duplicates
             if cfg_data.cfg_rm_htb_street_duplicates: 
@@ -315,6 +355,12 @@ if __name__ == "__main__":
                                                    'Ctb',
                                                    cfg_data.cfg_ctb_group_by_fields)
             
+            # Refresh the token tables (HtbTokens and CtbTokens)
+            if cfg_data.cfg_token_tables:
+                app_tokenise = CTokenise.CTokenise()
+                app_tokenise.refresh_token_table(opendb, 'Htb')
+                app_tokenise.refresh_token_table(opendb, 'Ctb')
+
             # Build Frequency tables
             if cfg_data.cfg_db_freq_tables:
                 app_clean = CMatch.CMatch()
@@ -322,19 +368,31 @@ if __name__ == "__main__":
                                            cfg_data.cfg_db_freq_tables,
                                            cfg_data.cfg_db_freq_ctb_limit,
                                            cfg_data.cfg_db_freq_htb_limit,
-                                           cfg_data.cfg_alias)
+                                           cfg_data.cfg_alias,
+                                           cfg_data.cfg_token_tables)
 
             # Replace aliases
             if cfg_data.cfg_alias:
 
                 app_clean = CClean.CClean()
+                app_clean.set_norm_cache(cfg_data.cfg_norm_cache_size,
+                                         cfg_data.cfg_norm_cache_persist)
+                if cfg_data.cfg_token_tables:
+                    app_clean.replace_aliases(opendb,
+                                              'Htb',
+                                              'Street',
+                                              cfg_data.cfg_accept_substring,
+                                              'HtbTokens')
+                    app_tokenise.refresh_token_table(opendb, 'Htb')
+                else:
+                    app_clean.replace_aliases(opendb,
+                                              'Htb',
+                                              'Street',
+                                              cfg_data.cfg_accept_substring)
+
+                # Rows of HtbFull removed from Htb or changed by the alias replacement
                 app_clean.replace_aliases(opendb,
-                                          'Htb',
-                                          'Street',
-                                          cfg_data.cfg_accept_substring)
-
-                app_clean.replace_aliases(opendb,
-                                          'HtbFull',
+                                          'HtbFullDelta',
                                           'Street',
                                           cfg_data.cfg_accept_substring)
 
@@ -362,7 +420,10 @@ if __name__ == "__main__":
                                               cfg_data.cfg_db_freq_ctb_limit,
                                               cfg_data.cfg_db_freq_htb_limit,
                                               False,
-                                              False)
+                                              False,
+                                              cfg_data.cfg_match_workers,
+                                              cfg_data.cfg_blocking_keys,
+                                              cfg_data.cfg_expand_distance)
                 print ('Matching Process Time: ' + str(time.time() - _start_timer))  # Timer
 
                 # Close SQLite database
@@ -1,8 +1,390 @@
 ﻿import unittest
+import os
+import tempfile
+import db.dbTools as DB
+from app_models import m_clean, m_load, m_tokenise
 
 class Test_clean(unittest.TestCase):
     def test_A(self):
         self.fail("Not implemented")
 
+    def test_clean_field(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Street) VALUES (?,?)',
+                                  [(1, u' 12, High-St. '),
+                                   (2, u'Who? K\xd6nig'),
+                                   (3, u''),
+                                   (4, None),
+                                   (5, u'mill lane')])
+
+        model = m_clean.Clean()
+        changes = sqlite_db.conn.total_changes
+        model.clean_field(sqlite_db, 'Htb', 'Street', True, True, True)
+
+        result = sqlite_db.cur.execute('SELECT Street FROM Htb').fetchall()
+        gold = [(u'12 highst',), (u'who? k\xf6nig',), (u'',), (None,), (u'mill lane',)]
+        self.assertEqual(result, gold)
+        # The clean values are not written
+        self.assertEqual(sqlite_db.conn.total_changes - changes, 2)
+        self.assertEqual(model.clean_string('A.B', False, False, True), 'AB')
+
+    def test_remove_address_numbers(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Ctb (Cid, Num, Street) VALUES (?,?,?)',
+                                  [(1, None, u'12 high st'),
+                                   (2, u'7', u'mill lane 3'),
+                                   (3, u'7', u'mill  lane'),
+                                   (4, None, u''),
+                                   (5, None, u'4a kings rd')])
+
+        model = m_clean.Clean()
+        model.remove_address_numbers(sqlite_db, 'Ctb', 'Street', 2)
+
+        result = sqlite_db.cur.execute('SELECT Num, Street FROM Ctb').fetchall()
+        gold = [(u'12', u'high st'), 
+                (u'7', u'mill lane'), 
+                (u'7', u'mill lane'), 
+                (None, u''), 
+                (u'4a', u'kings rd')]
+        self.assertEqual(result, gold)
+
+    def test_remove_special_tokens(self):
+        csv_fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        os.write(csv_fd, 'hill\r\ncastle hill\r\nleith\r\nnew  town\r\n')
+        os.close(csv_fd)
+
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Street) VALUES (?,?)',
+                                  [(1, u'12 main st castle hill'),
+                                   (2, u'main st leith'),
+                                   (3, u'leith'),
+                                   (4, u'main st new town'),
+                                   (5, u'')])
+
+        model = m_clean.Clean()
+        model.remove_special_tokens(sqlite_db, 'Htb', 'Street', 'Town', csv_path, 2)
+        os.remove(csv_path)
+
+        result = sqlite_db.cur.execute('SELECT Street, Town FROM Htb').fetchall()
+        gold = [(u'main st', u'castle hill'),
+                (u'main st', u'leith'),
+                (u'leith', None),
+                (u'main st new town', None),
+                (u'', None)]
+        self.assertEqual(result, gold)
+
+    def test_remove_special_tokens_encoding(self):
+        csv_fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        os.write(csv_fd, 'leith\r\nk\xf6nigsberg\r\n')
+        os.close(csv_fd)
+
+        results = []
+        for encoding in ('latin-1', 'utf-8'):
+            sqlite_db = DB.dbSQLiteManager(':memory:')
+            schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+            with open(schema, 'r') as f:
+                sqlite_db.cur.executescript(f.read())
+            sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Street) VALUES (?,?)',
+                                      [(1, u'main st leith'),
+                                       (2, u'main st k\xf6nigsberg')])
+
+            model = m_clean.Clean()
+            model.remove_special_tokens(sqlite_db, 'Htb', 'Street', 'Town', csv_path, 
+                                        2, encoding)
+            results.append(sqlite_db.cur.execute('SELECT Street, Town FROM Htb').fetchall())
+        os.remove(csv_path)
+
+        # The latin-1 file is not utf-8 encoded, its undecodable name is not matched
+        self.assertEqual(results, [[(u'main st', u'leith'), (u'main st', u'k\xf6nigsberg')],
+                                   [(u'main st', u'leith'), (u'main st k\xf6nigsberg', None)]])
+
+    def test_remove_street_duplicates(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        db_dir = os.path.join(os.path.dirname(__file__), '..', 'db')
+        for sql_file in ('hag_schema.sql', 'hag_indexes.sql'):
+            with open(os.path.join(db_dir, sql_file), 'r') as f:
+                sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Street, DistCode) VALUES (?,?,?)',
+                                  [(1, u'high st', u'685'),
+                                   (2, u'mill lane', u'685'),
+                                   (3, u'high st', u'685'),
+                                   (4, u'high st', u'686'),
+                                   (5, None, u'686'),
+                                   (6, None, u'686')])
+
+        model = m_clean.Clean()
+        model.remove_street_duplicates(sqlite_db, 'Htb', ['Street', 'DistCode'])
+
+        result = sqlite_db.cur.execute('SELECT Id, Hid, Street, CntEvents FROM Htb').fetchall()
+        gold = [(1, 1, u'high st', 2),
+                (2, 2, u'mill lane', 1),
+                (4, 4, u'high st', 1),
+                (5, 5, None, 2)]
+        self.assertEqual(result, gold)
+        result = sqlite_db.cur.execute('SELECT Id, RepId FROM HtbDupMap').fetchall()
+        self.assertEqual(result, [(1, 1), (2, 2), (3, 1), (4, 4), (5, 5), (6, 5)])
+        indexes = sqlite_db.cur.execute("SELECT name FROM sqlite_master WHERE \
+                                         type = 'index' AND tbl_name = 'Htb'").fetchall()
+        self.assertIn((u'Htb_idx_Street',), indexes)
+
+    def test_snapshot_table(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Street, DistCode) VALUES (?,?,?)',
+                                  [(1, u'high st', u'685'),
+                                   (2, u'mill lane', u'685'),
+                                   (3, u'high st', u'685')])
+
+        model = m_clean.Clean()
+        model.clone_table(sqlite_db, 'Htb', 'HtbCopy')
+        model.snapshot_table(sqlite_db, 'Htb', 'HtbFull')
+        model.remove_street_duplicates(sqlite_db, 'Htb', ['Street', 'DistCode'])
+        self.assertEqual(sqlite_db.cur.execute('SELECT COUNT(*) FROM Htb').fetchone(), (2,))
+
+        result = sqlite_db.cur.execute('SELECT * FROM HtbFull ORDER BY Id').fetchall()
+        gold = sqlite_db.cur.execute('SELECT * FROM HtbCopy ORDER BY Id').fetchall()
+        self.assertEqual(result, gold)
+        result = sqlite_db.cur.execute('SELECT Id FROM HtbFullDelta').fetchall()
+        self.assertEqual(result, [(3,)])
+
+        # The snapshot keeps the values of the changed and deleted rows
+        sqlite_db.cur.execute("UPDATE Htb SET Street = 'mill road' WHERE Id = 2")
+        sqlite_db.cur.execute("UPDATE Htb SET Street = 'mill street' WHERE Id = 2")
+        sqlite_db.cur.execute("DELETE FROM Htb WHERE Id = 1")
+        result = sqlite_db.cur.execute('SELECT * FROM HtbFull ORDER BY Id').fetchall()
+        self.assertEqual(result, gold)
+        result = sqlite_db.cur.execute('SELECT Street FROM Htb').fetchall()
+        self.assertEqual(result, [(u'mill street',)])
+
+        # A new snapshot replaces the previous one
+        model.snapshot_table(sqlite_db, 'Htb', 'HtbFull')
+        self.assertEqual(sqlite_db.cur.execute('SELECT COUNT(*) FROM HtbFull').fetchone(), (1,))
+        self.assertEqual(sqlite_db.cur.execute('SELECT COUNT(*) FROM HtbFullDelta').fetchone(), (0,))
+
+    def test_replace_aliases(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Atb (Alias, Name, Freq) VALUES (?,?,?)',
+                                  [(u'st', u'saint', 1),
+                                   (u'st', u'street', 1),
+                                   (u'rd', u'road', 1),
+                                   (u'rd', u'rood', 2)])
+        sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Street) VALUES (?,?)',
+                                  [(1, u'st james st'),
+                                   (2, u'kings rd'),
+                                   (3, u'mill lane')])
+
+        model = m_clean.Clean()
+        model.replace_aliases(sqlite_db, 'Htb', 'Street', False, 2)
+        result = sqlite_db.cur.execute('SELECT Street FROM Htb').fetchall()
+        self.assertEqual(result, [(u'st james saint',), (u'kings rood',), (u'mill lane',)])
+
+        # Frequency changes of the Atb table
+        sqlite_db.alias_resolver.update_freq(u'street', 5)
+        self.assertEqual(sqlite_db.alias_resolver.resolve(u'st'), u'street')
+        self.assertEqual(sqlite_db.alias_resolver.resolve(u'lane'), None)
+
+    def test_replace_aliases_token_table(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Atb (Alias, Name, Freq) VALUES (?,?,?)',
+                                  [(u'st', u'street', 1),
+                                   (u'rd', u'road', 1)])
+        sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Street) VALUES (?,?)',
+                                  [(1, u'st james st'),
+                                   (2, u'kings rd'),
+                                   (3, u'mill lane'),
+                                   (4, u'rd end')])
+        m_tokenise.Tokenise().refresh_token_table(sqlite_db, 'Htb')
+
+        model = m_clean.Clean()
+        model.replace_aliases(sqlite_db, 'Htb', 'Street', False, 1, 'HtbTokens')
+        result = sqlite_db.cur.execute('SELECT Street FROM Htb').fetchall()
+        self.assertEqual(result, [(u'st james street',), (u'kings road',), 
+                                  (u'mill lane',), (u'rd end',)])
+
+    def test_check_tokens(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO STtb (Name) VALUES (?)',
+                                  [(u'st james',), (u'st james st',), (u'rd',), (u'',)])
+
+        model = m_clean.Clean()
+        self.assertEqual(model.check_tokens(sqlite_db, [u'12', u'st', u'james', u'st']), 
+                         set([1, 2, 3]))
+        self.assertEqual(model.check_tokens(sqlite_db, [u'rd', u'st', u'rd']), set([0]))
+        self.assertEqual(model.check_tokens(sqlite_db, []), set())
+        self.assertEqual(model.sttb_trie.size, 3)
+
+    def test_clean_pipeline(self):
+        towns_fd, towns_path = tempfile.mkstemp(suffix='.csv')
+        os.write(towns_fd, 'leith\r\nportobello\r\n')
+        os.close(towns_fd)
+        localities_fd, localities_path = tempfile.mkstemp(suffix='.csv')
+        os.write(localities_fd, 'castle hill\r\n')
+        os.close(localities_fd)
+
+        app_config = m_load.AppConfig()
+        app_config.htb_fields = ['Name', 'Street']
+        app_config.cfg_punct = True
+        app_config.cfg_rm_town = True
+        app_config.cfg_rm_locality = True
+        app_config.cfg_towns_csv = towns_path
+        app_config.cfg_localities_csv = localities_path
+
+        results = []
+        for pipeline in (False, True, 'cache'):
+            sqlite_db = DB.dbSQLiteManager(':memory:')
+            schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+            with open(schema, 'r') as f:
+                sqlite_db.cur.executescript(f.read())
+            sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Name, Street) VALUES (?,?,?)',
+                                      [(1, u'J. Smith', u'12 High St. Leith'),
+                                       (2, u'Ann', u' Main-St Castle Hill '),
+                                       (3, u'', u'Portobello'),
+                                       (4, u'Who?', u'')])
+
+            if pipeline:
+                model = m_clean.CleanPipeline()
+                model.add_clean_steps(app_config, 'Htb', False)
+                if pipeline == 'cache':
+                    model.cache = m_clean.NormalisationCache(2, False)
+                model.run(sqlite_db, 'Htb', 3)
+                self.assertEqual([step[0] for step in model.steps], 
+                                 ['Clean Name', 'Clean Street', 'Remove address numbers',
+                                  'Remove towns', 'Remove localities'])
+            else:
+                model = m_clean.Clean()
+                for fld in app_config.htb_fields:
+                    model.clean_field(sqlite_db, 'Htb', fld, True, True, True)
+                    model.remove_address_numbers(sqlite_db, 'Htb', fld)
+                model.remove_address_numbers(sqlite_db, 'Htb', 'Street')
+                model.remove_special_tokens(sqlite_db, 'Htb', 'Street', 'Town', towns_path)
+                model.remove_special_tokens(sqlite_db, 'Htb', 'Street', 'Locality', 
+                                            localities_path)
+            results.append(sqlite_db.cur.execute('SELECT * FROM Htb').fetchall())
+        os.remove(towns_path)
+        os.remove(localities_path)
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(results[1][0][2:7], 
+                         (u'j smith', u'12', u'high st', None, None))
+        self.assertEqual(results[1][0][7], u'leith')
+
+    def test_norm_cache(self):
+        app_config = m_load.AppConfig()
+        app_config.htb_fields = ['Street']
+        app_config.cfg_punct = True
+
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        rows = [(1, u'12 High St.'), (2, u'Mill Lane'), (3, u'12 High St.')]
+
+        results = []
+        for run in range(2):
+            sqlite_db.cur.execute('DELETE FROM Htb')
+            sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Street) VALUES (?,?)', rows)
+            model = m_clean.CleanPipeline()
+            model.add_clean_steps(app_config, 'Htb', False)
+            model.cache = m_clean.NormalisationCache(10, True)
+            model.run(sqlite_db, 'Htb')
+            results.append(sqlite_db.cur.execute('SELECT Num, Street FROM Htb').fetchall())
+            # First run: 2 values computed, second run: values read from NormCache
+            self.assertEqual((model.cache.hits, model.cache.misses), 
+                             [(1, 2), (3, 0)][run])
+
+        self.assertEqual(results[0], [(u'12', u'high st'), (None, u'mill lane'), 
+                                      (u'12', u'high st')])
+        self.assertEqual(results[0], results[1])
+
+        cache = m_clean.NormalisationCache(2, False)
+        for key in ('a', 'b', 'a', 'c'):
+            cache.put(('Street', key), (key,))
+        self.assertEqual(list(cache.values.keys()), [('Street', 'a'), ('Street', 'c')])
+
+    def test_clean_pipeline_parallel(self):
+        app_config = m_load.AppConfig()
+        app_config.htb_fields = ['Name', 'Street']
+        app_config.cfg_punct = True
+
+        db_fd, db_path = tempfile.mkstemp(suffix='.db')
+        os.close(db_fd)
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+
+        results = []
+        for workers in (1, 3):
+            sqlite_db = DB.dbSQLiteManager(db_path)
+            with open(schema, 'r') as f:
+                sqlite_db.cur.executescript(f.read())
+            sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Name, Street) VALUES (?,?,?)',
+                                      [(i, u'Name %i.' % (i % 13), u'%i High-St.' % (i % 17)) 
+                                       for i in range(500)])
+            sqlite_db.conn.commit()
+
+            model = m_clean.CleanPipeline()
+            model.add_clean_steps(app_config, 'Htb', False)
+            model.workers = workers
+            model.run(sqlite_db, 'Htb', 64)
+            self.assertEqual(model.rows_read, 500)
+            results.append(sqlite_db.cur.execute('SELECT * FROM Htb').fetchall())
+            sqlite_db.close_db()
+        os.remove(db_path)
+
+        self.assertEqual(results[0][:1], [(1, 0, u'name', u'0', u'highst', 
+                                           None, None, None, None, None)])
+        self.assertEqual(results[0], results[1])
+
+    def test_clean_pipeline_parallel_cache_spill(self):
+        app_config = m_load.AppConfig()
+        app_config.htb_fields = ['Name', 'Street']
+        app_config.cfg_punct = True
+
+        db_fd, db_path = tempfile.mkstemp(suffix='.db')
+        os.close(db_fd)
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+
+        sqlite_db = DB.dbSQLiteManager(db_path)
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Name, Street) VALUES (?,?,?)',
+                                  [(i, u'Name %i.' % (i % 13), 
+                                    u'%i High-St. %s' % (i % 17, u'x' * 50)) 
+                                   for i in range(5000)])
+        sqlite_db.conn.commit()
+        # The written pages spill from the cache of the writer while the worker 
+        # processes read the table
+        sqlite_db.cur.execute('PRAGMA cache_size = 1')
+
+        model = m_clean.CleanPipeline()
+        model.add_clean_steps(app_config, 'Htb', False)
+        model.workers = 3
+        model.run(sqlite_db, 'Htb', 64)
+        result = sqlite_db.cur.execute("SELECT COUNT(*) FROM Htb WHERE Street LIKE '%highst%'").fetchone()
+        sqlite_db.close_db()
+        os.remove(db_path)
+
+        self.assertEqual(model.rows_read, 5000)
+        self.assertEqual(result, (5000,))
+
 if __name__ == '__main__':
     unittest.main()
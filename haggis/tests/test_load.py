@@ -1,8 +1,353 @@
 ﻿import unittest
+import os
+import tempfile
+import gzip
+import bz2
+import db.dbTools as DB
+from app_models import m_load, m_clean
 
 class Test_load(unittest.TestCase):
     def test_A(self):
         self.fail("Not implemented")
 
+    def test_load_csv_bulk(self):
+        csv_fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        os.write(csv_fd, 'ID|Street|Year|RD\n'
+                         '0|first row|1851|1\n'
+                         '1|12 high st|1851|685\n'
+                         "2|king's rd|1861|685\n"
+                         'x3|mill lane|1861|686\n')
+        os.close(csv_fd)
+
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+
+        model = m_load.CsvData()
+        model.csv_filename = csv_path
+        model.field_names = [('Hid', 'ID'), ('Street', 'Street'), 
+                             ('HYear', 'Year'), ('DistCode', 'RD')]
+        model.delimiter = '|'
+        model.quote_char = '"'
+        model.bulk_load = True
+        model.batch_size = 2
+        model.load_csv(sqlite_db, 'Htb', False)
+        os.remove(csv_path)
+
+        result = sqlite_db.cur.execute('SELECT Id, Hid, Street, HYear, DistCode \
+                                        FROM Htb').fetchall()
+        gold = [(1, 1, u'12 high st', u'1851', u'685'),
+                (2, 2, u'kings rd', u'1861', u'685'),
+                (3, u'x3', u'mill lane', u'1861', u'686')]
+        self.assertEqual(model.rows_loaded, 3)
+        self.assertEqual(result, gold)
+
+    def test_load_yaml_file_defaults(self):
+        # A configuration file without the performance settings
+        config = os.path.join(os.path.dirname(__file__), '..', 'config.yaml')
+        with open(config, 'r') as f:
+            lines = f.readlines()
+        start = lines.index('bulk_load: False\n')
+        end = lines.index('expand_distance: 0\n') + 1
+        yaml_fd, yaml_path = tempfile.mkstemp(suffix='.yaml')
+        os.write(yaml_fd, ''.join(lines[:start] + lines[end:]))
+        os.close(yaml_fd)
+
+        app_config = m_load.AppConfig()
+        app_config.load_yaml_file(yaml_path)
+        os.remove(yaml_path)
+
+        gold = m_load.AppConfig()
+        self.assertEqual(app_config.cfg_bulk_load, gold.cfg_bulk_load)
+        self.assertEqual(app_config.cfg_bulk_batch_size, gold.cfg_bulk_batch_size)
+        self.assertEqual(app_config.cfg_csv_encoding, gold.cfg_csv_encoding)
+        self.assertEqual(app_config.cfg_incremental_ctb, gold.cfg_incremental_ctb)
+        self.assertEqual(app_config.cfg_clean_workers, gold.cfg_clean_workers)
+        self.assertEqual(app_config.cfg_token_tables, gold.cfg_token_tables)
+        self.assertEqual(app_config.cfg_blocking_keys, gold.cfg_blocking_keys)
+        self.assertEqual(app_config.cfg_expand_distance, gold.cfg_expand_distance)
+
+    def test_load_csv_encoding(self):
+        csv_fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        os.write(csv_fd, 'ID|Street|Year|RD\n'
+                         '0|first row|1851|1\n'
+                         '1|k\xf6nig st|1851|685\n')
+        os.close(csv_fd)
+
+        results = []
+        for encoding in ('latin-1', 'utf-8'):
+            sqlite_db = DB.dbSQLiteManager(':memory:')
+            schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+            with open(schema, 'r') as f:
+                sqlite_db.cur.executescript(f.read())
+
+            model = m_load.CsvData()
+            model.csv_filename = csv_path
+            model.field_names = [('Hid', 'ID'), ('Street', 'Street'), 
+                                 ('HYear', 'Year'), ('DistCode', 'RD')]
+            model.delimiter = '|'
+            model.quote_char = '"'
+            model.bulk_load = True
+            model.encoding = encoding
+            model.load_csv(sqlite_db, 'Htb', False)
+            results.append(sqlite_db.cur.execute('SELECT Street FROM Htb').fetchall())
+        os.remove(csv_path)
+
+        # The undecodable utf-8 byte is replaced
+        self.assertEqual(results, [[(u'k\xf6nig st',)], [(u'k\ufffdnig st',)]])
+
+    def test_load_csv_parallel(self):
+        csv_fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        os.write(csv_fd, 'ID|Street|Year|RD\n')
+        for i in range(500):
+            os.write(csv_fd, '%i|%i high st|1851|%i\n' % (i, i, i % 7))
+        os.close(csv_fd)
+
+        results = []
+        for workers in (1, 3):
+            sqlite_db = DB.dbSQLiteManager(':memory:')
+            schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+            with open(schema, 'r') as f:
+                sqlite_db.cur.executescript(f.read())
+
+            model = m_load.CsvData()
+            model.csv_filename = csv_path
+            model.field_names = [('Hid', 'ID'), ('Street', 'Street'), 
+                                 ('HYear', 'Year'), ('DistCode', 'RD')]
+            model.delimiter = '|'
+            model.quote_char = '"'
+            model.bulk_load = True
+            model.workers = workers
+            model.chunk_size = 512
+            model.load_csv(sqlite_db, 'Htb', False)
+            results.append(sqlite_db.cur.execute('SELECT * FROM Htb').fetchall())
+        os.remove(csv_path)
+
+        self.assertEqual(len(results[0]), 499)
+        self.assertEqual(results[0], results[1])
+
+    def test_load_csv_resume(self):
+        csv_fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        os.write(csv_fd, 'ID|Street|Year|RD\n')
+        for i in range(500):
+            os.write(csv_fd, '%i|%i high st|1851|%i\n' % (i, i, i % 7))
+        os.close(csv_fd)
+
+        class InterruptedCsvData(m_load.CsvData):
+            def serial_rows(self, table_name, start_offset):
+                rows = m_load.CsvData.serial_rows(self, table_name, start_offset)
+                for i, row in enumerate(rows):
+                    if i == 250:
+                        raise KeyboardInterrupt
+                    yield row
+
+        results = []
+        for interrupt in (False, True):
+            sqlite_db = DB.dbSQLiteManager(':memory:')
+            sqlite_db.init_checkpoint_tbl()
+            schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+            with open(schema, 'r') as f:
+                sqlite_db.cur.executescript(f.read())
+
+            for model in ([InterruptedCsvData()] if interrupt else []) + [m_load.CsvData()]:
+                model.csv_filename = csv_path
+                model.field_names = [('Hid', 'ID'), ('Street', 'Street'), 
+                                     ('HYear', 'Year'), ('DistCode', 'RD')]
+                model.delimiter = '|'
+                model.quote_char = '"'
+                model.bulk_load = True
+                model.batch_size = 100
+                model.resume = True
+                try:
+                    model.load_csv(sqlite_db, 'Htb', False)
+                except KeyboardInterrupt:
+                    sqlite_db.conn.rollback()
+                    self.assertEqual(sqlite_db.cur.execute('SELECT COUNT(*) FROM Htb').fetchone()[0], 
+                                     200)
+            results.append(sqlite_db.cur.execute('SELECT * FROM Htb').fetchall())
+            self.assertEqual(sqlite_db.cur.execute('SELECT RowNum, Done FROM LoadCheckpoint').fetchall(),
+                             [(499, 1)])
+        os.remove(csv_path)
+
+        self.assertEqual(results[0], results[1])
+
+    def test_load_csv_incremental(self):
+        csv_fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        os.close(csv_fd)
+
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        sqlite_db.init_incremental_tbls()
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+
+        changes = []
+        for rows in (['11|high st|1|2', '12|low st|3|4', '13|mill rd|5|6'],
+                     ['11|high st|1|2', '12|low st|3|4', '13|mill rd|5|6'],
+                     ['11|high street|1|2', '13|mill rd|5|6', '14|new rd|7|8']):
+            with open(csv_path, 'wb') as f:
+                f.write('UDPRN|Street|GridRefEasting|GridRefNorthing\n')
+                f.write('10|first row|0|0\n')
+                f.write('\n'.join(rows) + '\n')
+            with open(schema, 'r') as f:
+                sqlite_db.cur.executescript(f.read())
+
+            model = m_load.CsvData()
+            model.csv_filename = csv_path
+            model.field_names = [('Cid', 'UDPRN'), ('Street', 'Street'), 
+                                 ('GREasting', 'GridRefEasting'), 
+                                 ('GRNorthing', 'GridRefNorthing')]
+            model.delimiter = '|'
+            model.quote_char = '"'
+            model.incremental = True
+            model.load_csv(sqlite_db, 'Ctb', False)
+            changes.append((model.rows_inserted, model.rows_updated, model.rows_deleted))
+        os.remove(csv_path)
+
+        result = sqlite_db.cur.execute('SELECT Id, Cid, Street, GREasting \
+                                        FROM Ctb').fetchall()
+        gold = [(1, 11, u'high street', 1.0),
+                (3, 13, u'mill rd', 5.0),
+                (4, 14, u'new rd', 7.0)]
+        self.assertEqual(changes, [(3, 0, 0), (0, 0, 0), (1, 1, 1)])
+        self.assertEqual(result, gold)
+
+    def test_load_csv_incremental_mapping(self):
+        csv_fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        os.close(csv_fd)
+        with open(csv_path, 'wb') as f:
+            f.write('Street|Name|UDPRN|GridRefEasting|GridRefNorthing\n')
+            f.write('first row|a|10|0|0\n')
+            f.write('high st|b|11|1|2\n')
+            f.write('low st|c|12|3|4\n')
+
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        sqlite_db.init_incremental_tbls()
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+
+        changes = []
+        results = []
+        # Cid is not the first mapped field
+        for field_names in ([('Street', 'Street'), ('Cid', 'UDPRN'), 
+                             ('GREasting', 'GridRefEasting'), 
+                             ('GRNorthing', 'GridRefNorthing')],
+                            [('Street', 'Name'), ('Cid', 'UDPRN'), 
+                             ('GREasting', 'GridRefEasting'), 
+                             ('GRNorthing', 'GridRefNorthing')]):
+            with open(schema, 'r') as f:
+                sqlite_db.cur.executescript(f.read())
+            model = m_load.CsvData()
+            model.csv_filename = csv_path
+            model.field_names = field_names
+            model.delimiter = '|'
+            model.quote_char = '"'
+            model.incremental = True
+            model.load_csv(sqlite_db, 'Ctb', False)
+            changes.append((model.rows_inserted, model.rows_updated, model.rows_deleted))
+            results.append(sqlite_db.cur.execute('SELECT Street, GREasting \
+                                                  FROM Ctb ORDER BY Id').fetchall())
+        os.remove(csv_path)
+
+        # The remapped Street field updates the rows of the unchanged csv file
+        self.assertEqual(changes, [(2, 0, 0), (0, 2, 0)])
+        self.assertEqual(results, [[(u'high st', 1.0), (u'low st', 3.0)],
+                                   [(u'b', 1.0), (u'c', 3.0)]])
+
+    def test_load_csv_compressed(self):
+        lines = ['ID|Street|Year|RD\n']
+        for i in range(3000):
+            lines.append('%i|%i high st|1851|%i\n' % (i, i, i % 7))
+        content = ''.join(lines)
+
+        csv_fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        os.write(csv_fd, content)
+        os.close(csv_fd)
+        gz_fd, gz_path = tempfile.mkstemp(suffix='.gz')
+        os.close(gz_fd)
+        for part in (content[:10000], content[10000:]): # Concatenated gzip streams
+            with gzip.open(gz_path, 'ab') as f:
+                f.write(part)
+        bz2_fd, bz2_path = tempfile.mkstemp(suffix='.dat')
+        os.write(bz2_fd, bz2.compress(content))
+        os.close(bz2_fd)
+
+        self.assertEqual(m_load.csv_compression(csv_path), None)
+        self.assertEqual(m_load.csv_compression(gz_path), 'gz')
+        self.assertEqual(m_load.csv_compression(bz2_path), 'bz2')
+
+        results = []
+        for path in (csv_path, gz_path, bz2_path):
+            stream = m_load.CsvStream(path)
+            stream.seek(20000)
+            self.assertEqual(stream.readline(), content[20000:content.index('\n', 20000) + 1])
+            stream.seek(5)
+            self.assertEqual(stream.readline(), content[5:content.index('\n') + 1])
+            stream.close()
+
+            sqlite_db = DB.dbSQLiteManager(':memory:')
+            schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+            with open(schema, 'r') as f:
+                sqlite_db.cur.executescript(f.read())
+
+            model = m_load.CsvData()
+            model.csv_filename = path
+            model.field_names = [('Hid', 'ID'), ('Street', 'Street'), 
+                                 ('HYear', 'Year'), ('DistCode', 'RD')]
+            model.delimiter = '|'
+            model.quote_char = '"'
+            model.bulk_load = True
+            model.workers = 2
+            model.load_csv(sqlite_db, 'Htb', False)
+            results.append(sqlite_db.cur.execute('SELECT * FROM Htb').fetchall())
+            os.remove(path)
+
+        self.assertEqual(len(results[0]), 2999)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+
+    def test_load_csv_clean(self):
+        csv_fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        os.write(csv_fd, 'ID|Name|Street|Year|RD\n'
+                         '0|first row|Street|1851|1\n'
+                         '1|Ann  Smith|12 High St.|1851|685\n'
+                         '2|J. Brown| 4a  Mill-Lane 7 |1861|685\n'
+                         '3|Who?|Back o\' the Hill|1861|686\n'
+                         '4||| 1861 |686\n')
+        os.close(csv_fd)
+
+        field_names = [('Hid', 'ID'), ('Name', 'Name'), ('Street', 'Street'), 
+                       ('HYear', 'Year'), ('DistCode', 'RD')]
+        clean_fields = ['Name', 'Street', 'HYear']
+
+        results = []
+        for clean_on_load in (False, True):
+            sqlite_db = DB.dbSQLiteManager(':memory:')
+            schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+            with open(schema, 'r') as f:
+                sqlite_db.cur.executescript(f.read())
+
+            model = m_load.CsvData()
+            model.csv_filename = csv_path
+            model.field_names = field_names
+            model.delimiter = '|'
+            model.quote_char = '"'
+            model.bulk_load = True
+            if clean_on_load:
+                model.clean_rules = (tuple(clean_fields), True, True, True, True)
+            model.load_csv(sqlite_db, 'Htb', False)
+
+            if not clean_on_load:
+                # Cleaning stage of the main script
+                clean = m_clean.Clean()
+                for fld in clean_fields:
+                    clean.clean_field(sqlite_db, 'Htb', fld, True, True, True)
+                    clean.remove_address_numbers(sqlite_db, 'Htb', fld)
+                clean.remove_address_numbers(sqlite_db, 'Htb', 'Street')
+            results.append(sqlite_db.cur.execute('SELECT * FROM Htb').fetchall())
+        os.remove(csv_path)
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[1][0][2:5], (u'ann smith', u'1851', u'high st'))
+        self.assertEqual(results[1][2][2:5], (u'who?', u'1861', u'back o the hill'))
+
 if __name__ == '__main__':
     unittest.main()
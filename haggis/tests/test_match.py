@@ -1,8 +1,203 @@
-﻿import unittest
+﻿import os
+import tempfile
+import unittest
+
+from db import dbTools as DB
+from app_models import m_clean, m_match, m_tokenise
 
 class Test_match(unittest.TestCase):
     def test_A(self):
         self.fail("Not implemented")
 
+    def test_matching_distance_token_ids(self):
+        model = m_match.Match()
+        vocabulary = m_tokenise.TokenVocabulary()
+        pairs = [([u'mill', u'lane'], [u'mill', u'lane']),
+                 ([u'high', u'stret'], [u'high', u'street', u'glasgow']),
+                 ([u'rose', u'street'], [u'mill', u'lane']),
+                 ([u'kings', u'road'], [u'kings'])]
+
+        for tokens_a, tokens_b in pairs:
+            for string_type in (0, 4):
+                self.assertEqual(model.matching_distance(vocabulary.encode(tokens_a),
+                                                         vocabulary.encode(tokens_b),
+                                                         string_type,
+                                                         vocabulary),
+                                 model.matching_distance(tokens_a,
+                                                         tokens_b,
+                                                         string_type))
+
+    def test_build_freq_tables_token_tables(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Ctb (Cid, Name, Street, Locality, Town) \
+                                   VALUES (?,?,?,?,?)',
+                                  [(1, u'mill house', u'mill lane', u'govan', u'glasgow'),
+                                   (2, u'', u'high street', None, u'glasgow')])
+        sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Street) VALUES (?,?)',
+                                  [(1, u'high st high'),
+                                   (2, u'mill lane')])
+
+        model = m_match.Match()
+        results = []
+        for token_tables in (False, True):
+            if token_tables:
+                m_tokenise.Tokenise().refresh_token_table(sqlite_db, 'Ctb')
+                m_tokenise.Tokenise().refresh_token_table(sqlite_db, 'Htb')
+            model.build_freq_tables(sqlite_db, True, 100, 100, False, token_tables)
+            results.append((sorted(sqlite_db.cur.execute('SELECT * FROM CtbFreq').fetchall()),
+                            sorted(sqlite_db.cur.execute('SELECT * FROM HtbFreq').fetchall())))
+
+        self.assertIn((u'mill', 2), results[0][0])
+        self.assertIn((u'high', 2), results[0][1])
+        self.assertEqual(results[0], results[1])
+
+    def test_build_freq_tables_atb(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Atb (Alias, Name, Freq) VALUES (?,?,?)',
+                                  [(u'st', u'saint', 2),
+                                   (u'st', u'street', 1),
+                                   (u'rd', u'road', 1)])
+        sqlite_db.cur.executemany('INSERT INTO Ctb (Cid, Street) VALUES (?,?)',
+                                  [(1, u'high street'),
+                                   (2, u'mill street'),
+                                   (3, u"st mary's street")])
+        sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Street) VALUES (?,?)',
+                                  [(1, u"st mary's st")])
+        resolver = m_tokenise.alias_resolver(sqlite_db)
+        self.assertEqual(resolver.resolve(u'st'), u'saint')
+
+        model = m_match.Match()
+        model.build_freq_tables(sqlite_db, True, 100, 100, True)
+
+        result = sqlite_db.cur.execute('SELECT Name, Freq FROM Atb ORDER BY Id').fetchall()
+        self.assertEqual(result, [(u'saint', 2), (u'street', 3), (u'road', 1)])
+        self.assertEqual(resolver.resolve(u'st'), u'street')
+        result = sqlite_db.cur.execute("SELECT Freq FROM HtbFreq WHERE Token = ?", 
+                                       (u"mary's",)).fetchall()
+        self.assertEqual(result, [(1,)])
+
+    def test_ctb_fts_index(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Ctb (Cid, Name, Street, Locality, Town) \
+                                   VALUES (?,?,?,?,?)',
+                                  [(1, u'mill house', u'mill lane', u'govan', u'glasgow'),
+                                   (2, None, u"st mary's street", None, u'glasgow')])
+
+        model = m_match.Match()
+        self.assertTrue(model.ctb_fts_index(sqlite_db))
+        self.assertFalse(model.ctb_fts_index(sqlite_db))
+        result = sqlite_db.cur.execute("SELECT docid FROM CtbFts WHERE Street MATCH ?", 
+                                       (u'lane OR mary',)).fetchall()
+        self.assertEqual(sorted(result), [(1,), (2,)])
+
+        # The index is rebuilt when the Ctb rows change
+        sqlite_db.cur.execute("UPDATE Ctb SET Street = 'high street' WHERE Id = 1")
+        self.assertTrue(model.ctb_fts_index(sqlite_db))
+        result = sqlite_db.cur.execute("SELECT docid FROM CtbFts WHERE Street MATCH ?", 
+                                       (u'lane',)).fetchall()
+        self.assertEqual(result, [])
+
+    def test_ctb_token_store(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Ctb (Cid, Name, Street, Locality, Town) \
+                                   VALUES (?,?,?,?,?)',
+                                  [(1, u'mill house', u'mill lane', u'govan', u'glasgow'),
+                                   (2, None, u'high street', None, u'glasgow'),
+                                   (3, None, None, None, None)])
+
+        model = m_match.Match()
+        vocabulary = m_tokenise.TokenVocabulary()
+        for locality_town in (False, True):
+            store = model.ctb_token_store(sqlite_db, vocabulary, locality_town)
+            for ctb_id in (1, 2, 3):
+                tokens = m_tokenise.Tokenise().tokenise_address(sqlite_db, 'Ctb', ctb_id, 
+                                                                True, False, True, 
+                                                                locality_town, locality_town,
+                                                                False)
+                self.assertEqual(store.tokens(ctb_id), tokens)
+
+    def test_matching_tokens_workers(self):
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        streets = [u'mill lane', u'high street', u'rose street', u'high stret', u'nowhere']
+
+        results = []
+        for workers in (1, 3):
+            db_fd, db_path = tempfile.mkstemp(suffix='.db')
+            os.close(db_fd)
+            sqlite_db = DB.dbSQLiteManager(db_path)
+            with open(schema, 'r') as f:
+                sqlite_db.cur.executescript(f.read())
+            sqlite_db.cur.executemany('INSERT INTO Ctb (Cid, Name, Street, Locality, Town, \
+                                       CPCode, DistCode) VALUES (?,?,?,?,?,?,?)',
+                                      [(1, u'mill house', u'mill lane', u'govan', u'glasgow', 
+                                        u'g1', u'1'),
+                                       (2, u'a', u'high street', u'x', u'y', u'g2', u'1'),
+                                       (3, u'b', u'rose street', u'x', u'y', u'g2', u'2')])
+            sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Name, Street, HYear, DistCode) \
+                                       VALUES (?,?,?,?,?)',
+                                      [(i, u'x', streets[i % 5], '1851', u'%i' % (i % 7)) 
+                                       for i in range(60)])
+            m_clean.Clean().remove_street_duplicates(sqlite_db, 'Htb', ['Street', 'DistCode'])
+            sqlite_db.conn.commit()
+
+            model = m_match.Match()
+            model.matching_tokens(sqlite_db, 0, 4, 0.3, False, True, True, 100, 100, 
+                                  False, False, workers, 4)
+            results.append((sqlite_db.cur.execute('SELECT * FROM Ttb').fetchall(),
+                            sqlite_db.cur.execute('SELECT * FROM Stb').fetchall()))
+            sqlite_db.close_db()
+            os.remove(db_path)
+
+        self.assertEqual(len(results[0][0]), 35)
+        self.assertEqual(results[0], results[1])
+
+    def test_blocking_index(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Ctb (Cid, Street, CPCode, DistCode) \
+                                   VALUES (?,?,?,?)',
+                                  [(1, u'high street', u'G1 1AA', u'1'),
+                                   (2, u'high street', u'g1 2BB', u'2'),
+                                   (3, u'high street', u'G2 1AA', u'1'),
+                                   (4, u'high street', None, u'1')])
+
+        model = m_match.Match()
+        blocks = model.ctb_blocking_index(sqlite_db, ['DistCode', 'PCode'])
+        self.assertEqual(blocks.htb_fields(), ['DistCode', 'HPCode'])
+        ctb_ids = [(1,), (2,), (3,), (4,)]
+        self.assertEqual(blocks.filter(ctb_ids, (u'1', u'G1 3CC')), [(1,)])
+        self.assertEqual(blocks.filter(ctb_ids, (u'1', None)), [(1,), (3,), (4,)])
+        self.assertEqual(blocks.filter(ctb_ids, (None, u'g1')), [(1,), (2,)])
+        self.assertEqual(blocks.filter(ctb_ids, (None, None)), ctb_ids)
+        self.assertEqual(blocks.filter(ctb_ids, (u'3', None)), [])
+        self.assertRaises(ValueError, m_match.BlockingIndex, ['Street'])
+
+    def test_trigram_index(self):
+        index = m_match.TrigramIndex([u'glasgow', u'street', u'strand', u'mill', u'lane'], 1)
+        self.assertEqual(index.nearest(u'glasgw'), [u'glasgow'])
+        self.assertEqual(index.nearest(u'stret'), [u'street'])
+        self.assertEqual(index.nearest(u'millz'), [u'mill'])
+        # Vocabulary, distant and short tokens are not expanded
+        self.assertEqual(index.nearest(u'street'), [])
+        self.assertEqual(index.nearest(u'edinburgh'), [])
+        self.assertEqual(index.nearest(u'la'), [])
+
+        index = m_match.TrigramIndex([u'glasgow', u'street'], 2)
+        self.assertEqual(index.nearest(u'glsgw'), [u'glasgow'])
+
 if __name__ == '__main__':
     unittest.main()
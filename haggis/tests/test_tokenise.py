@@ -1,8 +1,107 @@
-﻿import unittest
+﻿import os
+import unittest
+
+from db import dbTools as DB
+from app_models import m_tokenise
 
 class Test_tokenise(unittest.TestCase):
     def test_A(self):
         self.fail("Not implemented")
 
+    def test_tokenise_table(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Ctb (Cid, Name, Street, Locality, Town) \
+                                   VALUES (?,?,?,?,?)',
+                                  [(1, u'mill house', u'mill lane', u'govan', u'glasgow'),
+                                   (2, u'', u'high st', None, u'glasgow'),
+                                   (3, None, None, None, None),
+                                   (4, u'rose cottage', u'rose st', u'govan', u'')])
+
+        model = m_tokenise.Tokenise()
+        result = list(model.tokenise_table(sqlite_db, 'Ctb', True, False, True, True, True,
+                                           False, batch_size=2))
+        self.assertEqual(result, [(1, [u'mill', u'house', u'lane', u'govan', u'glasgow']),
+                                  (2, [u'high', u'st', u'glasgow']),
+                                  (3, []),
+                                  (4, [u'rose', u'cottage', u'st', u'govan'])])
+
+        # The same tokens as the single row tokenisation
+        for _id, _tokens in result:
+            self.assertEqual(_tokens, m_tokenise.Tokenise().tokenise_address(
+                sqlite_db, 'Ctb', _id, True, False, True, True, True, False))
+
+        result = list(model.tokenise_table(sqlite_db, 'Ctb', False, False, True, False, False,
+                                           False, min_id=2, max_id=3))
+        self.assertEqual(result, [(2, [u'high', u'st']), (3, [])])
+
+    def test_tokenise_all(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Ctb (Cid, Street, Town) VALUES (?,?,?)',
+                                  [(1, u'high st', u'glasgow'),
+                                   (2, u'high st', u'port glasgow')])
+
+        model = m_tokenise.Tokenise()
+        result = model.tokenise_all(sqlite_db, 'Ctb', False, False, True, False, True, False)
+        self.assertEqual(result, [u'high', u'st', u'glasgow', 
+                                  u'high', u'st', u'port', u'glasgow'])
+
+    def test_token_store(self):
+        vocabulary = m_tokenise.TokenVocabulary()
+        self.assertEqual(list(vocabulary.encode([u'high', u'st', u'high'])), [0, 1, 0])
+
+        store = m_tokenise.TokenStore(vocabulary)
+        store.add(3, [u'mill', u'lane'])
+        store.add(7, [])
+        store.add(9, [u'high', u'street'])
+        self.assertRaises(ValueError, store.add, 8, [u'x'])
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(len(vocabulary), 5)
+        self.assertEqual(list(store[3]), [2, 3])
+        self.assertEqual(store.tokens(9), [u'high', u'street'])
+        self.assertEqual(store.tokens(7), [])
+        self.assertIn(7, store)
+        self.assertNotIn(4, store)
+        self.assertRaises(KeyError, store.__getitem__, 10)
+
+    def test_refresh_token_table(self):
+        sqlite_db = DB.dbSQLiteManager(':memory:')
+        schema = os.path.join(os.path.dirname(__file__), '..', 'db', 'hag_schema.sql')
+        with open(schema, 'r') as f:
+            sqlite_db.cur.executescript(f.read())
+        sqlite_db.cur.executemany('INSERT INTO Htb (Hid, Name, Street, Town) VALUES (?,?,?,?)',
+                                  [(1, u'mill house', u'mill lane', u'govan'),
+                                   (2, None, u'high st high', None),
+                                   (3, u'', u'rose st', None)])
+
+        model = m_tokenise.Tokenise()
+        self.assertEqual(model.refresh_token_table(sqlite_db, 'Htb', 2), (3, 3, 0))
+        result = sqlite_db.cur.execute('SELECT Field, Position, Token FROM HtbTokens \
+                                        WHERE RecordId = 2 ORDER BY Position').fetchall()
+        self.assertEqual(result, [(u'Street', 0, u'high'), 
+                                  (u'Street', 1, u'st'), 
+                                  (u'Street', 2, u'high')])
+
+        # Only the changed rows are tokenised again
+        sqlite_db.cur.execute("UPDATE Htb SET Street = 'high street' WHERE Id = 2")
+        sqlite_db.cur.execute("DELETE FROM Htb WHERE Id = 3")
+        self.assertEqual(model.refresh_token_table(sqlite_db, 'Htb', 2), (2, 1, 1))
+        result = sqlite_db.cur.execute('SELECT RecordId, Field, Token FROM HtbTokens \
+                                        ORDER BY RecordId, Field, Position').fetchall()
+        self.assertEqual(result, [(1, u'Name', u'mill'), 
+                                  (1, u'Name', u'house'), 
+                                  (1, u'Street', u'mill'), 
+                                  (1, u'Street', u'lane'), 
+                                  (1, u'Town', u'govan'), 
+                                  (2, u'Street', u'high'), 
+                                  (2, u'Street', u'street')])
+        self.assertEqual(model.refresh_token_table(sqlite_db, 'Htb'), (2, 0, 0))
+
 if __name__ == '__main__':
     unittest.main()